@@ -0,0 +1,48 @@
+from django.db import router
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.settings import api_settings
+
+from .models import User
+from .tokens import NO_VERSION, TOKEN_VERSION_CLAIM, current_token_version
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication that builds request.user from the token's claims.
+
+    The user has id, role, supervisor_id, is_active_worker and token_version
+    set; other fields are deferred and loaded on first access. Tokens without
+    claims (issued before they were added) still load the user.
+    """
+
+    def get_user(self, validated_token):
+        if TOKEN_VERSION_CLAIM not in validated_token:
+            return super().get_user(validated_token)
+
+        user_id = validated_token[api_settings.USER_ID_CLAIM]
+        version = current_token_version(user_id)
+        if version == NO_VERSION:
+            raise AuthenticationFailed(_("User not found or inactive"), code="user_inactive")
+        if validated_token[TOKEN_VERSION_CLAIM] != version:
+            raise AuthenticationFailed(_("Token is outdated, refresh it"), code="token_not_valid")
+
+        values = {
+            'id': user_id,
+            'role': validated_token['role'],
+            'supervisor_id': validated_token['supervisor_id'],
+            'is_active_worker': validated_token['is_active_worker'],
+            'is_active': True,
+            'token_version': version,
+        }
+        fields = [field.attname for field in User._meta.concrete_fields if field.attname in values]
+        return User.from_db(router.db_for_read(User), fields, [values[field] for field in fields])
+
+
+def load_user(user):
+    """Load the fields a claims user left deferred, in one query"""
+    deferred = user.get_deferred_fields()
+    if deferred:
+        user.refresh_from_db(fields=deferred)
+    return user
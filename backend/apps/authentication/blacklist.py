@@ -0,0 +1,228 @@
+"""
+Refresh token blacklist.
+
+simplejwt looks every refreshed token up in the blacklist table and writes an
+OutstandingToken and a BlacklistedToken row for each rotation. Here:
+
+- a token blacklisted in the last refresh lifetime is found through a key in
+  the shared cache, set when it is blacklisted;
+- older ones are found through a per-process Bloom filter of the blacklisted
+  jtis, rebuilt every TOKEN_BLACKLIST_BLOOM_REFRESH seconds, so only the rare
+  possible hits are looked up in the database;
+- the rows are written in bulk by a background thread every
+  TOKEN_BLACKLIST_FLUSH_INTERVAL seconds (0 writes them right away).
+
+All of this needs a cache shared by the worker processes. With a
+process-local one (LocMemCache, the default) another worker would neither
+find the key nor have the token in its filter until the next rebuild, so the
+rows are written right away and every token not found in the cache is looked
+up in the database, like simplejwt does.
+
+The purge_expired_tokens command deletes the rows of expired tokens.
+"""
+import atexit
+import hashlib
+import logging
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connections
+from django.utils import timezone
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.utils import datetime_from_epoch
+
+logger = logging.getLogger(__name__)
+
+BLACKLISTED_KEY = 'auth:blacklisted:{jti}'
+# Cache backends that other processes cannot see
+PROCESS_LOCAL_CACHES = {
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+}
+
+
+def cache_is_shared():
+    return settings.CACHES['default']['BACKEND'] not in PROCESS_LOCAL_CACHES
+
+
+class BloomFilter:
+    """Set membership with false positives (about error_rate) but no false negatives"""
+
+    def __init__(self, capacity, error_rate=0.01):
+        capacity = max(capacity, 1000)
+        self.size = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key):
+        # Double hashing: k positions out of one 128 bit digest
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1, h2 = int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, key):
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+
+def write_rows(rows):
+    """Blacklist (jti, token, user_id, created_at, expires_at) rows with four queries"""
+    # Users deleted since the refresh are left out, like on_delete=SET_NULL would
+    users = set(get_user_model().objects.filter(pk__in={row[2] for row in rows}).values_list('pk', flat=True))
+    OutstandingToken.objects.bulk_create([
+        OutstandingToken(
+            jti=jti, token=token, user_id=user_id if user_id in users else None,
+            created_at=created_at, expires_at=expires_at,
+        )
+        for jti, token, user_id, created_at, expires_at in rows
+    ], ignore_conflicts=True)
+    ids = OutstandingToken.objects.filter(jti__in=[row[0] for row in rows]).values_list('id', flat=True)
+    BlacklistedToken.objects.bulk_create([BlacklistedToken(token_id=pk) for pk in ids], ignore_conflicts=True)
+    return len(rows)
+
+
+class TokenBlacklist:
+    def __init__(self, flush_interval, batch_size, bloom_refresh, error_rate, shared_cache=True):
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.bloom_refresh = bloom_refresh
+        self.error_rate = error_rate
+        self.shared_cache = shared_cache
+        self._lock = threading.Lock()
+        self._bloom_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = False
+        self._pending = []
+        self._bloom = None
+        self._bloom_built = 0
+        self._thread = None
+        if flush_interval > 0:
+            self._thread = threading.Thread(target=self._run, name='token-blacklist-writer', daemon=True)
+            self._thread.start()
+
+    def rebuild_bloom(self):
+        """Rebuild the filter from the blacklisted tokens that have not expired"""
+        with self._bloom_lock:
+            started = time.monotonic()
+            jtis = BlacklistedToken.objects.filter(token__expires_at__gt=timezone.now())
+            # Room for the tokens blacklisted until the next rebuild
+            bloom = BloomFilter(int(jtis.count() * 1.5), self.error_rate)
+            for jti in jtis.values_list('token__jti', flat=True).iterator(chunk_size=10000):
+                bloom.add(jti)
+            with self._lock:
+                # Tokens blacklisted meanwhile are in the cache but may not be in the database yet
+                for row in self._pending:
+                    bloom.add(row[0])
+            self._bloom, self._bloom_built = bloom, started
+
+    def bloom(self):
+        stale = time.monotonic() - self._bloom_built > self.bloom_refresh
+        if self._bloom is None or (stale and self._thread is None):
+            self.rebuild_bloom()
+        return self._bloom
+
+    def is_blacklisted(self, jti):
+        if cache.get(BLACKLISTED_KEY.format(jti=jti)):
+            return True
+        # Without a shared cache, tokens other processes blacklisted since the
+        # last rebuild are only in the database
+        if self.shared_cache and jti not in self.bloom():
+            return False
+        return BlacklistedToken.objects.filter(token__jti=jti).exists()
+
+    def add(self, token):
+        jti, exp = token[api_settings.JTI_CLAIM], token['exp']
+        expires_at = datetime_from_epoch(exp)
+        remaining = max(1, int(exp - time.time()))
+        cache.set(BLACKLISTED_KEY.format(jti=jti), True, remaining)
+        if self._bloom is not None:
+            self._bloom.add(jti)
+        row = (
+            jti, str(token), token.get(api_settings.USER_ID_CLAIM),
+            datetime_from_epoch(token['iat']) if 'iat' in token else None, expires_at,
+        )
+        if self._thread is None:
+            write_rows([row])
+            return
+        with self._lock:
+            self._pending.append(row)
+            full = len(self._pending) >= self.batch_size
+        if full:
+            self._wake.set()
+
+    def flush(self):
+        with self._lock:
+            rows, self._pending = self._pending, []
+        if not rows:
+            return 0
+        try:
+            return write_rows(rows)
+        except Exception:
+            logger.exception("Could not write %d blacklisted tokens, retrying", len(rows))
+            with self._lock:
+                self._pending[:0] = rows
+            return 0
+
+    def _run(self):
+        while not self._stopped:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+                if self._bloom is not None and time.monotonic() - self._bloom_built > self.bloom_refresh:
+                    self.rebuild_bloom()
+            except Exception:
+                logger.exception("Token blacklist maintenance failed")
+            finally:
+                connections.close_all()
+
+    def close(self):
+        self._stopped = True
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.flush()
+
+
+_blacklist = None
+_blacklist_lock = threading.Lock()
+
+
+def get_blacklist():
+    global _blacklist
+    with _blacklist_lock:
+        if _blacklist is None:
+            shared_cache = cache_is_shared()
+            flush_interval = settings.TOKEN_BLACKLIST_FLUSH_INTERVAL
+            if flush_interval > 0 and not shared_cache:
+                logger.warning(
+                    "The cache is not shared between processes, blacklisted tokens are "
+                    "written right away and looked up in the database"
+                )
+                flush_interval = 0
+            _blacklist = TokenBlacklist(
+                flush_interval,
+                settings.TOKEN_BLACKLIST_BATCH_SIZE,
+                settings.TOKEN_BLACKLIST_BLOOM_REFRESH,
+                settings.TOKEN_BLACKLIST_BLOOM_ERROR_RATE,
+                shared_cache,
+            )
+        return _blacklist
+
+
+@atexit.register
+def close_blacklist():
+    """Write the pending blacklist rows and stop the writer thread"""
+    global _blacklist
+    with _blacklist_lock:
+        blacklist, _blacklist = _blacklist, None
+    if blacklist is not None:
+        blacklist.close()
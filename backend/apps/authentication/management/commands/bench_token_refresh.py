@@ -0,0 +1,125 @@
+import json
+import math
+import time
+import uuid
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.utils import timezone
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from apps.authentication.blacklist import close_blacklist, get_blacklist
+from apps.authentication.models import User
+from apps.authentication.serializer import ClaimsTokenRefreshSerializer
+from apps.authentication.tokens import ClaimsRefreshToken
+
+# name: (serializer, token class) of each refresh implementation compared
+PIPELINES = {
+    'simplejwt': (TokenRefreshSerializer, RefreshToken),
+    'claims': (ClaimsTokenRefreshSerializer, ClaimsRefreshToken),
+}
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure token refresh throughput of the stock simplejwt serializer and ours "
+        "as the token_blacklist tables grow, on a throwaway test database"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='0,100000', help="Comma separated blacklisted token counts")
+        parser.add_argument('--refreshes', type=int, default=500, help="Chained refreshes per pipeline and size")
+        parser.add_argument('--output', default='bench_token_refresh.json', help="Where to write the JSON results")
+        parser.add_argument('--keepdb', action='store_true', help="Keep the test database between runs")
+
+    def handle(self, *args, **options):
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=options['keepdb'])
+        results = []
+        try:
+            user, _ = User.objects.get_or_create(username='bench-refresh', defaults={'role': 'CHW'})
+            for size in [int(size) for size in options['sizes'].split(',')]:
+                self.fill(size)
+                for name, (serializer_class, token_class) in PIPELINES.items():
+                    result = self.run(name, serializer_class, token_class, user, options['refreshes'])
+                    result['blacklisted'] = size
+                    results.append(result)
+                    self.stdout.write(
+                        f"{size:>9} {name:<10} {result['per_second']:>7.0f} refreshes/s "
+                        f"p50={result['p50_ms']:.2f}ms p95={result['p95_ms']:.2f}ms "
+                        f"queries={result['queries_per_refresh']:.1f} setup={result['setup_ms']:.0f}ms"
+                    )
+        finally:
+            close_blacklist()
+            connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=options['keepdb'])
+
+        with open(options['output'], 'w') as fh:
+            json.dump({'vendor': connection.vendor, 'results': results}, fh, indent=2)
+        self.stdout.write(self.style.SUCCESS(f"Wrote {len(results)} results to {options['output']}"))
+
+    def fill(self, size):
+        """Top the blacklist up to size unexpired tokens"""
+        missing = size - BlacklistedToken.objects.count()
+        if missing <= 0:
+            return
+        last_id = OutstandingToken.objects.order_by('-id').values_list('id', flat=True).first() or 0
+        now = timezone.now()
+        for start in range(0, missing, 10000):
+            OutstandingToken.objects.bulk_create([
+                OutstandingToken(jti=uuid.uuid4().hex, token='', created_at=now, expires_at=now + timedelta(days=1))
+                for _ in range(min(10000, missing - start))
+            ])
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {BlacklistedToken._meta.db_table} (token_id, blacklisted_at) "
+                f"SELECT id, %s FROM {OutstandingToken._meta.db_table} WHERE id > %s",
+                [now, last_id],
+            )
+
+    def run(self, name, serializer_class, token_class, user, refreshes):
+        cache.clear()
+        close_blacklist()
+        token = str(token_class.for_user(user))
+        # The Bloom filter is built once per process and then in the background
+        setup_started = time.perf_counter()
+        if token_class is ClaimsRefreshToken:
+            get_blacklist().rebuild_bloom()
+        setup = time.perf_counter() - setup_started
+
+        queries = []
+
+        def count(execute, sql, params, many, context):
+            queries.append(sql)
+            return execute(sql, params, many, context)
+
+        samples = []
+        started = time.perf_counter()
+        with connection.execute_wrapper(count):
+            for _ in range(refreshes):
+                call_started = time.perf_counter()
+                serializer = serializer_class(data={'refresh': token})
+                serializer.is_valid(raise_exception=True)
+                token = serializer.validated_data['refresh']
+                samples.append(time.perf_counter() - call_started)
+            # Batched blacklist writes count towards the run
+            close_blacklist()
+        elapsed = time.perf_counter() - started
+        return {
+            'pipeline': name,
+            'refreshes': refreshes,
+            'per_second': refreshes / elapsed,
+            'p50_ms': percentile(samples, 50) * 1000,
+            'p95_ms': percentile(samples, 95) * 1000,
+            # Queries in the refreshing thread, not those of the blacklist writer thread
+            'queries_per_refresh': len(queries) / refreshes,
+            'setup_ms': setup * 1000,
+        }
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete outstanding and blacklisted tokens that have expired, in batches. "
+        "Run it on a schedule (e.g. daily) to keep the token_blacklist tables small"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=10000, help="Tokens deleted per transaction")
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        purged = 0
+        while True:
+            # Tokens share one lifetime, so the oldest ids expire first and
+            # walking the primary key finds them without an expires_at index
+            ids = list(
+                OutstandingToken.objects.filter(expires_at__lt=now)
+                .order_by('id').values_list('id', flat=True)[:options['batch_size']]
+            )
+            if not ids:
+                break
+            with transaction.atomic():
+                blacklisted = BlacklistedToken.objects.filter(token_id__in=ids)
+                blacklisted._raw_delete(blacklisted.db)
+                outstanding = OutstandingToken.objects.filter(id__in=ids)
+                outstanding._raw_delete(outstanding.db)
+            purged += len(ids)
+        self.stdout.write(self.style.SUCCESS(f"Purged {purged} expired tokens"))
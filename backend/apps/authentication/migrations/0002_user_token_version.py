@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-17 19:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authentication', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='token_version',
+            field=models.PositiveIntegerField(default=0, help_text='Bumped when a field copied into tokens changes, which invalidates the tokens issued before'),
+        ),
+    ]
@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import AbstractUser
 
 # Create your models here.
@@ -13,9 +13,52 @@ class User(AbstractUser):
     location = models.CharField(max_length=255,blank=True)
     supervisor = models.ForeignKey('self', on_delete=models.SET_NULL, null=True, blank=True,related_name='supervised_workers',help_text="CHA who supervises this CHW")
     is_active_worker = models.BooleanField(default=True)
+    token_version = models.PositiveIntegerField(default=0, help_text="Bumped when a field copied into tokens changes, which invalidates the tokens issued before")
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    # Fields access tokens carry as claims; changing one bumps token_version.
+    # QuerySet.update() bypasses this.
+    TOKEN_CLAIM_FIELDS = ('role', 'supervisor_id', 'is_active_worker', 'is_active')
+
+    _loaded_claims = None
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_claims = {field: instance.__dict__.get(field) for field in cls.TOKEN_CLAIM_FIELDS}
+        return instance
+
+    def claims_changed(self):
+        if self._state.adding or self._loaded_claims is None:
+            return False
+        return any(
+            field in self.__dict__ and self.__dict__[field] != loaded
+            for field, loaded in self._loaded_claims.items()
+        )
+
+    def save(self, *args, **kwargs):
+        bump = self.claims_changed()
+        previous_supervisor_id = (self._loaded_claims or {}).get('supervisor_id')
+        reassigned = bump and self.__dict__.get('supervisor_id', previous_supervisor_id) != previous_supervisor_id
+        if bump:
+            self.token_version += 1
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'token_version'}
+        if reassigned:
+            # The CHW's requests move along with the change
+            with transaction.atomic():
+                super().save(*args, **kwargs)
+                from .signals import supervisor_changed
+                supervisor_changed.send(sender=User, user=self, previous_supervisor_id=previous_supervisor_id)
+        else:
+            super().save(*args, **kwargs)
+        self._loaded_claims = {field: self.__dict__.get(field) for field in self.TOKEN_CLAIM_FIELDS}
+        if bump:
+            from .tokens import publish_token_version
+            user_id, version = self.pk, self.token_version
+            transaction.on_commit(lambda: publish_token_version(user_id, version))
+
     def __str__(self):
         return f"{self.username} ({self.get_role_display()})"
     
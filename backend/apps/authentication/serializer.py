@@ -1,6 +1,10 @@
 from rest_framework import serializers
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
 from django.contrib.auth import authenticate
 from .models import User
+from .tokens import ClaimsRefreshToken
 
 class UserSerializer(serializers.ModelSerializer):
     supervisor_name = serializers.CharField(source='supervisor.get_full_name', read_only=True)
@@ -41,3 +45,24 @@ class ChangePasswordSerializer(serializers.Serializer):
         if attrs['new_password'] != attrs['confirm_password']:
             raise serializers.ValidationError("New passwords don't match.")
         return attrs
+
+class ClaimsTokenRefreshSerializer(TokenRefreshSerializer):
+    """Refresh that re-reads the user, so the new tokens carry current claims"""
+    token_class = ClaimsRefreshToken
+
+    def validate(self, attrs):
+        refresh = self.token_class(attrs['refresh'])
+        user = User.objects.filter(pk=refresh[api_settings.USER_ID_CLAIM]).first()
+        if user is None or not user.is_active:
+            raise AuthenticationFailed('User not found or inactive', code='user_inactive')
+        refresh.set_user_claims(user)
+
+        data = {'access': str(refresh.access_token)}
+        if api_settings.ROTATE_REFRESH_TOKENS:
+            if api_settings.BLACKLIST_AFTER_ROTATION:
+                refresh.blacklist()
+            refresh.set_jti()
+            refresh.set_exp()
+            refresh.set_iat()
+            data['refresh'] = str(refresh)
+        return data
@@ -0,0 +1,16 @@
+from django.db import transaction
+from django.db.models.signals import post_delete
+from django.dispatch import Signal, receiver
+
+from .models import User
+from .tokens import NO_VERSION, publish_token_version
+
+# Sent by User.save() when a saved user's supervisor changed, with user and
+# previous_supervisor_id, inside the saving transaction
+supervisor_changed = Signal()
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    user_id = instance.pk
+    transaction.on_commit(lambda: publish_token_version(user_id, NO_VERSION))
@@ -1,3 +1,166 @@
-from django.test import TestCase
+import shutil
+import tempfile
+from datetime import timedelta
+from io import StringIO
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from django.urls import reverse
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.tokens import AccessToken
+from rest_framework_simplejwt.utils import datetime_from_epoch
+
+from .authentication import ClaimsJWTAuthentication
+from .blacklist import BloomFilter, close_blacklist, get_blacklist, write_rows
+from .models import User
+from .tokens import ClaimsRefreshToken, token_versions
+
+
+@override_settings(TOKEN_BLACKLIST_FLUSH_INTERVAL=0)
+class ClaimsAuthenticationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.cha = User.objects.create_user('cha', password='pass12345', role='CHA', first_name='Ann')
+        cls.chw = User.objects.create_user('chw', password='pass12345', role='CHW', supervisor=cls.cha)
+
+    def setUp(self):
+        # Versions cached by other tests may belong to rolled back users
+        for clear in (cache.clear, token_versions.clear, close_blacklist):
+            clear()
+            self.addCleanup(clear)
+
+    def get(self, name, access):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {access}')
+        return client.get(reverse(name))
+
+    def test_user_built_from_claims(self):
+        access = ClaimsRefreshToken.for_user(self.chw).access_token
+        authentication = ClaimsJWTAuthentication()
+        authentication.get_user(authentication.get_validated_token(str(access)))
+        # Once the version is cached no query is needed at all
+        with self.assertNumQueries(0):
+            user = authentication.get_user(authentication.get_validated_token(str(access)))
+        self.assertEqual((user.pk, user.role, user.supervisor_id), (self.chw.pk, 'CHW', self.cha.pk))
+
+        # Other fields load on demand, and tokens without claims still work
+        profile = self.get('profile', access).data
+        self.assertEqual((profile['username'], profile['supervisor_name']), ('chw', 'Ann'))
+        self.assertEqual(self.get('profile', AccessToken.for_user(self.chw)).status_code, 200)
+
+    def test_claim_changes_invalidate_tokens(self):
+        refresh = ClaimsRefreshToken.for_user(self.chw)
+        self.assertEqual(self.get('profile', refresh.access_token).status_code, 200)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.chw.role = 'CHA'
+            self.chw.save()
+        self.assertEqual(self.get('profile', refresh.access_token).status_code, 401)
+
+        # A refresh picks up the new claims
+        response = APIClient().post(reverse('token_refresh'), {'refresh': str(refresh)})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(AccessToken(response.data['access'])['role'], 'CHA')
+        self.assertEqual(self.get('profile', response.data['access']).status_code, 200)
+
+        # Deactivated users can neither use nor refresh their tokens
+        with self.captureOnCommitCallbacks(execute=True):
+            self.chw.is_active = False
+            self.chw.save()
+        self.assertEqual(self.get('profile', response.data['access']).status_code, 401)
+        response = APIClient().post(reverse('token_refresh'), {'refresh': response.data['refresh']})
+        self.assertEqual(response.status_code, 401)
+
+    def test_other_changes_keep_tokens(self):
+        access = ClaimsRefreshToken.for_user(self.chw).access_token
+        self.chw.phone_number = '0700000000'
+        self.chw.save()
+        self.assertEqual(self.get('profile', access).status_code, 200)
+
+    def test_rotated_tokens_are_blacklisted(self):
+        # The cache key and the Bloom filter are only relied on with a cache the processes share
+        location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, location)
+        shared = {'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': location}}
+        with override_settings(CACHES=shared):
+            self.assertTrue(get_blacklist().shared_cache)
+            refresh = str(ClaimsRefreshToken.for_user(self.chw))
+            response = APIClient().post(reverse('token_refresh'), {'refresh': refresh})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(APIClient().post(reverse('token_refresh'), {'refresh': refresh}).status_code, 401)
+
+            # Still rejected by a process that has not seen it, through the Bloom filter
+            cache.clear()
+            close_blacklist()
+            self.assertEqual(APIClient().post(reverse('token_refresh'), {'refresh': refresh}).status_code, 401)
+            self.assertEqual(BlacklistedToken.objects.count(), 1)
+            close_blacklist()
+
+        OutstandingToken.objects.update(expires_at=timezone.now() - timedelta(minutes=1))
+        call_command('purge_expired_tokens', stdout=StringIO())
+        self.assertFalse(OutstandingToken.objects.exists())
+        self.assertFalse(BlacklistedToken.objects.exists())
+
+    def test_process_local_cache_looks_tokens_up(self):
+        with override_settings(TOKEN_BLACKLIST_FLUSH_INTERVAL=2):
+            with self.assertLogs('apps.authentication.blacklist', 'WARNING'):
+                blacklist = get_blacklist()
+        self.assertEqual((blacklist.shared_cache, blacklist.flush_interval), (False, 0))
+        blacklist.rebuild_bloom()
+
+        # Blacklisted by another process after the filter was built: only in the database
+        refresh = ClaimsRefreshToken.for_user(self.chw)
+        write_rows([(refresh['jti'], str(refresh), self.chw.pk, None, datetime_from_epoch(refresh['exp']))])
+        self.assertEqual(APIClient().post(reverse('token_refresh'), {'refresh': str(refresh)}).status_code, 401)
+
+    def test_bloom_filter(self):
+        bloom = BloomFilter(1000)
+        for i in range(1000):
+            bloom.add(f'in-{i}')
+        self.assertTrue(all(f'in-{i}' in bloom for i in range(1000)))
+        false_positives = sum(f'out-{i}' in bloom for i in range(10000))
+        self.assertLess(false_positives, 300)
+
+
+@override_settings(QUERY_BUDGET_MODE='raise', TOKEN_BLACKLIST_FLUSH_INTERVAL=0)
+class QueryBudgetTests(TestCase):
+    """Calls that go over their route's @query_budget fail here"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.cha = User.objects.create_user('cha', password='pass12345', role='CHA')
+        cls.chw = User.objects.create_user('chw', password='pass12345', role='CHW', supervisor=cls.cha)
+
+    def setUp(self):
+        for clear in (cache.clear, token_versions.clear, close_blacklist):
+            clear()
+            self.addCleanup(clear)
+
+    def client_for(self, user):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {ClaimsRefreshToken.for_user(user).access_token}')
+        return client
+
+    def test_login(self):
+        response = APIClient().post(reverse('login'), {'username': 'chw', 'password': 'pass12345'})
+        self.assertEqual(response.status_code, 200)
+
+    def test_logout(self):
+        refresh = str(ClaimsRefreshToken.for_user(self.chw))
+        response = self.client_for(self.chw).post(reverse('logout'), {'refresh': refresh})
+        self.assertEqual(response.status_code, 200)
+
+    def test_token_refresh(self):
+        response = APIClient().post(reverse('token_refresh'), {'refresh': str(ClaimsRefreshToken.for_user(self.chw))})
+        self.assertEqual(response.status_code, 200)
+
+    def test_change_password(self):
+        response = self.client_for(self.chw).put(reverse('change_password'), {
+            'old_password': 'pass12345', 'new_password': 'pass67890', 'confirm_password': 'pass67890',
+        })
+        self.assertEqual(response.status_code, 200)
+        self.chw.refresh_from_db()
+        self.assertTrue(self.chw.check_password('pass67890'))
@@ -0,0 +1,128 @@
+"""
+JWT claims and token versions.
+
+Tokens carry the user fields the views branch on (User.TOKEN_CLAIM_FIELDS)
+plus the user's token_version, so requests can be authenticated without
+loading the user. Whether a token's version is still current is looked up
+in a small per-process LRU, then the shared cache, then the database.
+A change to a claimed field bumps the version (see User.save()), publishes
+it to the shared cache and evicts it locally; other processes notice within
+AUTH_TOKEN_VERSION_CACHE_TTL seconds.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .blacklist import get_blacklist
+from .models import User
+
+TOKEN_VERSION_CLAIM = 'tv'
+TOKEN_VERSION_KEY = 'auth:token_version:{user_id}'
+# Version of users that are inactive or gone: no token matches it
+NO_VERSION = -1
+
+
+def user_claims(user):
+    return {
+        'role': user.role,
+        'supervisor_id': user.supervisor_id,
+        'is_active_worker': user.is_active_worker,
+        TOKEN_VERSION_CLAIM: user.token_version,
+    }
+
+
+class ClaimsRefreshToken(RefreshToken):
+    """Refresh token carrying the user claims; its access tokens copy them.
+
+    Blacklist checks and writes go through apps.authentication.blacklist.
+    """
+
+    @classmethod
+    def for_user(cls, user):
+        token = super().for_user(user)
+        token.set_user_claims(user)
+        return token
+
+    def set_user_claims(self, user):
+        for claim, value in user_claims(user).items():
+            self[claim] = value
+
+    def check_blacklist(self):
+        if get_blacklist().is_blacklisted(self[api_settings.JTI_CLAIM]):
+            raise TokenError(_("Token is blacklisted"))
+
+    def blacklist(self):
+        get_blacklist().add(self)
+
+
+class TokenVersionCache:
+    """Bounded LRU of user id -> token version, each entry kept for ttl seconds"""
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            version, expires = entry
+            if expires < time.monotonic():
+                del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+            return version
+
+    def set(self, user_id, version):
+        with self._lock:
+            self._entries[user_id] = (version, time.monotonic() + self.ttl)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def evict(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+token_versions = TokenVersionCache(settings.AUTH_TOKEN_VERSION_CACHE_SIZE, settings.AUTH_TOKEN_VERSION_CACHE_TTL)
+
+
+def shared_timeout():
+    # No token older than this is still in use, so neither is its version
+    return int(api_settings.ACCESS_TOKEN_LIFETIME.total_seconds())
+
+
+def current_token_version(user_id):
+    """The version a token of this user must carry, NO_VERSION if none will do"""
+    version = token_versions.get(user_id)
+    if version is not None:
+        return version
+    key = TOKEN_VERSION_KEY.format(user_id=user_id)
+    version = cache.get(key)
+    if version is None:
+        row = User.objects.filter(pk=user_id).values_list('token_version', 'is_active').first()
+        version = row[0] if row and row[1] else NO_VERSION
+        cache.set(key, version, shared_timeout())
+    token_versions.set(user_id, version)
+    return version
+
+
+def publish_token_version(user_id, version):
+    """Make a new token version (or NO_VERSION) current everywhere"""
+    cache.set(TOKEN_VERSION_KEY.format(user_id=user_id), version, shared_timeout())
+    token_versions.evict(user_id)
@@ -2,20 +2,26 @@ from rest_framework import status, generics
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
-from rest_framework_simplejwt.tokens import RefreshToken
 from django.contrib.auth import authenticate
+from .authentication import load_user
 from .models import User
 from .serializer import UserSerializer, LoginSerializer, ChangePasswordSerializer
+from .tokens import ClaimsRefreshToken
+from chw_backend.compression import compression
+from chw_backend.query_budget import query_budget
 
 
 # Create your views here.
+# Tokens next to the posted username: not compressed (BREACH)
+@compression(enabled=False)
+@query_budget(4)
 @api_view(['POST'])
 @permission_classes([AllowAny])
 def login_view(request):
     serializer = LoginSerializer(data=request.data)
     if serializer.is_valid():
         user = serializer.validated_data['user']
-        refresh = RefreshToken.for_user(user)
+        refresh = ClaimsRefreshToken.for_user(user)
         return Response({
             'refresh': str(refresh),
             'access': str(refresh.access_token),
@@ -23,29 +29,32 @@ def login_view(request):
         })
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+@query_budget(7)
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def logout_view(request):
     try:
         refresh_token = request.data["refresh"]
-        token = RefreshToken(refresh_token)
+        token = ClaimsRefreshToken(refresh_token)
         token.blacklist()
         return Response({'message': 'Successfully logged out'}, status=status.HTTP_200_OK)
     except Exception as e:
         return Response({'error': 'Invalid token'}, status=status.HTTP_400_BAD_REQUEST)
 
+@query_budget(3)
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def profile_view(request):
-    serializer = UserSerializer(request.user)
+    serializer = UserSerializer(load_user(request.user))
     return Response(serializer.data)
 
+@query_budget(3)
 @api_view(['PUT'])
 @permission_classes([IsAuthenticated])
 def change_password(request):
     serializer = ChangePasswordSerializer(data=request.data)
     if serializer.is_valid():
-        user = request.user
+        user = load_user(request.user)
         if user.check_password(serializer.validated_data['old_password']):
             user.set_password(serializer.validated_data['new_password'])
             user.save()
@@ -0,0 +1,108 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils.http import http_date, parse_etags, parse_http_date_safe, quote_etag
+
+CATALOG_VERSION_KEY = 'commodity_catalog:version'
+CATALOG_KEY = 'commodity_catalog:{version}:{key}'
+
+
+class LocalEntries:
+    """Bounded LRU of this process' entries for one catalog version, so a hit
+    only costs the shared-cache lookup of the version number"""
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.version = None
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, version, key):
+        with self._lock:
+            if version != self.version:
+                self.version = version
+                self._entries.clear()
+                return None
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def set(self, version, key, entry):
+        with self._lock:
+            if version != self.version:
+                return
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+local_entries = LocalEntries(settings.CATALOG_LOCAL_ENTRIES)
+
+
+def catalog_version():
+    """Current catalog version: the time of the last change, in nanoseconds"""
+    return cache.get_or_set(CATALOG_VERSION_KEY, time.time_ns(), None)
+
+
+def bump_catalog_version():
+    """Invalidate every cached catalog response"""
+    cache.set(CATALOG_VERSION_KEY, time.time_ns(), None)
+
+
+def get_catalog_entry(key, build):
+    """Cached {'data', 'etag', 'last_modified'} for a catalog payload.
+
+    build() returns the serialized payload, or None when there is nothing to
+    serve (which is not cached). Keys must come from a bounded set of values,
+    never from raw request input.
+    """
+    version = catalog_version()
+    entry = local_entries.get(version, key)
+    if entry is not None:
+        return entry
+
+    shared_key = CATALOG_KEY.format(version=version, key=key)
+    entry = cache.get(shared_key)
+    if entry is None:
+        data = build()
+        if data is None:
+            return None
+        body = json.dumps(data, cls=DjangoJSONEncoder, sort_keys=True).encode()
+        entry = {
+            'data': data,
+            'etag': quote_etag(hashlib.md5(body).hexdigest()),
+            'last_modified': version // 10**9,
+        }
+        cache.set(shared_key, entry, settings.CATALOG_CACHE_TIMEOUT)
+    local_entries.set(version, key, entry)
+    return entry
+
+
+def not_modified(request, entry):
+    """Whether the client's copy of the entry is still current"""
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match:
+        # Weak comparison: compressed responses carry the ETag as W/"..."
+        etags = {etag.removeprefix('W/') for etag in parse_etags(if_none_match)}
+        return '*' in etags or entry['etag'] in etags
+    if_modified_since = parse_http_date_safe(request.headers.get('If-Modified-Since', ''))
+    return if_modified_since is not None and entry['last_modified'] <= if_modified_since
+
+
+def set_validators(response, entry):
+    response['ETag'] = entry['etag']
+    response['Last-Modified'] = http_date(entry['last_modified'])
+    # Clients may keep the catalog but must revalidate it before use
+    response['Cache-Control'] = 'private, no-cache'
+    return response
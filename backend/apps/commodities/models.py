@@ -1,8 +1,25 @@
-from django.db import models
+from django.db import models, transaction
 from django.core.validators import MinValueValidator, MaxValueValidator
 
+from .cache import bump_catalog_version
+
 # Create your models here.
 
+class CommodityQuerySet(models.QuerySet):
+    """Bulk writes skip the save/delete signals, so they bump the catalog version themselves
+    (bulk_update() goes through update())"""
+
+    def update(self, **kwargs):
+        rows = super().update(**kwargs)
+        transaction.on_commit(bump_catalog_version, using=self.db)
+        return rows
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = super().bulk_create(objs, *args, **kwargs)
+        transaction.on_commit(bump_catalog_version, using=self.db)
+        return objs
+
+
 class Commodity(models.Model):
     name = models.CharField(max_length=100, unique=True)
     description = models.TextField(blank=True)
@@ -22,6 +39,8 @@ class Commodity(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = CommodityQuerySet.as_manager()
+
     def __str__(self):
         return f"{self.name} ({self.unit_of_measure})"
 
@@ -0,0 +1,35 @@
+from rest_framework import pagination
+from rest_framework.exceptions import NotFound
+from rest_framework.utils.urls import replace_query_param
+
+
+class CatalogPagination(pagination.PageNumberPagination):
+    """
+    Page number pagination for the cached catalog.
+
+    A cached page is served to every client, so neither its cache key nor its
+    links may carry anything from the request but the page number.
+    """
+
+    def page_key(self, request):
+        """The requested page as a cache key part: its number, or 'last'"""
+        page = request.query_params.get(self.page_query_param, '1')
+        if page in self.last_page_strings:
+            return 'last'
+        if not page.isdigit():
+            raise NotFound('Invalid page.')
+        return str(int(page))
+
+    def page_link(self, number):
+        url = self.request.build_absolute_uri(self.request.path)
+        return url if number == 1 else replace_query_param(url, self.page_query_param, number)
+
+    def get_next_link(self):
+        if not self.page.has_next():
+            return None
+        return self.page_link(self.page.next_page_number())
+
+    def get_previous_link(self):
+        if not self.page.has_previous():
+            return None
+        return self.page_link(self.page.previous_page_number())
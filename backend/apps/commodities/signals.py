@@ -0,0 +1,12 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .cache import bump_catalog_version
+from .models import Commodity
+
+
+@receiver(post_save, sender=Commodity)
+@receiver(post_delete, sender=Commodity)
+def commodity_changed(sender, **kwargs):
+    transaction.on_commit(bump_catalog_version)
@@ -1,3 +1,84 @@
-from django.test import TestCase
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from apps.authentication.models import User
+from .cache import local_entries
+from .models import Commodity
+
+
+class CatalogCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='chw', role='CHW')
+        cls.commodity = Commodity.objects.create(name='ORS')
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_conditional_get(self):
+        for name, kwargs in (('commodity_list', {}), ('commodity_categories', {}),
+                             ('commodity_detail', {'pk': self.commodity.pk})):
+            with self.subTest(name=name):
+                url = reverse(name, kwargs=kwargs)
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                with self.assertNumQueries(0):
+                    response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+                self.assertEqual(response.status_code, 304)
+                response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+                self.assertEqual(response.status_code, 304)
+
+    @override_settings(RESPONSE_COMPRESSION_MIN_BYTES=0)
+    def test_compressed_conditional_get(self):
+        Commodity.objects.bulk_create(Commodity(name=f'Commodity {i}') for i in range(20))
+        url = reverse('commodity_list')
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertTrue(response['ETag'].startswith('W/"'))
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+    def test_change_invalidates(self):
+        url = reverse('commodity_list')
+        etag = self.client.get(url)['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            Commodity.objects.create(name='Zinc')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 2)
+
+    def test_missing_commodity(self):
+        response = self.client.get(reverse('commodity_detail', kwargs={'pk': self.commodity.pk + 1}))
+        self.assertEqual(response.status_code, 404)
+
+    def test_bulk_writes_invalidate(self):
+        url = reverse('commodity_list')
+        for write in (
+            lambda: Commodity.objects.filter(pk=self.commodity.pk).update(name='ORS sachets'),
+            lambda: Commodity.objects.bulk_create([Commodity(name='Zinc')]),
+            lambda: Commodity.objects.bulk_update([Commodity(pk=self.commodity.pk, name='ORS packets')], ['name']),
+        ):
+            etag = self.client.get(url)['ETag']
+            with self.captureOnCommitCallbacks(execute=True):
+                write()
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_list_key_holds_the_page_only(self):
+        Commodity.objects.bulk_create(Commodity(name=f'Commodity {i:02}') for i in range(25))
+        url = reverse('commodity_list')
+        first = self.client.get(url, {'utm_source': 'a'})
+        self.assertEqual(first.data['next'], 'http://testserver/api/commodities/?page=2')
+        with self.assertNumQueries(0):
+            for params in ({'page': '1', 'utm_source': 'b'}, {'page': '01'}, {}):
+                self.assertEqual(self.client.get(url, params)['ETag'], first['ETag'])
+        self.assertEqual(self.client.get(url, {'page': 'x'}).status_code, 404)
+
+        with mock.patch.object(local_entries, 'max_size', 2):
+            for page in (1, 2, 3):
+                self.assertEqual(self.client.get(url, {'page': page}).status_code, 200)
+            self.assertEqual(len(local_entries), 2)
@@ -1,25 +1,55 @@
-from rest_framework import generics, permissions
+from rest_framework import generics, permissions, status
 from rest_framework.decorators import api_view, permission_classes
+from rest_framework.exceptions import NotFound
 from rest_framework.response import Response
+from .cache import get_catalog_entry, not_modified, set_validators
 from .models import Commodity
+from .pagination import CatalogPagination
 from .serializer import CommoditySerializer, CommodityListSerializer
+from chw_backend.query_budget import query_budget
+
+
+def catalog_response(request, key, build):
+    """Serve a catalog payload from the versioned cache, answering 304 when the client is current"""
+    entry = get_catalog_entry(key, build)
+    if entry is None:
+        raise NotFound()
+    if not_modified(request, entry):
+        return set_validators(Response(status=status.HTTP_304_NOT_MODIFIED), entry)
+    return set_validators(Response(entry['data']), entry)
 
 
 # Create your views here.
+@query_budget(3)
 class CommodityListView(generics.ListAPIView):
     queryset = Commodity.objects.filter(is_active=True)
     serializer_class = CommodityListSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = CatalogPagination
+
+    def list(self, request, *args, **kwargs):
+        # Page links are absolute: the key holds the host, which ALLOWED_HOSTS vets, and the page
+        page = self.paginator.page_key(request)
+        build = lambda: super(CommodityListView, self).list(request, *args, **kwargs).data
+        return catalog_response(request, f'list:{request.build_absolute_uri(request.path)}:{page}', build)
 
+@query_budget(2)
 class CommodityDetailView(generics.RetrieveAPIView):
     queryset = Commodity.objects.filter(is_active=True)
     serializer_class = CommoditySerializer
     permission_classes = [permissions.IsAuthenticated]
 
+    def retrieve(self, request, *args, **kwargs):
+        def build():
+            commodity = self.get_queryset().filter(pk=kwargs['pk']).first()
+            return self.get_serializer(commodity).data if commodity else None
+        return catalog_response(request, f"detail:{kwargs['pk']}", build)
+
+@query_budget(2)
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
 def commodity_categories(request):
-    categories = Commodity.objects.filter(is_active=True).values_list('category', flat=True).distinct()
-    return Response(list(categories))
-
-
+    def build():
+        categories = Commodity.objects.filter(is_active=True).values_list('category', flat=True).distinct()
+        return list(categories)
+    return catalog_response(request, 'categories', build)
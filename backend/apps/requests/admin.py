@@ -1,6 +1,10 @@
 from django.contrib import admin
-from .models import CommodityRequest,RequestLog
+from .models import AllocationLedger, CommodityRequest, RequestDailyRollup, RequestLog, RequestLogArchive, RequestLogArchiveMonth
 
 # Register your models here.
 admin.site.register(CommodityRequest)
-admin.site.register(RequestLog)
\ No newline at end of file
+admin.site.register(RequestLog)
+admin.site.register(AllocationLedger)
+admin.site.register(RequestDailyRollup)
+admin.site.register(RequestLogArchive)
+admin.site.register(RequestLogArchiveMonth)
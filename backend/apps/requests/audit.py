@@ -0,0 +1,207 @@
+"""
+Audit log writer.
+
+Views hand their RequestLog entries to ``write()``. With AUDIT_LOG_MODE
+'sync' they are inserted right away, inside the caller's transaction. With
+'buffered' they are queued when the caller's transaction commits and
+inserted in bulk by a background thread, once AUDIT_LOG_BUFFER_SIZE entries
+are waiting or AUDIT_LOG_FLUSH_INTERVAL seconds have passed.
+
+Queued entries are first appended to a spool file in AUDIT_LOG_SPOOL_DIR, one
+file per process and flush. A file is only removed once its entries are in
+the database, so entries lost with a crashed process are recovered by the
+replay_audit_spool command (at least once; replay skips entries that are
+already stored).
+"""
+import atexit
+import json
+import logging
+import os
+import threading
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections, router, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import CommodityRequest, RequestLog
+
+logger = logging.getLogger(__name__)
+
+
+def write(logs):
+    """Record unsaved RequestLog instances according to AUDIT_LOG_MODE"""
+    logs = list(logs)
+    if not logs:
+        return
+    if settings.AUDIT_LOG_MODE != 'buffered':
+        RequestLog.objects.bulk_create(logs)
+        return
+    now = timezone.now()
+    entries = [to_entry(log, now) for log in logs]
+    transaction.on_commit(lambda: get_buffer().add(entries))
+
+
+def to_entry(log, timestamp):
+    return {
+        'request_id': log.request_id,
+        'action': log.action,
+        'performed_by_id': log.performed_by_id,
+        'details': log.details,
+        'timestamp': timestamp.isoformat(),
+    }
+
+
+def from_entry(entry):
+    return RequestLog(
+        request_id=entry['request_id'],
+        action=entry['action'],
+        performed_by_id=entry['performed_by_id'],
+        details=entry['details'],
+        timestamp=parse_datetime(entry['timestamp']),
+    )
+
+
+def insert_entries(entries, batch_size=500):
+    """Insert spooled entries, keeping the timestamps they were recorded with"""
+    logs = [from_entry(entry) for entry in entries]
+    db = router.db_for_write(RequestLog)
+    # raw=True skips pre_save, which would stamp auto_now_add fields with the flush time
+    fields = [field for field in RequestLog._meta.concrete_fields if not field.primary_key]
+    with transaction.atomic(using=db):
+        for start in range(0, len(logs), batch_size):
+            RequestLog.objects.db_manager(db)._insert(logs[start:start + batch_size], fields=fields, raw=True)
+    return len(logs)
+
+
+def read_spool(path):
+    with open(path) as spool:
+        return [json.loads(line) for line in spool if line.strip()]
+
+
+def replay_entries(entries):
+    """Insert the entries that are not stored yet, for requests that still exist"""
+    request_ids = {entry['request_id'] for entry in entries}
+    existing_requests = set(CommodityRequest.objects.filter(pk__in=request_ids).values_list('pk', flat=True))
+    stored = set(
+        (request_id, action, timestamp.isoformat())
+        for request_id, action, timestamp in RequestLog.objects.filter(
+            request_id__in=request_ids,
+            timestamp__in={parse_datetime(entry['timestamp']) for entry in entries},
+        ).values_list('request_id', 'action', 'timestamp')
+    )
+    missing = [
+        entry for entry in entries
+        if entry['request_id'] in existing_requests
+        and (entry['request_id'], entry['action'], parse_datetime(entry['timestamp']).isoformat()) not in stored
+    ]
+    return insert_entries(missing)
+
+
+class AuditBuffer:
+    """Per-process queue of audit entries, backed by spool files"""
+
+    def __init__(self, spool_dir, max_entries, flush_interval):
+        self.spool_dir = spool_dir
+        self.max_entries = max_entries
+        self.flush_interval = flush_interval
+        os.makedirs(spool_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = False
+        self._sequence = 0
+        self._entries = []
+        self._spool = None
+        self._spool_path = None
+        # (path, entries) of spool files not yet in the database
+        self._pending = []
+        self._thread = None
+        if flush_interval > 0:
+            self._thread = threading.Thread(target=self._run, name='audit-log-writer', daemon=True)
+            self._thread.start()
+
+    def add(self, entries):
+        with self._lock:
+            if self._spool is None:
+                self._sequence += 1
+                self._spool_path = os.path.join(self.spool_dir, f'audit-{os.getpid()}-{self._sequence}.jsonl')
+                self._spool = open(self._spool_path, 'a')
+            self._spool.write(''.join(json.dumps(entry, cls=DjangoJSONEncoder) + '\n' for entry in entries))
+            self._spool.flush()
+            self._entries.extend(entries)
+            full = len(self._entries) >= self.max_entries
+        if full:
+            if self._thread is not None:
+                self._wake.set()
+            else:
+                self.flush()
+
+    def flush(self):
+        """Insert everything queued so far; returns the number of entries inserted"""
+        with self._flush_lock:
+            with self._lock:
+                if self._spool is not None:
+                    os.fsync(self._spool.fileno())
+                    self._spool.close()
+                    self._pending.append((self._spool_path, self._entries))
+                    self._spool, self._spool_path, self._entries = None, None, []
+                pending, self._pending = self._pending, []
+            inserted = 0
+            for index, (path, entries) in enumerate(pending):
+                try:
+                    inserted += insert_entries(entries)
+                except Exception:
+                    logger.exception("Could not write %d audit log entries, kept in %s", len(entries), path)
+                    with self._lock:
+                        self._pending[:0] = pending[index:]
+                    break
+                os.remove(path)
+            return inserted
+
+    def _run(self):
+        while not self._stopped:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            finally:
+                # The thread only needs a connection while flushing
+                connections.close_all()
+
+    def close(self):
+        self._stopped = True
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.flush()
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_buffer():
+    global _buffer
+    with _buffer_lock:
+        if _buffer is None:
+            _buffer = AuditBuffer(
+                settings.AUDIT_LOG_SPOOL_DIR, settings.AUDIT_LOG_BUFFER_SIZE, settings.AUDIT_LOG_FLUSH_INTERVAL
+            )
+        return _buffer
+
+
+def flush():
+    """Write out this process's queued audit entries now"""
+    return _buffer.flush() if _buffer is not None else 0
+
+
+@atexit.register
+def close_buffer():
+    """Flush the queued entries and stop the writer thread"""
+    global _buffer
+    with _buffer_lock:
+        buffer, _buffer = _buffer, None
+    if buffer is not None:
+        buffer.close()
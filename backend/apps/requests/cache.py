@@ -0,0 +1,64 @@
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+
+from chw_backend.replicas import reading_replica
+
+DASHBOARD_KEY = 'dashboard_stats:{user_id}'
+ADMIN_GENERATION_KEY = 'dashboard_stats:admin_generation'
+
+
+def _admin_generation():
+    # Seeded with the time: a counter the cache evicted restarts above every
+    # generation handed out before, so no stale snapshot key comes back
+    return cache.get_or_set(ADMIN_GENERATION_KEY, time.time_ns, None)
+
+
+def dashboard_cache_key(user):
+    """Cache key of a user's dashboard snapshot.
+
+    Admins see every request, so their snapshots are tied to a shared
+    generation counter instead of being deleted one by one.
+    """
+    if user.role == 'ADMIN':
+        return f'dashboard_stats:admin:{user.pk}:{_admin_generation()}'
+    return DASHBOARD_KEY.format(user_id=user.pk)
+
+
+def snapshot_timeout():
+    # A snapshot read from a replica may miss writes made just before the last invalidation
+    if reading_replica():
+        return min(settings.DASHBOARD_CACHE_TIMEOUT, settings.REPLICA_PIN_SECONDS)
+    return settings.DASHBOARD_CACHE_TIMEOUT
+
+
+def get_dashboard_snapshot(user, build):
+    """Return the cached dashboard payload for a user, building it on a miss"""
+    key = dashboard_cache_key(user)
+    stats = cache.get(key)
+    if stats is None:
+        stats = build()
+        cache.set(key, stats, snapshot_timeout())
+    return stats
+
+
+async def aget_dashboard_snapshot(user, abuild):
+    """Async get_dashboard_snapshot, abuild is a coroutine function"""
+    key = await sync_to_async(dashboard_cache_key)(user)
+    stats = await cache.aget(key)
+    if stats is None:
+        stats = await abuild()
+        await cache.aset(key, stats, snapshot_timeout())
+    return stats
+
+
+def invalidate_dashboards(user_ids):
+    """Drop the snapshots of the given users and of every admin"""
+    cache.delete_many([DASHBOARD_KEY.format(user_id=pk) for pk in set(user_ids) if pk])
+    try:
+        cache.incr(ADMIN_GENERATION_KEY)
+    except ValueError:
+        # Evicted; unless another process got there first, start a new one
+        cache.add(ADMIN_GENERATION_KEY, time.time_ns(), None)
@@ -0,0 +1,191 @@
+"""
+Streaming exports of requests and request logs.
+
+Rows are read with ``values_list().iterator()``, which uses a server-side
+cursor on PostgreSQL, and written out as they arrive, so memory use does not
+grow with the size of the export (under ASGI too, see arender()). Related
+names come from joins in the same query.
+"""
+import csv
+import json
+from datetime import datetime, time
+
+from asgiref.sync import sync_to_async
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+
+from .models import CommodityRequest, RequestLog
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+CHUNK_SIZE = 2000
+
+
+def full_name(first_name, last_name):
+    # Same as User.get_full_name()
+    return f"{first_name or ''} {last_name or ''}".strip()
+
+
+class RequestExport:
+    """Export of the requests a user can see"""
+    name = 'requests'
+    date_field = 'created_at'
+    status_field = 'status'
+    commodity_field = 'commodity'
+    columns = [
+        'id', 'created_at', 'status', 'commodity_id', 'commodity', 'unit_of_measure',
+        'quantity_requested', 'quantity_approved', 'requester', 'requester_name',
+        'approver', 'approver_name', 'reason_for_request', 'rejection_reason', 'notes',
+        'approved_at', 'delivered_at', 'updated_at',
+    ]
+    lookups = [
+        'id', 'created_at', 'status', 'commodity_id', 'commodity__name', 'commodity__unit_of_measure',
+        'quantity_requested', 'quantity_approved',
+        'requester__username', 'requester__first_name', 'requester__last_name',
+        'approver__username', 'approver__first_name', 'approver__last_name',
+        'reason_for_request', 'rejection_reason', 'notes', 'approved_at', 'delivered_at', 'updated_at',
+    ]
+
+    def queryset(self, user):
+        return CommodityRequest.objects.for_user(user) if user is not None else CommodityRequest.objects.all()
+
+    def to_row(self, values):
+        (pk, created_at, status, commodity_id, commodity, unit, requested, approved,
+         requester, requester_first, requester_last, approver, approver_first, approver_last,
+         reason, rejection_reason, notes, approved_at, delivered_at, updated_at) = values
+        return (
+            pk, created_at, status, commodity_id, commodity, unit, requested, approved,
+            requester, full_name(requester_first, requester_last),
+            approver, full_name(approver_first, approver_last) if approver else None,
+            reason, rejection_reason, notes, approved_at, delivered_at, updated_at,
+        )
+
+
+class RequestLogExport:
+    """Export of the logs of the requests a user can see (live logs only, not the archive)"""
+    name = 'request_logs'
+    date_field = 'timestamp'
+    status_field = 'request__status'
+    commodity_field = 'request__commodity'
+    columns = [
+        'id', 'timestamp', 'request_id', 'action', 'performed_by', 'performed_by_name',
+        'commodity', 'details',
+    ]
+    lookups = [
+        'id', 'timestamp', 'request_id', 'action',
+        'performed_by__username', 'performed_by__first_name', 'performed_by__last_name',
+        'request__commodity__name', 'details',
+    ]
+
+    def queryset(self, user):
+        logs = RequestLog.objects.all()
+        if user is not None and user.role != 'ADMIN':
+            logs = logs.filter(request__in=CommodityRequest.objects.for_user(user).values('pk'))
+        return logs
+
+    def to_row(self, values):
+        pk, timestamp, request_id, action, username, first_name, last_name, commodity, details = values
+        name = full_name(first_name, last_name) if username else None
+        return (pk, timestamp, request_id, action, username, name, commodity, details)
+
+
+EXPORTS = {export.name: export for export in (RequestExport(), RequestLogExport())}
+
+
+def parse_day(value, name):
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        raise ValueError(f"{name} must be a date in YYYY-MM-DD format")
+
+
+def parse_ids(value, name):
+    try:
+        return [int(pk) for pk in value.split(',') if pk]
+    except ValueError:
+        raise ValueError(f"{name} must be a comma separated list of ids")
+
+
+def export_rows(export, user=None, date_from=None, date_to=None, statuses=None, commodities=None,
+                chunk_size=CHUNK_SIZE, using=None):
+    """Tuples of export.columns, streamed from the database.
+
+    user scopes the rows like the list views (None exports everything);
+    date_from and date_to are inclusive days; using picks the database.
+    """
+    queryset = export.queryset(user).using(using)
+    if date_from:
+        start = timezone.make_aware(datetime.combine(date_from, time.min))
+        queryset = queryset.filter(**{f'{export.date_field}__gte': start})
+    if date_to:
+        end = timezone.make_aware(datetime.combine(date_to, time.max))
+        queryset = queryset.filter(**{f'{export.date_field}__lte': end})
+    if statuses:
+        queryset = queryset.filter(**{f'{export.status_field}__in': statuses})
+    if commodities:
+        queryset = queryset.filter(**{f'{export.commodity_field}__in': commodities})
+    rows = queryset.order_by('pk').values_list(*export.lookups).iterator(chunk_size=chunk_size)
+    return (export.to_row(values) for values in rows)
+
+
+class _Echo:
+    """File-like object whose write() returns what it was given, for csv.writer"""
+
+    def write(self, value):
+        return value
+
+
+def render_csv(columns, rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(columns)
+    for row in rows:
+        yield writer.writerow(
+            json.dumps(value, cls=DjangoJSONEncoder) if isinstance(value, dict)
+            else value.isoformat() if isinstance(value, datetime)
+            else value
+            for value in row
+        )
+
+
+def render_ndjson(columns, rows):
+    for row in rows:
+        yield json.dumps(dict(zip(columns, row)), cls=DjangoJSONEncoder) + '\n'
+
+
+RENDERERS = {
+    'csv': render_csv,
+    'ndjson': render_ndjson,
+}
+
+
+def render(export, output_format, rows, lines_per_chunk=500):
+    """Chunks of text for the rows in the given format, a few hundred lines each"""
+    chunk = []
+    for line in RENDERERS[output_format](export.columns, rows):
+        chunk.append(line)
+        if len(chunk) >= lines_per_chunk:
+            yield ''.join(chunk)
+            chunk = []
+    if chunk:
+        yield ''.join(chunk)
+
+
+async def arender(export, output_format, rows, lines_per_chunk=500):
+    """render() for ASGI responses, each chunk read in the sync thread as it is sent.
+
+    Given a sync iterator, Django's ASGI handler would read all of it into a
+    list before sending anything. The cursor is used and closed in the one
+    thread that holds the request's database connection.
+    """
+    chunks = render(export, output_format, rows, lines_per_chunk)
+    next_chunk = sync_to_async(next)
+    try:
+        while True:
+            chunk = await next_chunk(chunks, None)
+            if chunk is None:
+                break
+            yield chunk
+    finally:
+        await sync_to_async(chunks.close)()
@@ -0,0 +1,86 @@
+from datetime import timedelta
+from itertools import groupby
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from apps.requests.models import (
+    RequestLog, RequestLogArchive, RequestLogArchiveMonth, month_bounds, month_start,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Move request logs older than REQUEST_LOG_RETENTION_DAYS, a whole month at a time, "
+        "into the compressed log archive"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--retention-days', type=int, default=settings.REQUEST_LOG_RETENTION_DAYS,
+                            help="Keep this many days of logs live (default: REQUEST_LOG_RETENTION_DAYS)")
+        parser.add_argument('--batch-size', type=int, default=500, help="Requests moved per transaction")
+        parser.add_argument('--dry-run', action='store_true', help="Only report what would be archived")
+
+    def handle(self, *args, **options):
+        cutoff, _ = month_bounds(month_start(timezone.now() - timedelta(days=options['retention_days'])))
+        months = (
+            RequestLog.objects.filter(timestamp__lt=cutoff)
+            .annotate(month=TruncMonth('timestamp'))
+            .values_list('month', flat=True).distinct().order_by('month')
+        )
+        total = 0
+        for month in [month_start(month) for month in months]:
+            if options['dry_run']:
+                count = self.month_logs(month).count()
+                self.stdout.write(f"{month:%Y-%m}: {count} logs would be archived")
+            else:
+                count = self.archive_month(month, options['batch_size'])
+                self.stdout.write(f"{month:%Y-%m}: archived {count} logs")
+            total += count
+        verb = "Would archive" if options['dry_run'] else "Archived"
+        self.stdout.write(self.style.SUCCESS(f"{verb} {total} logs written before {cutoff:%Y-%m-%d}"))
+
+    def month_logs(self, month):
+        start, end = month_bounds(month)
+        return RequestLog.objects.filter(timestamp__gte=start, timestamp__lt=end)
+
+    def archive_month(self, month, batch_size):
+        """Move one month of logs into the archive, batch_size requests per transaction.
+
+        The archive rows, the deletes and the month's manifest count are
+        written together, so an interrupted run can simply be restarted.
+        """
+        archived = 0
+        while True:
+            with transaction.atomic():
+                request_ids = list(
+                    self.month_logs(month).order_by('request_id')
+                    .values_list('request_id', flat=True).distinct()[:batch_size]
+                )
+                if not request_ids:
+                    return archived
+                logs = (
+                    self.month_logs(month).filter(request_id__in=request_ids)
+                    .select_related('performed_by').order_by('request_id', 'timestamp', 'id')
+                )
+                archives = []
+                for request_id, entries in groupby(logs.iterator(), key=lambda log: log.request_id):
+                    entries = list(entries)
+                    archives.append(RequestLogArchive(
+                        request_id=request_id, month=month,
+                        entry_count=len(entries), data=RequestLogArchive.encode(entries),
+                    ))
+                RequestLogArchive.objects.bulk_create(archives, batch_size=500)
+                moved = sum(archive.entry_count for archive in archives)
+
+                archived_logs = self.month_logs(month).filter(request_id__in=request_ids)
+                archived_logs._raw_delete(archived_logs.db)
+                RequestLogArchiveMonth.objects.get_or_create(month=month)
+                RequestLogArchiveMonth.objects.filter(month=month).update(
+                    entry_count=F('entry_count') + moved, archived_at=timezone.now()
+                )
+                archived += moved
@@ -0,0 +1,41 @@
+from datetime import datetime, time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from apps.requests.models import CommodityRequest, RequestDailyRollup
+
+
+class Command(BaseCommand):
+    help = "Rebuild the daily request rollups from CommodityRequest, for every day or from --since on"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', help="First day to rebuild (YYYY-MM-DD), default: all days")
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def expected_rollups(self, since):
+        """Rollup rows recomputed from the requests created on or after since"""
+        requests = CommodityRequest.objects.all()
+        if since:
+            requests = requests.filter(created_at__gte=timezone.make_aware(datetime.combine(since, time.min)))
+        return RequestDailyRollup.from_requests(requests)
+
+    def handle(self, *args, **options):
+        since = None
+        if options['since']:
+            try:
+                since = datetime.strptime(options['since'], '%Y-%m-%d').date()
+            except ValueError:
+                raise CommandError("--since must be a date in YYYY-MM-DD format")
+
+        with transaction.atomic():
+            existing = RequestDailyRollup.objects.all()
+            if since:
+                existing = existing.filter(day__gte=since)
+            existing._raw_delete(existing.db)
+            created = RequestDailyRollup.objects.bulk_create(
+                self.expected_rollups(since), batch_size=options['batch_size']
+            )
+        scope = f"from {since}" if since else "for all days"
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {len(created)} daily rollup rows {scope}"))
@@ -0,0 +1,90 @@
+import json
+import math
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from rest_framework.renderers import JSONRenderer
+
+from apps.authentication.models import User
+from apps.requests.models import CommodityRequest
+from apps.requests.projections import REQUEST_PROJECTION
+from apps.requests.stats import build_analytics
+from chw_backend.compression import ENCODINGS, compress
+from chw_backend.renderers import FastJSONRenderer, MessagePackRenderer
+
+RENDERERS = {
+    'json (DRF)': JSONRenderer,
+    'json (fast)': FastJSONRenderer,
+    'msgpack': MessagePackRenderer,
+}
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure encode CPU and bytes on the wire of the request_analytics payload and request list "
+        "pages for each renderer and content encoding, on the configured database (read only)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--page-size', type=int, default=100, help="Rows per request list page")
+        parser.add_argument('--iterations', type=int, default=200, help="Timed encodings per payload and format")
+        parser.add_argument('--output', default='bench_encoding.json', help="Where to write the JSON results")
+
+    def payloads(self, page_size):
+        if not CommodityRequest.objects.exists():
+            raise CommandError("Seed the database first (seed_load)")
+        # Scoping only looks at the role: an admin's analytics cover every request
+        admin = User(role='ADMIN')
+        rows = REQUEST_PROJECTION.values(CommodityRequest.objects.order_by('-created_at', '-id'))[:page_size]
+        return {
+            'request_analytics': build_analytics(admin),
+            # What CommodityRequestListView renders for a page
+            'request_list': {
+                'count': CommodityRequest.objects.count(),
+                'next': f'http://testserver/api/requests/?page=2&page_size={page_size}',
+                'previous': None,
+                'results': REQUEST_PROJECTION.render(rows),
+            },
+        }
+
+    def handle(self, *args, **options):
+        results = []
+        for payload, data in self.payloads(options['page_size']).items():
+            for name, renderer_class in RENDERERS.items():
+                if not getattr(renderer_class, 'available', True):
+                    self.stdout.write(f"{payload:<18} {name:<12} skipped, not installed")
+                    continue
+                renderer = renderer_class()
+                for encoding in ('identity', *ENCODINGS):
+                    def encode():
+                        body = renderer.render(data)
+                        return body if encoding == 'identity' else compress(body, encoding)
+
+                    samples = []
+                    for _ in range(options['iterations']):
+                        started = time.perf_counter()
+                        body = encode()
+                        samples.append(time.perf_counter() - started)
+                    result = {
+                        'payload': payload,
+                        'renderer': name,
+                        'encoding': encoding,
+                        'bytes': len(body),
+                        'p50_ms': percentile(samples, 50) * 1000,
+                        'p95_ms': percentile(samples, 95) * 1000,
+                    }
+                    results.append(result)
+                    self.stdout.write(
+                        f"{payload:<18} {name:<12} {encoding:<9} {result['bytes']:>8} bytes "
+                        f"p50={result['p50_ms']:.3f}ms p95={result['p95_ms']:.3f}ms"
+                    )
+
+        with open(options['output'], 'w') as fh:
+            json.dump({'vendor': connection.vendor, 'results': results}, fh, indent=2)
+        self.stdout.write(self.style.SUCCESS(f"Wrote {len(results)} results to {options['output']}"))
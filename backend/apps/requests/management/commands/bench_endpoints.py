@@ -0,0 +1,346 @@
+import io
+import json
+import math
+import platform
+import time
+from contextlib import contextmanager
+
+import django
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.backends.utils import CursorWrapper
+from django.test.utils import CaptureQueriesContext, setup_test_environment, teardown_test_environment
+from django.urls import NoReverseMatch, reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from apps.authentication import urls as authentication_urls
+from apps.authentication.blacklist import close_blacklist
+from apps.authentication.models import User
+from apps.authentication.tokens import ClaimsRefreshToken
+from apps.commodities import urls as commodity_urls
+from apps.commodities.models import Commodity
+from apps.requests import urls as request_urls
+from apps.requests.management.commands.seed_load import USERNAME_PREFIX
+from apps.requests.models import CommodityRequest, day_bounds
+from apps.requests.stats import close_worker_connections
+
+ROLES = ['CHW', 'CHA', 'ADMIN']
+PASSWORD = 'bench-password'
+# Event streams stay open until the client leaves: they have no latency to measure
+EVENT_STREAM_ROUTES = {'request_events'}
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of a non-empty list"""
+    ordered = sorted(samples)
+    return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+
+def read_body(response, max_stream_bytes):
+    """Size of the response body, reading at most max_stream_bytes of a streamed one"""
+    if not response.streaming:
+        return len(response.content)
+    size = 0
+    try:
+        for chunk in response.streaming_content:
+            size += len(chunk)
+            if size >= max_stream_bytes:
+                break
+    finally:
+        response.close()
+    return size
+
+
+@contextmanager
+def count_fetched_rows():
+    """Count rows fetched through Django cursors while the block runs"""
+    counter = {'rows': 0}
+    originals = {name: CursorWrapper.__dict__.get(name) for name in ('fetchone', 'fetchmany', 'fetchall')}
+
+    def fetchone(self):
+        row = self.cursor.fetchone()
+        counter['rows'] += row is not None
+        return row
+
+    def fetchmany(self, *args, **kwargs):
+        rows = self.cursor.fetchmany(*args, **kwargs)
+        counter['rows'] += len(rows)
+        return rows
+
+    def fetchall(self):
+        rows = self.cursor.fetchall()
+        counter['rows'] += len(rows)
+        return rows
+
+    CursorWrapper.fetchone, CursorWrapper.fetchmany, CursorWrapper.fetchall = fetchone, fetchmany, fetchall
+    try:
+        yield counter
+    finally:
+        for name, original in originals.items():
+            if original is None:
+                delattr(CursorWrapper, name)
+            else:
+                setattr(CursorWrapper, name, original)
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark every API route in-process as CHW, CHA and ADMIN against seeded datasets, "
+        "reporting latency percentiles, SQL query counts and rows fetched"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='1000,10000', help="Comma separated request counts to seed")
+        parser.add_argument('--iterations', type=int, default=30, help="Timed calls per route and role")
+        parser.add_argument('--warmup', type=int, default=3, help="Untimed calls before measuring")
+        parser.add_argument('--routes', help="Comma separated route names to run (default: all)")
+        parser.add_argument('--cold-cache', action='store_true', help="Clear the cache before every call")
+        parser.add_argument('--output', default='bench_results.json', help="Where to write the JSON results")
+        parser.add_argument('--baseline', help="Previous results file to compare against")
+        parser.add_argument(
+            '--max-regression', type=float, default=0.25,
+            help="Fail when p95 latency grows by more than this fraction over the baseline"
+        )
+        parser.add_argument(
+            '--use-existing', action='store_true',
+            help="Benchmark the configured database as-is instead of seeding a throwaway test database"
+        )
+        parser.add_argument('--keepdb', action='store_true', help="Keep the test database between runs")
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument(
+            '--max-stream-bytes', type=int, default=10 * 1024 * 1024,
+            help="Stop reading a streamed response after this many bytes"
+        )
+
+    def handle(self, *args, **options):
+        self.options = options
+        only = set(options['routes'].split(',')) if options['routes'] else None
+        self.routes = [route for route in self.discover_routes() if not only or route[0] in only]
+
+        setup_test_environment()
+        old_name = None
+        try:
+            if options['use_existing']:
+                results = self.run_dataset('existing')
+            else:
+                old_name = connection.settings_dict['NAME']
+                connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=options['keepdb'])
+                results = []
+                for size in [int(size) for size in options['sizes'].split(',')]:
+                    self.seed(size)
+                    results.extend(self.run_dataset(size))
+        finally:
+            close_worker_connections()
+            close_blacklist()
+            if old_name is not None:
+                connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=options['keepdb'])
+            teardown_test_environment()
+
+        report = {
+            'meta': {
+                'created_at': timezone.now().isoformat(),
+                'vendor': connection.vendor,
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'iterations': options['iterations'],
+                'cold_cache': options['cold_cache'],
+            },
+            'results': results,
+        }
+        with open(options['output'], 'w') as fh:
+            json.dump(report, fh, indent=2)
+        self.stdout.write(self.style.SUCCESS(f"Wrote {len(results)} results to {options['output']}"))
+
+        if options['baseline']:
+            self.compare(results, options['baseline'], options['max_regression'])
+
+    def discover_routes(self):
+        """(name, methods) for every request/response route of the API apps"""
+        routes = []
+        for module in (request_urls, commodity_urls, authentication_urls):
+            for pattern in module.urlpatterns:
+                if pattern.name in EVENT_STREAM_ROUTES:
+                    continue
+                view_class = getattr(pattern.callback, 'cls', None)
+                if view_class is None:
+                    # Plain (async) Django views only serve GET here
+                    routes.append((pattern.name, ['GET']))
+                    continue
+                methods = [
+                    method.upper() for method in ('get', 'post', 'patch', 'put')
+                    if method in view_class.http_method_names and hasattr(view_class, method)
+                ]
+                # PUT and PATCH share an implementation on the update views, PATCH is what clients send
+                if 'PATCH' in methods and 'PUT' in methods:
+                    methods.remove('PUT')
+                routes.append((pattern.name, methods))
+        return routes
+
+    def seed(self, size):
+        # Keep every CHW well below one request per commodity per day
+        chws_needed = max(1, math.ceil(size / 2000))
+        chas = max(2, math.ceil(chws_needed / 20))
+        self.stdout.write(f"Seeding {size} requests...")
+        call_command(
+            'seed_load', '--clear',
+            '--requests', str(size),
+            '--chas', str(chas),
+            '--chws-per-cha', '20',
+            '--seed', str(self.options['seed']),
+            '--password', PASSWORD,
+            stdout=io.StringIO(),
+        )
+
+    def fixtures(self):
+        """Users and objects the route calls are made with"""
+        chw = User.objects.filter(role='CHW', commodity_requests__isnull=False).order_by('id').first()
+        if chw is None:
+            raise CommandError("The database has no CHW with requests to benchmark against")
+        cha = chw.supervisor
+        admin = User.objects.get(username=f'{USERNAME_PREFIX}admin')
+        for user in (chw, cha, admin):
+            user.set_password(PASSWORD)
+            user.save(update_fields=['password'])
+
+        start, end = day_bounds()
+        requested_today = CommodityRequest.objects.filter(
+            requester=chw, created_at__gte=start, created_at__lt=end
+        ).values('commodity')
+        return {
+            'users': {'CHW': chw, 'CHA': cha, 'ADMIN': admin},
+            'request': CommodityRequest.objects.filter(requester=chw).order_by('-created_at').first(),
+            'pending': CommodityRequest.objects.filter(requester=chw, status='PENDING').first(),
+            'queue': list(CommodityRequest.objects.for_user(cha).filter(status='PENDING').values_list(
+                'pk', flat=True
+            )[:50]),
+            'commodity': Commodity.objects.filter(is_active=True).exclude(pk__in=requested_today).first(),
+            'basket': list(Commodity.objects.filter(is_active=True).exclude(pk__in=requested_today).values_list(
+                'pk', flat=True
+            )[:5]),
+        }
+
+    def call_spec(self, name, method, role, fixtures):
+        """(url, data) for one call of a route"""
+        user = fixtures['users'][role]
+        request = fixtures['request']
+        if name in ('request_detail', 'request_logs'):
+            target = fixtures['pending'] if method == 'PATCH' and fixtures['pending'] else request
+            key = 'pk' if name == 'request_detail' else 'request_id'
+            url = reverse(name, kwargs={key: target.pk})
+        elif name == 'commodity_detail':
+            url = reverse(name, kwargs={'pk': fixtures['commodity'].pk})
+        elif name in ('request_export', 'request_log_export'):
+            url = reverse(name, kwargs={'output_format': 'csv'})
+        else:
+            try:
+                url = reverse(name)
+            except NoReverseMatch as exc:
+                raise CommandError(f"Cannot build a URL for {name}, add it to call_spec: {exc}")
+
+        data = {
+            'request_create': lambda: {'commodity': fixtures['commodity'].pk, 'quantity_requested': 1},
+            'request_detail': lambda: {'status': 'APPROVED', 'quantity_approved': 1},
+            'request_basket': lambda: {'lines': [
+                {'commodity': pk, 'quantity_requested': 1} for pk in fixtures['basket']
+            ]},
+            'request_bulk_update': lambda: {'actions': [
+                {'id': pk, 'status': 'APPROVED', 'quantity_approved': 1} for pk in fixtures['queue']
+            ]},
+            'login': lambda: {'username': user.username, 'password': PASSWORD},
+            'logout': lambda: {'refresh': str(ClaimsRefreshToken.for_user(user))},
+            'token_refresh': lambda: {'refresh': str(ClaimsRefreshToken.for_user(user))},
+            'change_password': lambda: {
+                'old_password': PASSWORD, 'new_password': PASSWORD, 'confirm_password': PASSWORD
+            },
+        }.get(name, lambda: None)
+        return url, data
+
+    def run_dataset(self, size):
+        # Committed so the async views, which query from other connections, see it
+        User.objects.get_or_create(username=f'{USERNAME_PREFIX}admin', defaults={'role': 'ADMIN'})
+        # Passwords and anything else the fixtures change are rolled back
+        with transaction.atomic():
+            results = self.run_routes(size)
+            transaction.set_rollback(True)
+        return results
+
+    def run_routes(self, size):
+        fixtures = self.fixtures()
+        results = []
+        for name, methods in self.routes:
+            for method in methods:
+                for role in ROLES:
+                    spec = self.call_spec(name, method, role, fixtures)
+                    result = self.measure(name, method, role, fixtures['users'][role], *spec)
+                    result['dataset'] = size
+                    results.append(result)
+                    self.stdout.write(
+                        f"{size!s:>9} {name:<22} {method:<5} {role:<5} {result['status']} "
+                        f"p50={result['p50_ms']:.1f}ms p95={result['p95_ms']:.1f}ms "
+                        f"p99={result['p99_ms']:.1f}ms queries={result['queries']} rows={result['rows']}"
+                    )
+        return results
+
+    def measure(self, name, method, role, user, url, data):
+        client = APIClient()
+        client.raise_request_exception = False
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {ClaimsRefreshToken.for_user(user).access_token}')
+        send = getattr(client, method.lower())
+        timings, queries, rows, statuses = [], [], [], set()
+
+        for iteration in range(self.options['warmup'] + self.options['iterations']):
+            if self.options['cold_cache']:
+                cache.clear()
+            payload = data()
+            # Writes are rolled back so every call sees the same dataset
+            with transaction.atomic(), CaptureQueriesContext(connection) as captured, \
+                    count_fetched_rows() as fetched:
+                started = time.perf_counter()
+                response = send(url, payload, format='json') if payload is not None else send(url)
+                # Streamed bodies (the exports) are produced, and queried for, while read
+                size = read_body(response, self.options['max_stream_bytes'])
+                elapsed = time.perf_counter() - started
+                transaction.set_rollback(True)
+            if iteration < self.options['warmup']:
+                continue
+            timings.append(elapsed * 1000)
+            queries.append(len(captured))
+            rows.append(fetched['rows'])
+            statuses.add(response.status_code)
+
+        return {
+            'route': name,
+            'method': method,
+            'role': role,
+            'status': ','.join(str(code) for code in sorted(statuses)),
+            'p50_ms': round(percentile(timings, 50), 3),
+            'p95_ms': round(percentile(timings, 95), 3),
+            'p99_ms': round(percentile(timings, 99), 3),
+            'mean_ms': round(sum(timings) / len(timings), 3),
+            'queries': max(queries),
+            'rows': max(rows),
+            'bytes': size,
+        }
+
+    def compare(self, results, baseline_path, max_regression):
+        with open(baseline_path) as fh:
+            baseline = {
+                (str(r['dataset']), r['route'], r['method'], r['role']): r
+                for r in json.load(fh)['results']
+            }
+        regressions = []
+        for result in results:
+            previous = baseline.get((str(result['dataset']), result['route'], result['method'], result['role']))
+            if previous is None:
+                continue
+            label = f"{result['dataset']} {result['route']} {result['method']} {result['role']}"
+            if result['p95_ms'] > previous['p95_ms'] * (1 + max_regression):
+                regressions.append(f"{label}: p95 {previous['p95_ms']}ms -> {result['p95_ms']}ms")
+            if result['queries'] > previous['queries']:
+                regressions.append(f"{label}: queries {previous['queries']} -> {result['queries']}")
+        if regressions:
+            raise CommandError("Performance regressions:\n  " + "\n  ".join(regressions))
+        self.stdout.write(self.style.SUCCESS("No regressions against the baseline"))
@@ -0,0 +1,205 @@
+import json
+import math
+import multiprocessing
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from apps.authentication.models import User
+from apps.commodities.models import Commodity
+from apps.requests.models import (
+    DAILY_LIMIT_STATUSES, AllocationLedger, AllocationLimitExceeded, CommodityRequest,
+)
+
+# lock mode: tables a coarse-locking implementation would lock instead of
+# relying on the unique constraint and the ledger row locks
+TABLE_LOCKS = {
+    'submit': CommodityRequest._meta.db_table,
+    'approve': AllocationLedger._meta.db_table,
+}
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure request submission and approval throughput of concurrent worker processes with "
+        "the daily constraint and ledger row locks, against whole-table locks, on a throwaway "
+        "PostgreSQL test database; every run is checked for duplicate requests and over-allocation"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', default='1,4,16', help="Comma separated worker process counts")
+        parser.add_argument('--operations', type=int, default=40, help="Operations per worker and scenario")
+        parser.add_argument('--output', default='bench_limits.json', help="Where to write the JSON results")
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError("bench_limits needs PostgreSQL for concurrent writers and table locks")
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        results = []
+        try:
+            self.cha = User.objects.create(username='bench-limits-cha', role='CHA')
+            for workers in [int(count) for count in options['workers'].split(',')]:
+                for scenario in ('submit', 'approve_spread', 'approve_hot'):
+                    for lock in ('row', 'table'):
+                        result = self.run(scenario, lock, workers, options['operations'])
+                        results.append(result)
+                        self.stdout.write(
+                            f"{scenario:<15} {lock:<6} {workers:>3} workers {result['per_second']:>7.0f} ops/s "
+                            f"p50={result['p50_ms']:.2f}ms p95={result['p95_ms']:.2f}ms "
+                            f"refused={result['refused']} violations={result['violations']}"
+                        )
+        finally:
+            connection.close()
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        with open(options['output'], 'w') as fh:
+            json.dump({'vendor': connection.vendor, 'results': results}, fh, indent=2)
+        self.stdout.write(self.style.SUCCESS(f"Wrote {len(results)} results to {options['output']}"))
+        if any(result['violations'] for result in results):
+            raise CommandError("Limits were broken, see violations in the results")
+
+    def setup(self, scenario, workers, operations):
+        """Fresh CHWs and commodities; returns the work items of each worker"""
+        run = f'{scenario}-{time.monotonic_ns()}'
+        chws = User.objects.bulk_create(
+            User(username=f'{run}-{i}', role='CHW', supervisor=self.cha) for i in range(workers)
+        )
+        if scenario == 'submit':
+            # Two workers per CHW submit the same commodities, so about half the submissions conflict
+            commodities = Commodity.objects.bulk_create(
+                Commodity(name=f'{run}-{i}', max_monthly_allocation=10 ** 6) for i in range(operations)
+            )
+            return [[(chws[w // 2].pk, commodity.pk) for commodity in commodities] for w in range(workers)]
+
+        # Pending requests of 5, spread over earlier days so the daily constraint allows them;
+        # with the cap at half the quantity, half the approvals are refused
+        spread = scenario == 'approve_spread'
+        commodity = Commodity.objects.create(
+            name=run, max_monthly_allocation=operations * 5 // 2 * (1 if spread else workers)
+        )
+        today = timezone.localdate()
+        requests = CommodityRequest.objects.bulk_create(
+            CommodityRequest(
+                requester=chws[w if spread else 0], supervisor=self.cha, approver=self.cha,
+                commodity=commodity, quantity_requested=5,
+                request_date=today - timedelta(days=w * operations + i),
+            )
+            for w in range(workers) for i in range(operations)
+        )
+        return [[request.pk for request in requests[w * operations:(w + 1) * operations]] for w in range(workers)]
+
+    @staticmethod
+    def submit(item, lock):
+        requester_id, commodity_id = item
+        if lock == 'table' and CommodityRequest.objects.filter(
+            requester_id=requester_id, commodity_id=commodity_id,
+            request_date=timezone.localdate(), status__in=DAILY_LIMIT_STATUSES,
+        ).exists():
+            return False
+        try:
+            CommodityRequest.objects.create(
+                requester_id=requester_id, commodity_id=commodity_id, quantity_requested=5
+            )
+        except IntegrityError:
+            return False
+        return True
+
+    @staticmethod
+    def approve(pk, lock):
+        request = CommodityRequest.objects.select_related('commodity').get(pk=pk)
+        request.status, request.quantity_approved = 'APPROVED', request.quantity_requested
+        try:
+            request.save()
+        except AllocationLimitExceeded:
+            return False
+        return True
+
+    def run(self, scenario, lock, workers, operations):
+        work = self.setup(scenario, workers, operations)
+        kind = 'submit' if scenario == 'submit' else 'approve'
+        operation = getattr(self, kind)
+        table = TABLE_LOCKS[kind]
+        # Forked workers must not share the parent's connection
+        connection.close()
+        context = multiprocessing.get_context('fork')
+        barrier = context.Barrier(workers + 1)
+        queue = context.Queue()
+
+        def worker(items):
+            samples, outcomes, error = [], [], None
+            try:
+                barrier.wait()
+                for item in items:
+                    started = time.perf_counter()
+                    with transaction.atomic():
+                        if lock == 'table':
+                            with connection.cursor() as cursor:
+                                cursor.execute(f'LOCK TABLE {table} IN SHARE ROW EXCLUSIVE MODE')
+                        outcomes.append(operation(item, lock))
+                    samples.append(time.perf_counter() - started)
+            except Exception as exc:
+                error = repr(exc)
+            finally:
+                connection.close()
+                queue.put((samples, outcomes, error))
+
+        processes = [context.Process(target=worker, args=(items,)) for items in work]
+        for process in processes:
+            process.start()
+        barrier.wait()
+        started = time.perf_counter()
+        reports = [queue.get() for _ in processes]
+        elapsed = time.perf_counter() - started
+        for process in processes:
+            process.join()
+        errors = [error for _, _, error in reports if error]
+        if errors:
+            raise CommandError(f"{scenario}/{lock}: {errors[0]}")
+        samples = [sample for report in reports for sample in report[0]]
+        outcomes = [outcome for report in reports for outcome in report[1]]
+
+        return {
+            'scenario': scenario,
+            'lock': lock,
+            'workers': workers,
+            'operations': len(samples),
+            'per_second': len(samples) / elapsed,
+            'p50_ms': percentile(samples, 50) * 1000,
+            'p95_ms': percentile(samples, 95) * 1000,
+            'refused': outcomes.count(False),
+            'violations': self.violations(work, kind),
+        }
+
+    def violations(self, work, kind):
+        """Duplicate active requests per day plus ledger rows over their cap or out of step with the requests"""
+        if kind == 'submit':
+            requester_ids = {item[0] for items in work for item in items}
+        else:
+            requester_ids = set(CommodityRequest.objects.filter(
+                pk__in=[pk for items in work for pk in items]
+            ).values_list('requester', flat=True))
+        requests = CommodityRequest.objects.filter(requester__in=requester_ids)
+        active = requests.filter(status__in=DAILY_LIMIT_STATUSES)
+        duplicates = active.count() - active.values('requester', 'commodity', 'request_date').distinct().count()
+        approved = {
+            (row['requester'], row['commodity']): row['total']
+            for row in requests.filter(status='APPROVED').values('requester', 'commodity').annotate(
+                total=Sum('quantity_approved')
+            ).order_by()
+        }
+        broken = sum(
+            entry.quantity_used > entry.commodity.max_monthly_allocation
+            or entry.quantity_used != approved.get((entry.requester_id, entry.commodity_id), 0)
+            for entry in AllocationLedger.objects.filter(requester__in=requester_ids).select_related('commodity')
+        )
+        return duplicates + broken
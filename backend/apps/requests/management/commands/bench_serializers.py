@@ -0,0 +1,85 @@
+import json
+import math
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from rest_framework.renderers import JSONRenderer
+
+from apps.requests.models import CommodityRequest, RequestLog
+from apps.requests.projections import LOG_PROJECTION, REQUEST_PROJECTION
+from apps.requests.serializer import CommodityRequestSerializer, RequestLogSerializer
+from apps.requests.stats import REQUEST_RELATED
+
+# name: (queryset, related rows of the serializer, serializer, projection)
+LISTS = {
+    'requests': (CommodityRequest.objects.order_by('-created_at', '-id'), REQUEST_RELATED,
+                 CommodityRequestSerializer, REQUEST_PROJECTION),
+    # Newest by id: no index covers the timestamp order outside a single request
+    'request_logs': (RequestLog.objects.order_by('-id'), ('performed_by',),
+                     RequestLogSerializer, LOG_PROJECTION),
+}
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the list serializers with the read-only projections on the newest rows of the "
+        "configured database (read only), fetching and rendering pages to JSON; the rendered "
+        "bytes must be identical"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=100, help="Rows per page")
+        parser.add_argument('--iterations', type=int, default=200, help="Timed pages per list and path")
+        parser.add_argument('--output', default='bench_serializers.json', help="Where to write the JSON results")
+
+    def handle(self, *args, **options):
+        renderer = JSONRenderer()
+        results = []
+        for name, (queryset, related, serializer_class, projection) in LISTS.items():
+            page = queryset[:options['rows']]
+            paths = {
+                'serializer': lambda: renderer.render(
+                    serializer_class(page.select_related(*related), many=True).data
+                ),
+                'projection': lambda: renderer.render(projection.render(projection.values(page))),
+            }
+            outputs = {path: run() for path, run in paths.items()}
+            if outputs['serializer'] != outputs['projection']:
+                raise CommandError(f"{name}: the projection does not render what the serializer does")
+            if not outputs['serializer'].strip(b'[]'):
+                raise CommandError(f"{name}: no rows to render, seed the database first (seed_load)")
+
+            # Rendering alone, on rows fetched once
+            instances = list(page.select_related(*related))
+            rows = list(projection.values(page))
+            paths['serializer (no SQL)'] = lambda: renderer.render(serializer_class(instances, many=True).data)
+            paths['projection (no SQL)'] = lambda: renderer.render(projection.render(rows))
+
+            for path, run in paths.items():
+                samples = []
+                for _ in range(options['iterations']):
+                    started = time.perf_counter()
+                    run()
+                    samples.append(time.perf_counter() - started)
+                result = {
+                    'list': name,
+                    'path': path,
+                    'rows': len(instances),
+                    'p50_ms': percentile(samples, 50) * 1000,
+                    'p95_ms': percentile(samples, 95) * 1000,
+                }
+                results.append(result)
+                self.stdout.write(
+                    f"{name:<13} {path:<20} {result['rows']:>4} rows "
+                    f"p50={result['p50_ms']:.2f}ms p95={result['p95_ms']:.2f}ms"
+                )
+
+        with open(options['output'], 'w') as fh:
+            json.dump({'vendor': connection.vendor, 'results': results}, fh, indent=2)
+        self.stdout.write(self.style.SUCCESS(f"Wrote {len(results)} results to {options['output']}"))
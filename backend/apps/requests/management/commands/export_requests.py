@@ -0,0 +1,53 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.authentication.models import User
+from apps.requests.export import CHUNK_SIZE, EXPORT_FORMATS, EXPORTS, export_rows, parse_day, parse_ids, render
+from chw_backend.replicas import read_database, replica_reads
+
+
+class Command(BaseCommand):
+    help = "Stream requests or request logs to a CSV or NDJSON file without loading them into memory"
+
+    def add_arguments(self, parser):
+        parser.add_argument('what', choices=sorted(EXPORTS), help="What to export")
+        parser.add_argument('--format', dest='output_format', choices=sorted(EXPORT_FORMATS), default='csv')
+        parser.add_argument('--output', help="File to write (default: stdout)")
+        parser.add_argument('--user', help="Only export what this username can see (default: everything)")
+        parser.add_argument('--date-from', help="First day to include (YYYY-MM-DD)")
+        parser.add_argument('--date-to', help="Last day to include (YYYY-MM-DD)")
+        parser.add_argument('--status', help="Comma separated request statuses")
+        parser.add_argument('--commodity', help="Comma separated commodity ids")
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help="Rows fetched per round trip")
+        parser.add_argument('--database', help="Database alias to read from (default: a healthy replica, if any)")
+
+    def handle(self, *args, **options):
+        user = None
+        if options['user']:
+            try:
+                user = User.objects.get(username=options['user'])
+            except User.DoesNotExist:
+                raise CommandError(f"User {options['user']} does not exist")
+        try:
+            filters = {
+                'date_from': parse_day(options['date_from'], '--date-from') if options['date_from'] else None,
+                'date_to': parse_day(options['date_to'], '--date-to') if options['date_to'] else None,
+                'statuses': [s for s in (options['status'] or '').split(',') if s],
+                'commodities': parse_ids(options['commodity'] or '', '--commodity'),
+            }
+        except ValueError as exc:
+            raise CommandError(str(exc))
+
+        export = EXPORTS[options['what']]
+        using = options['database']
+        if using is None:
+            with replica_reads():
+                using = read_database()
+        rows = export_rows(export, user, chunk_size=options['chunk_size'], using=using, **filters)
+        if not options['output']:
+            for chunk in render(export, options['output_format'], rows):
+                self.stdout.write(chunk, ending='')
+            return
+        with open(options['output'], 'w', newline='') as output:
+            for chunk in render(export, options['output_format'], rows):
+                output.write(chunk)
+        self.stderr.write(self.style.SUCCESS(f"Exported {export.name} to {options['output']}"))
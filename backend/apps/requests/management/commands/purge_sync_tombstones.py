@@ -0,0 +1,19 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from apps.requests.models import SyncTombstone
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete changes feed tombstones older than SYNC_TOMBSTONE_RETENTION_DAYS; the feed turns "
+        "away tokens that old, so their clients sync again from scratch. Run it on a schedule (e.g. daily)"
+    )
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=settings.SYNC_TOMBSTONE_RETENTION_DAYS)
+        purged, _ = SyncTombstone.objects.filter(deleted_at__lt=cutoff).delete()
+        self.stdout.write(self.style.SUCCESS(f"Purged {purged} sync tombstones"))
@@ -0,0 +1,76 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Sum
+from django.db.models.functions import TruncMonth
+
+from apps.requests.models import ALLOCATED_STATUSES, AllocationLedger, CommodityRequest
+
+
+class Command(BaseCommand):
+    help = "Verify the monthly allocation ledger against CommodityRequest, optionally repairing it"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true', help="Rewrite ledger rows that do not match")
+        parser.add_argument('--rebuild', action='store_true', help="Drop and rebuild the whole ledger")
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def expected_usage(self):
+        """Ledger contents recomputed from the requests, keyed by (requester, commodity, month)"""
+        rows = CommodityRequest.objects.filter(
+            status__in=ALLOCATED_STATUSES
+        ).annotate(
+            month=TruncMonth('created_at')
+        ).values(
+            'requester_id', 'commodity_id', 'month'
+        ).annotate(
+            total=Sum('quantity_approved')
+        ).order_by()
+        return {
+            (row['requester_id'], row['commodity_id'], row['month'].date()): row['total'] or 0
+            for row in rows.iterator()
+        }
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        expected = self.expected_usage()
+
+        if options['rebuild']:
+            with transaction.atomic():
+                AllocationLedger.objects.all().delete()
+                AllocationLedger.objects.bulk_create(
+                    (
+                        AllocationLedger(requester_id=r, commodity_id=c, month=m, quantity_used=total)
+                        for (r, c, m), total in expected.items()
+                    ),
+                    batch_size=batch_size
+                )
+            self.stdout.write(self.style.SUCCESS(f"Rebuilt ledger with {len(expected)} rows"))
+            return
+
+        mismatched, stale = [], []
+        for entry in AllocationLedger.objects.order_by().iterator(chunk_size=batch_size):
+            key = (entry.requester_id, entry.commodity_id, entry.month)
+            total = expected.pop(key, 0)
+            if entry.quantity_used != total:
+                entry.quantity_used = total
+                (mismatched if total else stale).append(entry)
+        missing = [
+            AllocationLedger(requester_id=r, commodity_id=c, month=m, quantity_used=total)
+            for (r, c, m), total in expected.items() if total
+        ]
+
+        problems = len(mismatched) + len(stale) + len(missing)
+        self.stdout.write(
+            f"{len(mismatched)} mismatched, {len(stale)} stale and {len(missing)} missing ledger rows"
+        )
+        if not problems:
+            self.stdout.write(self.style.SUCCESS("Ledger matches requests"))
+            return
+        if not options['fix']:
+            self.stdout.write(self.style.WARNING("Run with --fix to repair the ledger"))
+            return
+
+        with transaction.atomic():
+            AllocationLedger.objects.bulk_update(mismatched + stale, ['quantity_used'], batch_size=batch_size)
+            AllocationLedger.objects.bulk_create(missing, batch_size=batch_size, ignore_conflicts=True)
+        self.stdout.write(self.style.SUCCESS(f"Repaired {problems} ledger rows"))
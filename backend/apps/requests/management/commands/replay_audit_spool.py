@@ -0,0 +1,43 @@
+import glob
+import os
+import re
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from apps.requests.audit import read_spool, replay_entries
+
+SPOOL_NAME = re.compile(r'audit-(\d+)-\d+\.jsonl$')
+
+
+def process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class Command(BaseCommand):
+    help = "Write audit log entries left in the spool by processes that stopped before flushing them"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--spool-dir', default=settings.AUDIT_LOG_SPOOL_DIR)
+        parser.add_argument('--all', action='store_true',
+                            help="Also replay files of processes that still seem to be running")
+
+    def handle(self, *args, **options):
+        replayed = files = 0
+        for path in sorted(glob.glob(os.path.join(options['spool_dir'], 'audit-*.jsonl'))):
+            match = SPOOL_NAME.search(path)
+            if not match or (not options['all'] and process_alive(int(match.group(1)))):
+                continue
+            entries = read_spool(path)
+            inserted = replay_entries(entries) if entries else 0
+            os.remove(path)
+            self.stdout.write(f"{os.path.basename(path)}: {inserted} of {len(entries)} entries written")
+            replayed += inserted
+            files += 1
+        self.stdout.write(self.style.SUCCESS(f"Replayed {replayed} audit log entries from {files} spool files"))
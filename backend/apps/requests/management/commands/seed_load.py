@@ -0,0 +1,361 @@
+import io
+import json
+import random
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from apps.authentication.models import User
+from apps.commodities.models import Commodity
+from apps.requests.models import AllocationLedger, CommodityRequest, RequestDailyRollup, RequestLog, month_start
+
+# (name, unit_of_measure, category, max_quantity_per_request, max_monthly_allocation)
+CATALOG = [
+    ('Artemether-Lumefantrine 20/120mg', 'tablets', 'Malaria', 48, 200),
+    ('Malaria Rapid Diagnostic Test', 'kits', 'Malaria', 50, 150),
+    ('Long Lasting Insecticidal Net', 'pieces', 'Malaria', 10, 30),
+    ('Oral Rehydration Salts', 'sachets', 'Diarrhoea', 60, 200),
+    ('Zinc Sulphate 20mg', 'tablets', 'Diarrhoea', 60, 200),
+    ('Amoxicillin DT 250mg', 'tablets', 'Pneumonia', 60, 200),
+    ('Paracetamol 500mg', 'tablets', 'General', 99, 200),
+    ('Male Condoms', 'pieces', 'Family Planning', 99, 200),
+    ('Combined Oral Contraceptive', 'cycles', 'Family Planning', 12, 40),
+    ('Progestin-only Pill', 'cycles', 'Family Planning', 12, 40),
+    ('Pregnancy Test Strip', 'strips', 'Maternal Health', 30, 60),
+    ('Iron and Folic Acid', 'tablets', 'Maternal Health', 90, 200),
+    ('Chlorhexidine Gel 7.1%', 'tubes', 'Newborn Care', 10, 30),
+    ('Albendazole 400mg', 'tablets', 'Deworming', 50, 150),
+    ('Vitamin A 200,000 IU', 'capsules', 'Nutrition', 50, 150),
+    ('Ready-to-use Therapeutic Food', 'sachets', 'Nutrition', 90, 200),
+    ('MUAC Tape', 'pieces', 'Nutrition', 10, 20),
+    ('Gauze Swabs', 'packets', 'First Aid', 20, 60),
+    ('Crepe Bandage', 'rolls', 'First Aid', 10, 30),
+    ('Povidone Iodine 10%', 'bottles', 'First Aid', 5, 15),
+    ('Examination Gloves', 'pairs', 'Supplies', 99, 200),
+    ('Water Treatment Tablets', 'tablets', 'WASH', 99, 200),
+    ('HIV Self-Test Kit', 'kits', 'HIV', 10, 30),
+    ('TB Sputum Container', 'pieces', 'TB', 20, 60),
+]
+
+USERNAME_PREFIX = 'load_'
+
+# Columns written for each generated row, besides the request id
+REQUEST_COLUMNS = [
+    'requester_id', 'supervisor_id', 'approver_id', 'commodity_id', 'quantity_requested', 'quantity_approved',
+    'status', 'reason_for_request', 'rejection_reason', 'notes',
+    'created_at', 'request_date', 'approved_at', 'delivered_at', 'updated_at',
+]
+LOG_COLUMNS = ['action', 'performed_by_id', 'details', 'timestamp']
+
+
+def copy_row(values):
+    """Format one row for COPY ... FROM STDIN in PostgreSQL's text format"""
+    fields = []
+    for value in values:
+        if value is None:
+            fields.append('\\N')
+            continue
+        if isinstance(value, dict):
+            value = json.dumps(value)
+        elif isinstance(value, datetime):
+            value = value.isoformat()
+        fields.append(
+            str(value).replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+        )
+    return '\t'.join(fields) + '\n'
+
+
+@contextmanager
+def explicit_timestamps(*fields):
+    """Let bulk inserts keep the timestamps we generate instead of now()"""
+    saved = [(field, field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+class Command(BaseCommand):
+    help = "Bulk-generate a deterministic production-scale dataset of CHAs, CHWs, commodities and requests"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chas', type=int, default=20, help="Number of CHAs")
+        parser.add_argument('--chws-per-cha', type=int, default=20, help="CHWs supervised by each CHA")
+        parser.add_argument('--commodities', type=int, default=len(CATALOG), help="Size of the commodity catalog")
+        parser.add_argument('--requests', type=int, default=100000, help="Total commodity requests")
+        parser.add_argument('--months', type=int, default=12, help="Months of history to spread requests over")
+        parser.add_argument('--end-date', help="Last day of generated history, YYYY-MM-DD (default: today)")
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--password', default='password', help="Password of every generated user")
+        parser.add_argument('--clear', action='store_true', help="Delete previously generated data first")
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        started = time.monotonic()
+
+        if options['end_date']:
+            end = datetime.strptime(options['end_date'], '%Y-%m-%d')
+            self.end = timezone.make_aware(end.replace(hour=23, minute=59))
+        else:
+            self.end = timezone.now()
+        self.days = options['months'] * 30
+        # Requests are spread over the earlier part of each day, never into the day before
+        local_end = timezone.localtime(self.end)
+        self.spread = max(1, min(36000, local_end.hour * 3600 + local_end.minute * 60 + local_end.second))
+
+        if options['clear']:
+            self.clear()
+        if User.objects.filter(username__startswith=USERNAME_PREFIX).exists():
+            raise CommandError("Generated data already exists, run with --clear to replace it")
+
+        commodities = self.create_commodities(options['commodities'])
+        chas, chws = self.create_users(options['chas'], options['chws_per_cha'], options['password'], options['seed'])
+        self.stdout.write(f"Created {len(chas)} CHAs, {len(chws)} CHWs and {len(commodities)} commodities")
+
+        requests, logs = self.create_requests(chws, commodities, options['requests'])
+        self.stdout.write(f"Created {requests} requests and {logs} request logs")
+
+        call_command('reconcile_ledger', '--rebuild', stdout=self.stdout)
+        call_command('backfill_rollups', stdout=self.stdout)
+        self.stdout.write(self.style.SUCCESS(f"Seeded in {time.monotonic() - started:.1f}s"))
+
+    def clear(self):
+        users = User.objects.filter(username__startswith=USERNAME_PREFIX)
+        requests = CommodityRequest.objects.filter(requester__in=users)
+        # Plain DELETEs: per-row signals would take hours at this volume and the
+        # derived tables are rebuilt after seeding anyway
+        with transaction.atomic():
+            RequestLog.objects.filter(request__in=requests)._raw_delete(RequestLog.objects.db)
+            AllocationLedger.objects.filter(requester__in=users)._raw_delete(AllocationLedger.objects.db)
+            RequestDailyRollup.objects.filter(requester__in=users)._raw_delete(RequestDailyRollup.objects.db)
+            requests._raw_delete(CommodityRequest.objects.db)
+            users.delete()
+        self.stdout.write("Cleared previously generated data")
+
+    def create_commodities(self, count):
+        catalog = list(CATALOG[:count])
+        for i in range(len(catalog), count):
+            catalog.append((f'Commodity {i + 1:03d}', 'pieces', 'Other', 99, 200))
+
+        # Reuse catalog entries that already exist so repeated runs line up
+        existing = {c.name: c for c in Commodity.objects.filter(name__in=[entry[0] for entry in catalog])}
+        Commodity.objects.bulk_create([
+            Commodity(
+                name=name,
+                unit_of_measure=unit,
+                category=category,
+                max_quantity_per_request=per_request,
+                max_monthly_allocation=monthly,
+            )
+            for name, unit, category, per_request, monthly in catalog if name not in existing
+        ])
+        return list(Commodity.objects.filter(name__in=[entry[0] for entry in catalog]).order_by('name'))
+
+    def create_users(self, cha_count, chws_per_cha, password, seed):
+        # A fixed salt keeps the generated rows identical for a given seed
+        password = make_password(password, salt=f'seedload{seed}')
+        chas = User.objects.bulk_create(
+            [
+                User(
+                    username=f'{USERNAME_PREFIX}cha_{i:05d}',
+                    first_name='CHA',
+                    last_name=f'{i:05d}',
+                    role='CHA',
+                    password=password,
+                    location=f'Ward {i % 50:02d}',
+                )
+                for i in range(cha_count)
+            ],
+            batch_size=self.batch_size
+        )
+        chws = User.objects.bulk_create(
+            [
+                User(
+                    username=f'{USERNAME_PREFIX}chw_{i:05d}_{j:03d}',
+                    first_name='CHW',
+                    last_name=f'{i:05d}-{j:03d}',
+                    role='CHW',
+                    password=password,
+                    supervisor=cha,
+                    location=cha.location,
+                )
+                for i, cha in enumerate(chas)
+                for j in range(chws_per_cha)
+            ],
+            batch_size=self.batch_size
+        )
+        return chas, chws
+
+    def generate_requests(self, chws, commodities, total):
+        """Yield (request, [logs]) column dicts, at most one request per CHW, commodity and day"""
+        rng = self.rng
+        slots = self.days * len(commodities)
+        per_chw, extra = divmod(total, len(chws))
+        if per_chw + (1 if extra else 0) > slots:
+            raise CommandError(
+                f"{total} requests do not fit {len(chws)} CHWs x {len(commodities)} commodities x "
+                f"{self.days} days at one request per commodity per day"
+            )
+
+        for index, chw in enumerate(chws):
+            count = per_chw + (1 if index < extra else 0)
+            allocated = {}
+            for slot in sorted(rng.sample(range(slots), count)):
+                day, commodity = divmod(slot, len(commodities))
+                commodity = commodities[commodity]
+                created_at = self.end - timedelta(days=self.days - 1 - day, seconds=rng.randrange(self.spread))
+                quantity = rng.randint(1, commodity.max_quantity_per_request)
+                age = (self.end - created_at).days
+
+                # Older requests have been dealt with, recent ones are still in the queue
+                roll = rng.random()
+                if (age < 3 and roll < 0.7) or (age < 14 and roll < 0.2):
+                    status = 'PENDING'
+                elif roll < 0.15:
+                    status = 'REJECTED'
+                elif age > 7 and roll < 0.85:
+                    status = 'DELIVERED'
+                else:
+                    status = 'APPROVED'
+
+                quantity_approved = None
+                if status in ('APPROVED', 'DELIVERED'):
+                    quantity_approved = rng.randint(max(1, quantity // 2), quantity)
+                    key = (commodity.pk, month_start(created_at))
+                    if allocated.get(key, 0) + quantity_approved > commodity.max_monthly_allocation:
+                        status, quantity_approved = 'REJECTED', None
+                    else:
+                        allocated[key] = allocated.get(key, 0) + quantity_approved
+
+                request = {
+                    'requester_id': chw.pk,
+                    'supervisor_id': chw.supervisor_id,
+                    'approver_id': chw.supervisor_id,
+                    'commodity_id': commodity.pk,
+                    'quantity_requested': quantity,
+                    'quantity_approved': quantity_approved,
+                    'status': status,
+                    'reason_for_request': 'Restocking' if rng.random() < 0.8 else 'Outbreak response',
+                    'rejection_reason': '',
+                    'notes': '',
+                    'created_at': created_at,
+                    'request_date': timezone.localdate(created_at),
+                    'approved_at': None,
+                    'delivered_at': None,
+                    'updated_at': created_at,
+                }
+                logs = [{
+                    'action': 'CREATED',
+                    'performed_by_id': chw.pk,
+                    'details': {'quantity_requested': quantity},
+                    'timestamp': created_at,
+                }]
+                if status != 'PENDING':
+                    decided_at = created_at + timedelta(hours=rng.randint(1, 72))
+                    request['updated_at'] = decided_at
+                    if status == 'REJECTED':
+                        request['rejection_reason'] = 'Insufficient stock'
+                    else:
+                        request['approved_at'] = decided_at
+                    logs.append({
+                        'action': 'REJECTED' if status == 'REJECTED' else 'APPROVED',
+                        'performed_by_id': chw.supervisor_id,
+                        'details': {
+                            'old_status': 'PENDING',
+                            'new_status': 'REJECTED' if status == 'REJECTED' else 'APPROVED',
+                            'quantity_approved': quantity_approved,
+                        },
+                        'timestamp': decided_at,
+                    })
+                    if status == 'DELIVERED':
+                        delivered_at = decided_at + timedelta(days=rng.randint(1, 5))
+                        request['delivered_at'] = request['updated_at'] = delivered_at
+                        logs.append({
+                            'action': 'DELIVERED',
+                            'performed_by_id': chw.supervisor_id,
+                            'details': {
+                                'old_status': 'APPROVED',
+                                'new_status': 'DELIVERED',
+                                'quantity_approved': quantity_approved,
+                            },
+                            'timestamp': delivered_at,
+                        })
+                yield request, logs
+
+    def create_requests(self, chws, commodities, total):
+        request_count = log_count = 0
+        batch = []
+        # COPY is an order of magnitude faster than multi-row INSERTs on PostgreSQL
+        flush = self.copy_batch if connection.vendor == 'postgresql' else self.insert_batch
+        timestamp_fields = [
+            CommodityRequest._meta.get_field('created_at'),
+            CommodityRequest._meta.get_field('updated_at'),
+            RequestLog._meta.get_field('timestamp'),
+        ]
+        with explicit_timestamps(*timestamp_fields):
+            for item in self.generate_requests(chws, commodities, total):
+                batch.append(item)
+                if len(batch) >= self.batch_size:
+                    log_count += flush(batch)
+                    request_count += len(batch)
+                    batch = []
+                    self.stdout.write(f"  {request_count}/{total} requests", ending='\r')
+            if batch:
+                log_count += flush(batch)
+                request_count += len(batch)
+        self.stdout.write('')
+        return request_count, log_count
+
+    def insert_batch(self, batch):
+        with transaction.atomic():
+            requests = CommodityRequest.objects.bulk_create(
+                [CommodityRequest(**request) for request, _ in batch]
+            )
+            logs = [
+                RequestLog(request=request, **log)
+                for request, (_, request_logs) in zip(requests, batch)
+                for log in request_logs
+            ]
+            RequestLog.objects.bulk_create(logs)
+        return len(logs)
+
+    def copy_batch(self, batch):
+        request_table = CommodityRequest._meta.db_table
+        with transaction.atomic(), connection.cursor() as cursor:
+            # Generated data can be regenerated, no need to wait for the WAL flush
+            cursor.execute("SET LOCAL synchronous_commit TO OFF")
+            # Reserve ids up front so the log rows can reference their requests
+            cursor.execute(
+                "SELECT nextval(pg_get_serial_sequence(%s, 'id')) FROM generate_series(1, %s)",
+                [request_table, len(batch)]
+            )
+            ids = [row[0] for row in cursor.fetchall()]
+
+            requests, logs = io.StringIO(), io.StringIO()
+            log_count = 0
+            for request_id, (request, request_logs) in zip(ids, batch):
+                requests.write(copy_row([request_id] + [request[column] for column in REQUEST_COLUMNS]))
+                for log in request_logs:
+                    logs.write(copy_row([request_id] + [log[column] for column in LOG_COLUMNS]))
+                log_count += len(request_logs)
+
+            requests.seek(0)
+            logs.seek(0)
+            cursor.copy_expert(
+                f"COPY {request_table} (id, {', '.join(REQUEST_COLUMNS)}) FROM STDIN", requests
+            )
+            cursor.copy_expert(
+                f"COPY {RequestLog._meta.db_table} (request_id, {', '.join(LOG_COLUMNS)}) FROM STDIN", logs
+            )
+        return log_count
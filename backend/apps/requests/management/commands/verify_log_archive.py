@@ -0,0 +1,56 @@
+from collections import Counter
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Sum
+
+from apps.requests.models import RequestLog, RequestLogArchive, RequestLogArchiveMonth, month_bounds
+
+
+class Command(BaseCommand):
+    help = "Check the request log archive against its per-month manifest"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--deep', action='store_true',
+                            help="Also decompress every archive row and check its entries")
+
+    def handle(self, *args, **options):
+        problems = []
+        counts = dict(
+            RequestLogArchive.objects.values('month').annotate(total=Sum('entry_count'))
+            .values_list('month', 'total')
+        )
+        manifests = {manifest.month: manifest for manifest in RequestLogArchiveMonth.objects.all()}
+        for month in sorted(set(counts) | set(manifests)):
+            expected = manifests[month].entry_count if month in manifests else None
+            if expected != counts.get(month, 0):
+                problems.append(
+                    f"{month:%Y-%m}: manifest says {expected} logs, archive holds {counts.get(month, 0)}"
+                )
+            start, end = month_bounds(month)
+            live = RequestLog.objects.filter(timestamp__gte=start, timestamp__lt=end).count()
+            if live:
+                problems.append(f"{month:%Y-%m}: {live} logs still live in an archived month")
+
+        if options['deep']:
+            ids = Counter()
+            for archive in RequestLogArchive.objects.iterator(chunk_size=500):
+                try:
+                    entries = archive.entries()
+                except Exception as exc:
+                    problems.append(f"Archive row {archive.pk}: unreadable ({exc})")
+                    continue
+                if len(entries) != archive.entry_count:
+                    problems.append(
+                        f"Archive row {archive.pk}: {len(entries)} entries, {archive.entry_count} recorded"
+                    )
+                ids.update(entry['id'] for entry in entries)
+            duplicates = [pk for pk, seen in ids.items() if seen > 1]
+            if duplicates:
+                problems.append(f"{len(duplicates)} log ids archived more than once, e.g. {duplicates[:5]}")
+
+        if problems:
+            for problem in problems:
+                self.stderr.write(problem)
+            raise CommandError(f"Log archive check failed with {len(problems)} problem(s)")
+        total = sum(counts.values())
+        self.stdout.write(self.style.SUCCESS(f"Log archive OK: {total} logs in {len(manifests)} months"))
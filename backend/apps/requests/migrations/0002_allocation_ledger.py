@@ -0,0 +1,59 @@
+# Generated by Django 4.2.7 on 2026-10-17 18:40
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Sum
+from django.db.models.functions import TruncMonth
+
+
+def populate_ledger(apps, schema_editor):
+    CommodityRequest = apps.get_model('requests', 'CommodityRequest')
+    AllocationLedger = apps.get_model('requests', 'AllocationLedger')
+    rows = CommodityRequest.objects.filter(
+        status__in=['APPROVED', 'DELIVERED']
+    ).annotate(
+        month=TruncMonth('created_at')
+    ).values('requester_id', 'commodity_id', 'month').annotate(
+        total=Sum('quantity_approved')
+    ).order_by()
+    AllocationLedger.objects.bulk_create(
+        (
+            AllocationLedger(
+                requester_id=row['requester_id'],
+                commodity_id=row['commodity_id'],
+                month=row['month'].date(),
+                quantity_used=row['total'] or 0,
+            )
+            for row in rows.iterator()
+        ),
+        batch_size=5000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('commodities', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('requests', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AllocationLedger',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(help_text='First day of the month')),
+                ('quantity_used', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('commodity', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='allocation_ledger', to='commodities.commodity')),
+                ('requester', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='allocation_ledger', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='allocationledger',
+            constraint=models.UniqueConstraint(fields=('requester', 'commodity', 'month'), name='unique_allocation_ledger_month'),
+        ),
+        migrations.RunPython(populate_ledger, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 4.2.7 on 2026-10-17 18:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('requests', '0002_allocation_ledger'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='commodityrequest',
+            index=models.Index(fields=['requester', 'commodity', 'created_at'], name='request_limits_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='commodityrequest',
+            index=models.Index(fields=['requester', '-created_at'], name='request_requester_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='commodityrequest',
+            index=models.Index(fields=['approver', '-created_at'], name='request_approver_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='commodityrequest',
+            index=models.Index(fields=['-created_at'], name='request_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='commodityrequest',
+            index=models.Index(condition=models.Q(('status', 'PENDING')), fields=['approver', 'created_at'], name='request_pending_queue_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='requestlog',
+            index=models.Index(fields=['request', '-timestamp'], name='requestlog_request_ts_idx'),
+        ),
+    ]
@@ -0,0 +1,70 @@
+# Generated by Django 4.2.7 on 2026-10-17 19:02
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Count, F, Sum
+from django.db.models.functions import Coalesce, TruncDate
+
+
+def populate_rollups(apps, schema_editor):
+    CommodityRequest = apps.get_model('requests', 'CommodityRequest')
+    RequestDailyRollup = apps.get_model('requests', 'RequestDailyRollup')
+    rows = CommodityRequest.objects.values(
+        'commodity_id', 'status', 'requester_id',
+        day=TruncDate('created_at'), supervisor_id=F('requester__supervisor_id'),
+    ).annotate(
+        num_requests=Count('id'),
+        total_requested=Sum('quantity_requested'),
+        total_approved=Coalesce(Sum('quantity_approved'), 0),
+    ).order_by()
+    RequestDailyRollup.objects.bulk_create(
+        (
+            RequestDailyRollup(
+                day=row['day'],
+                commodity_id=row['commodity_id'],
+                status=row['status'],
+                requester_id=row['requester_id'],
+                supervisor_id=row['supervisor_id'],
+                num_requests=row['num_requests'],
+                quantity_requested=row['total_requested'],
+                quantity_approved=row['total_approved'],
+            )
+            for row in rows.iterator()
+        ),
+        batch_size=5000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('commodities', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('requests', '0003_request_query_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RequestDailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(help_text='Day the requests were created')),
+                ('status', models.CharField(choices=[('PENDING', 'Pending Approval'), ('APPROVED', 'Approved'), ('REJECTED', 'Rejected'), ('DELIVERED', 'Delivered')], max_length=10)),
+                ('num_requests', models.IntegerField(default=0)),
+                ('quantity_requested', models.IntegerField(default=0)),
+                ('quantity_approved', models.IntegerField(default=0)),
+                ('commodity', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_rollups', to='commodities.commodity')),
+                ('requester', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='request_rollups', to=settings.AUTH_USER_MODEL)),
+                ('supervisor', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='supervised_request_rollups', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['requester', 'day'], name='rollup_requester_day_idx'), models.Index(fields=['supervisor', 'day'], name='rollup_supervisor_day_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='requestdailyrollup',
+            constraint=models.UniqueConstraint(fields=('day', 'commodity', 'status', 'requester', 'supervisor'), name='unique_request_daily_rollup'),
+        ),
+        migrations.RunPython(populate_rollups, migrations.RunPython.noop),
+    ]
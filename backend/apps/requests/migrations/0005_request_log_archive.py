@@ -0,0 +1,36 @@
+# Generated by Django 4.2.7 on 2026-10-17 19:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('requests', '0004_request_daily_rollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RequestLogArchiveMonth',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(unique=True)),
+                ('entry_count', models.PositiveIntegerField(default=0)),
+                ('archived_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='RequestLogArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('request_id', models.BigIntegerField()),
+                ('month', models.DateField(help_text='First day of the month the logs were written in')),
+                ('entry_count', models.PositiveIntegerField()),
+                ('data', models.BinaryField(help_text='zlib compressed JSON list of log entries')),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['request_id', 'month'], name='logarchive_request_idx'), models.Index(fields=['month'], name='logarchive_month_idx')],
+            },
+        ),
+    ]
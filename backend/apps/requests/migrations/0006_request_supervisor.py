@@ -0,0 +1,36 @@
+# Generated by Django 4.2.7 on 2026-10-17 19:38
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+import django.db.models.deletion
+
+
+def copy_supervisors(apps, schema_editor):
+    CommodityRequest = apps.get_model('requests', 'CommodityRequest')
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split('.'))
+    CommodityRequest.objects.update(supervisor_id=Subquery(
+        User.objects.filter(pk=OuterRef('requester_id')).values('supervisor_id')[:1]
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('requests', '0005_request_log_archive'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='commodityrequest',
+            name='supervisor',
+            field=models.ForeignKey(blank=True, limit_choices_to={'role': 'CHA'}, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='supervised_requests', to=settings.AUTH_USER_MODEL),
+        ),
+        # Before the index, so it is built once over the filled column
+        migrations.RunPython(copy_supervisors, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='commodityrequest',
+            index=models.Index(fields=['supervisor', '-created_at'], name='request_supervisor_recent_idx'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 4.2.7 on 2026-10-17 19:43
+
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import TruncDate
+import django.utils.timezone
+
+
+def fill_request_dates(apps, schema_editor):
+    CommodityRequest = apps.get_model('requests', 'CommodityRequest')
+    CommodityRequest.objects.update(request_date=TruncDate('created_at'))
+    duplicates = CommodityRequest.objects.filter(status__in=['PENDING', 'APPROVED']).values(
+        'requester', 'commodity', 'request_date'
+    ).annotate(count=Count('id')).filter(count__gt=1).order_by()
+    if duplicates.exists():
+        raise RuntimeError(
+            f"{duplicates.count()} requester/commodity/day groups have more than one pending or approved "
+            "request; reject the extra ones before adding the one-per-day constraint"
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('requests', '0006_request_supervisor'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='commodityrequest',
+            name='request_date',
+            field=models.DateField(default=django.utils.timezone.localdate, editable=False),
+        ),
+        migrations.RunPython(fill_request_dates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='commodityrequest',
+            constraint=models.UniqueConstraint(condition=models.Q(('status__in', ['PENDING', 'APPROVED'])), fields=('requester', 'commodity', 'request_date'), name='unique_daily_request'),
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 4.2.7 on 2026-10-17 20:06
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('requests', '0007_request_date'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SyncTombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(choices=[('request', 'Commodity request'), ('commodity', 'Commodity')], max_length=10)),
+                ('object_id', models.BigIntegerField()),
+                ('requester_id', models.BigIntegerField(blank=True, null=True)),
+                ('supervisor_id', models.BigIntegerField(blank=True, null=True)),
+                ('deleted_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='commodityrequest',
+            index=models.Index(fields=['requester', 'updated_at', 'id'], name='request_requester_sync_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='commodityrequest',
+            index=models.Index(fields=['supervisor', 'updated_at', 'id'], name='request_supervisor_sync_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='commodityrequest',
+            index=models.Index(fields=['updated_at', 'id'], name='request_sync_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='synctombstone',
+            index=models.Index(fields=['requester_id', 'deleted_at', 'id'], name='tombstone_requester_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='synctombstone',
+            index=models.Index(fields=['supervisor_id', 'deleted_at', 'id'], name='tombstone_supervisor_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='synctombstone',
+            index=models.Index(fields=['deleted_at', 'id'], name='tombstone_deleted_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='synctombstone',
+            index=models.Index(condition=models.Q(('model', 'commodity')), fields=['deleted_at', 'id'], name='tombstone_commodity_idx'),
+        ),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 4.2.7 on 2026-10-17 20:27
+
+import apps.requests.models
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import Coalesce, TruncDate
+
+
+def rebuild_unsupervised_rollups(apps, schema_editor):
+    """Recompute the rows without a supervisor, which could be duplicated, and drop empty rows"""
+    CommodityRequest = apps.get_model('requests', 'CommodityRequest')
+    RequestDailyRollup = apps.get_model('requests', 'RequestDailyRollup')
+    RequestDailyRollup.objects.filter(num_requests__lte=0).delete()
+    RequestDailyRollup.objects.filter(supervisor__isnull=True).delete()
+    rows = CommodityRequest.objects.filter(supervisor__isnull=True).values(
+        'commodity_id', 'status', 'requester_id', day=TruncDate('created_at'),
+    ).annotate(
+        num_requests=Count('id'),
+        total_requested=Sum('quantity_requested'),
+        total_approved=Coalesce(Sum('quantity_approved'), 0),
+    ).order_by()
+    RequestDailyRollup.objects.bulk_create(
+        (
+            RequestDailyRollup(
+                day=row['day'],
+                commodity_id=row['commodity_id'],
+                status=row['status'],
+                requester_id=row['requester_id'],
+                supervisor_id=None,
+                num_requests=row['num_requests'],
+                quantity_requested=row['total_requested'],
+                quantity_approved=row['total_approved'],
+            )
+            for row in rows.iterator()
+        ),
+        batch_size=5000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('requests', '0008_sync_feed'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='requestdailyrollup',
+            name='unique_request_daily_rollup',
+        ),
+        migrations.RunPython(rebuild_unsupervised_rollups, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='requestdailyrollup',
+            constraint=models.UniqueConstraint(models.F('day'), models.F('commodity'), models.F('status'), models.F('requester'), apps.requests.models.CoalescedSupervisor(), name='unique_request_daily_rollup'),
+        ),
+    ]
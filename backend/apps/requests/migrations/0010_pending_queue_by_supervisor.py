@@ -0,0 +1,21 @@
+# Generated by Django 4.2.7 on 2026-10-17 20:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('requests', '0009_rollup_null_supervisor'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='commodityrequest',
+            name='request_pending_queue_idx',
+        ),
+        migrations.AddIndex(
+            model_name='commodityrequest',
+            index=models.Index(condition=models.Q(('status', 'PENDING')), fields=['supervisor', 'created_at'], name='request_pending_queue_idx'),
+        ),
+    ]
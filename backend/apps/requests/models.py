@@ -1,11 +1,71 @@
-from django.db import models
+import json
+import zlib
+
+from django.db import connections, models, router, transaction
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import DEFERRED, Count, Sum
+from django.db.models.functions import Coalesce, TruncDate
+from django.core.exceptions import ValidationError
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.contrib.auth import get_user_model
 from django.utils import timezone
-from datetime import date
+from django.utils.dateparse import parse_datetime
+from datetime import datetime, time, timedelta
 
 User = get_user_model()
 
+# Statuses whose approved quantity counts towards the monthly allocation
+ALLOCATED_STATUSES = ['APPROVED', 'DELIVERED']
+# Statuses that block another request for the same commodity on the same day
+DAILY_LIMIT_STATUSES = ['PENDING', 'APPROVED']
+
+DAILY_LIMIT_MESSAGE = (
+    "You have already requested {commodity} today. Only one request per commodity per day is allowed."
+)
+
+
+class AllocationLimitExceeded(ValidationError):
+    """An approval would take a CHW over a commodity's monthly allocation"""
+
+    def __init__(self, remaining):
+        self.remaining = max(remaining, 0)
+        super().__init__(f"Monthly limit exceeded. Only {self.remaining} more can be approved this month.")
+
+
+def month_start(value=None):
+    """First day of the month containing the given datetime (default: now)"""
+    value = timezone.localtime(value) if value else timezone.localtime()
+    return value.date().replace(day=1)
+
+
+def day_bounds(value=None):
+    """[start, end) datetimes of the day containing the given datetime (default: now).
+
+    Filtering on this range instead of ``created_at__date`` lets the database
+    use the created_at indexes.
+    """
+    value = timezone.localtime(value) if value else timezone.localtime()
+    start = value.replace(hour=0, minute=0, second=0, microsecond=0)
+    return start, start + timedelta(days=1)
+
+
+def month_bounds(month):
+    """[start, end) datetimes of the month starting on the given date"""
+    start = timezone.make_aware(datetime.combine(month, time.min))
+    end = timezone.make_aware(datetime.combine((month + timedelta(days=31)).replace(day=1), time.min))
+    return start, end
+
+
+class CommodityRequestQuerySet(models.QuerySet):
+    def for_user(self, user):
+        """Requests a user's role can see: a CHW their own, a CHA those of the CHWs they supervise"""
+        if user.role == 'CHW':
+            return self.filter(requester=user)
+        if user.role == 'CHA':
+            return self.filter(supervisor=user)
+        return self.all()
+
+
 class CommodityRequest(models.Model):
     STATUS_CHOICES = [
         ('PENDING', 'Pending Approval'),
@@ -28,6 +88,15 @@ class CommodityRequest(models.Model):
         related_name='approved_requests',
         limit_choices_to={'role': 'CHA'}
     )
+    # Copy of requester.supervisor, so CHA scoping needs no join (see reassign_supervisor())
+    supervisor = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='supervised_requests',
+        limit_choices_to={'role': 'CHA'}
+    )
     commodity = models.ForeignKey(
         'commodities.Commodity', 
         on_delete=models.CASCADE,
@@ -48,21 +117,96 @@ class CommodityRequest(models.Model):
     
     # Timestamps
     created_at = models.DateTimeField(auto_now_add=True)
+    # Local day of created_at, for the one-per-commodity-per-day constraint
+    request_date = models.DateField(default=timezone.localdate, editable=False)
     approved_at = models.DateTimeField(null=True, blank=True)
     delivered_at = models.DateTimeField(null=True, blank=True)
     updated_at = models.DateTimeField(auto_now=True)
     
 
+    objects = CommodityRequestQuerySet.as_manager()
+
     def __str__(self):
         return f"{self.requester.username} - {self.commodity.name} ({self.quantity_requested}) - {self.status}"
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Daily and monthly limit checks
+            models.Index(fields=['requester', 'commodity', 'created_at'], name='request_limits_idx'),
+            # Role-scoped listings, newest first
+            models.Index(fields=['requester', '-created_at'], name='request_requester_recent_idx'),
+            models.Index(fields=['approver', '-created_at'], name='request_approver_recent_idx'),
+            models.Index(fields=['supervisor', '-created_at'], name='request_supervisor_recent_idx'),
+            models.Index(fields=['-created_at'], name='request_recent_idx'),
+            # Changes feed: rows changed since a point, per role scope
+            models.Index(fields=['requester', 'updated_at', 'id'], name='request_requester_sync_idx'),
+            models.Index(fields=['supervisor', 'updated_at', 'id'], name='request_supervisor_sync_idx'),
+            models.Index(fields=['updated_at', 'id'], name='request_sync_idx'),
+            # CHA approval queue, oldest first
+            models.Index(
+                fields=['supervisor', 'created_at'],
+                name='request_pending_queue_idx',
+                condition=models.Q(status='PENDING')
+            ),
+        ]
+        constraints = [
+            # The daily limit, also when two submissions race past the check
+            models.UniqueConstraint(
+                fields=['requester', 'commodity', 'request_date'],
+                condition=models.Q(status__in=DAILY_LIMIT_STATUSES),
+                name='unique_daily_request'
+            ),
+        ]
+
+    # Values as last loaded from / written to the database, used to detect transitions
+    # (DEFERRED until read for instances loaded without them)
+    SNAPSHOT_FIELDS = ('status', 'quantity_requested', 'quantity_approved')
+    _loaded_status = None
+    _loaded_quantity_requested = None
+    _loaded_quantity_approved = None
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        for name in cls.SNAPSHOT_FIELDS:
+            setattr(instance, f'_loaded_{name}', instance.__dict__.get(name, DEFERRED))
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None):
+        # Also called to load a deferred field on first access
+        super().refresh_from_db(using, fields)
+        for name in self.SNAPSHOT_FIELDS:
+            if (fields is None or name in fields) and name in self.__dict__:
+                setattr(self, f'_loaded_{name}', self.__dict__[name])
+
+    def load_snapshot(self):
+        """Read the snapshot values still DEFERRED from the database, in one query"""
+        missing = [name for name in self.SNAPSHOT_FIELDS if getattr(self, f'_loaded_{name}') is DEFERRED]
+        if not missing:
+            return
+        values = type(self)._base_manager.using(self._state.db).filter(pk=self.pk).values(*missing).first()
+        for name in missing:
+            # None for a row deleted meanwhile, which save() inserts again
+            setattr(self, f'_loaded_{name}', values[name] if values else None)
+
+    @staticmethod
+    def allocated_quantity(status, quantity_approved):
+        """Quantity a request in the given state takes from the monthly allocation"""
+        if status in ALLOCATED_STATUSES:
+            return quantity_approved or 0
+        return 0
+
+    @property
+    def status_changed(self):
+        return self._loaded_status != self.status
 
     def save(self, *args, **kwargs):
         # Auto-assign approver based on CHW's supervisor
-        if not self.approver and self.requester.supervisor:
-            self.approver = self.requester.supervisor
+        if self._state.adding and not self.supervisor_id:
+            self.supervisor_id = self.requester.supervisor_id
+        if not self.approver_id and self.supervisor_id:
+            self.approver_id = self.supervisor_id
         
         # Set approval timestamp
         if self.status == 'APPROVED' and not self.approved_at:
@@ -71,38 +215,110 @@ class CommodityRequest(models.Model):
         # Set delivery timestamp
         if self.status == 'DELIVERED' and not self.delivered_at:
             self.delivered_at = timezone.now()
+        
+        adding = self._state.adding
+        with transaction.atomic():
+            if not adding:
+                self.load_snapshot()
+            super().save(*args, **kwargs)
             
-        super().save(*args, **kwargs)
+            # Keep the monthly allocation ledger in step with approvals
+            delta = (
+                self.allocated_quantity(self.status, self.quantity_approved)
+                - self.allocated_quantity(self._loaded_status, self._loaded_quantity_approved)
+            )
+            if delta:
+                AllocationLedger.apply_delta(
+                    self.requester_id, self.commodity_id, month_start(self.created_at), delta,
+                    limit=self.commodity.max_monthly_allocation if delta > 0 else None
+                )
+
+            # Move the request between daily rollup buckets
+            loaded = (self._loaded_status, self._loaded_quantity_requested, self._loaded_quantity_approved)
+            if adding or loaded != (self.status, self.quantity_requested, self.quantity_approved):
+                deltas = {}
+                RequestDailyRollup.add(deltas, self)
+                if not adding:
+                    RequestDailyRollup.add(deltas, self, *loaded, sign=-1)
+                RequestDailyRollup.apply_deltas(deltas)
+        self._loaded_status = self.status
+        self._loaded_quantity_requested = self.quantity_requested
+        self._loaded_quantity_approved = self.quantity_approved
+
+    @classmethod
+    def reassign_supervisor(cls, requester_id, supervisor_id):
+        """Move a CHW's requests to their new supervisor.
+
+        Their requests, the approval of the pending ones and their rollup rows
+        all follow the CHW to the new CHA. The requests count as changed for
+        the changes feed, and the previous CHA gets tombstones for them.
+        """
+        with transaction.atomic():
+            requests = cls.objects.filter(requester_id=requester_id)
+            previous = list(requests.exclude(supervisor_id=supervisor_id).values_list('id', 'supervisor_id'))
+            now = timezone.now()
+            requests.update(supervisor_id=supervisor_id, updated_at=now)
+            requests.filter(status='PENDING').update(approver_id=supervisor_id)
+            SyncTombstone.objects.bulk_create(
+                SyncTombstone(model='request', object_id=pk, supervisor_id=previous_id, deleted_at=now)
+                for pk, previous_id in previous if previous_id
+            )
+            RequestDailyRollup.rebuild_requester(requester_id)
+
+    @classmethod
+    def requested_today(cls, requester, commodity):
+        """Requests that count towards the one-per-commodity-per-day limit"""
+        return cls.objects.filter(
+            requester=requester,
+            commodity=commodity,
+            request_date=timezone.localdate(),
+            status__in=DAILY_LIMIT_STATUSES
+        )
+
+    @classmethod
+    def daily_slots_taken(cls, requests):
+        """Active requests holding the (requester, commodity, request date) slots of the given ones.
+
+        Maps each slot to the ids of the requests holding it, the given
+        requests themselves left out.
+        """
+        requests = list(requests)
+        if not requests:
+            return {}
+        slots = {(obj.requester_id, obj.commodity_id, obj.request_date) for obj in requests}
+        rows = cls.objects.filter(
+            requester_id__in={slot[0] for slot in slots},
+            commodity_id__in={slot[1] for slot in slots},
+            request_date__in={slot[2] for slot in slots},
+            status__in=DAILY_LIMIT_STATUSES,
+        ).exclude(pk__in=[obj.pk for obj in requests]).values_list('requester_id', 'commodity_id', 'request_date', 'pk')
+        taken = {}
+        for requester_id, commodity_id, request_date, pk in rows:
+            if (requester_id, commodity_id, request_date) in slots:
+                taken.setdefault((requester_id, commodity_id, request_date), set()).add(pk)
+        return taken
+
+    @classmethod
+    def commodities_requested_today(cls, requester, commodity_ids):
+        """Ids among commodity_ids the requester is already at their daily limit for"""
+        return set(cls.objects.filter(
+            requester=requester,
+            commodity_id__in=commodity_ids,
+            request_date=timezone.localdate(),
+            status__in=DAILY_LIMIT_STATUSES
+        ).values_list('commodity_id', flat=True))
 
     def clean(self):
-        from django.core.exceptions import ValidationError
-        
         # Check daily limit (one request per commodity per day)
         if self.pk is None:  # New request
-            today = date.today()
-            existing_request = CommodityRequest.objects.filter(
-                requester=self.requester,
-                commodity=self.commodity,
-                created_at__date=today,
-                status__in=['PENDING', 'APPROVED']
-            ).exists()
+            existing_request = CommodityRequest.requested_today(self.requester, self.commodity).exists()
             
             if existing_request:
-                raise ValidationError(
-                    f'You have already requested {self.commodity.name} today. Only one request per commodity per day is allowed.'
-                )
+                raise ValidationError(DAILY_LIMIT_MESSAGE.format(commodity=self.commodity.name))
         
         # Check monthly limit
         if self.pk is None:  # New request
-            current_month = timezone.now().replace(day=1)
-            monthly_total = CommodityRequest.objects.filter(
-                requester=self.requester,
-                commodity=self.commodity,
-                created_at__gte=current_month,
-                status__in=['APPROVED', 'DELIVERED']
-            ).aggregate(
-                total=models.Sum('quantity_approved')
-            )['total'] or 0
+            monthly_total = AllocationLedger.used(self.requester, self.commodity)
             
             if monthly_total + self.quantity_requested > self.commodity.max_monthly_allocation:
                 remaining = self.commodity.max_monthly_allocation - monthly_total
@@ -116,6 +332,311 @@ class CommodityRequest(models.Model):
                 f'Maximum {self.commodity.max_quantity_per_request} {self.commodity.name} allowed per request.'
             )
 
+class AllocationLedger(models.Model):
+    """Approved quantity per CHW, commodity and month.
+
+    Maintained in the same transaction as the request changes that affect it,
+    so monthly limits can be checked with a single row lookup.
+    """
+    requester = models.ForeignKey(User, on_delete=models.CASCADE, related_name='allocation_ledger')
+    commodity = models.ForeignKey(
+        'commodities.Commodity', 
+        on_delete=models.CASCADE,
+        related_name='allocation_ledger'
+    )
+    month = models.DateField(help_text="First day of the month")
+    quantity_used = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.requester} - {self.commodity} {self.month:%Y-%m}: {self.quantity_used}"
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['requester', 'commodity', 'month'], name='unique_allocation_ledger_month'
+            ),
+        ]
+
+    @classmethod
+    def used(cls, requester, commodity, month=None):
+        """Quantity of a commodity allocated to a CHW in a month (default: current)"""
+        return cls.objects.filter(
+            requester=requester,
+            commodity=commodity,
+            month=month or month_start(),
+        ).values_list('quantity_used', flat=True).first() or 0
+
+    @classmethod
+    def usage_by_commodity(cls, requester, month=None):
+        """Mapping of commodity id to quantity allocated to a CHW in a month"""
+        return dict(cls.objects.filter(
+            requester=requester,
+            month=month or month_start(),
+        ).values_list('commodity_id', 'quantity_used'))
+
+    @classmethod
+    def apply_delta(cls, requester_id, commodity_id, month, delta, create=True, limit=None):
+        """Atomically add delta to a ledger row, creating it if needed.
+
+        With a limit the row may not go over it: the UPDATE only matches while
+        there is room and holds the row lock until commit, so concurrent
+        approvals are checked one after the other. AllocationLimitExceeded is
+        raised when there is no room.
+        """
+        lookup = {'requester_id': requester_id, 'commodity_id': commodity_id, 'month': month}
+        if limit is not None:
+            with_room = cls.objects.filter(**lookup, quantity_used__lte=limit - delta)
+            updated = with_room.update(quantity_used=models.F('quantity_used') + delta, updated_at=timezone.now())
+            if not updated:
+                # No room or no row yet; the row has to exist for its lock to order concurrent approvals
+                cls.objects.bulk_create([cls(**lookup)], ignore_conflicts=True)
+                updated = with_room.update(quantity_used=models.F('quantity_used') + delta, updated_at=timezone.now())
+            if not updated:
+                raise AllocationLimitExceeded(limit - cls.used(requester_id, commodity_id, month))
+            return
+        updated = cls.objects.filter(**lookup).update(
+            quantity_used=models.F('quantity_used') + delta,
+            updated_at=timezone.now()
+        )
+        if not updated and create:
+            entry, created = cls.objects.get_or_create(**lookup, defaults={'quantity_used': delta})
+            if not created:
+                cls.objects.filter(pk=entry.pk).update(
+                    quantity_used=models.F('quantity_used') + delta,
+                    updated_at=timezone.now()
+                )
+
+    @classmethod
+    def lock(cls, keys):
+        """Lock the rows of (requester_id, commodity_id, month) keys, creating missing ones.
+
+        Returns them keyed the same way. Rows are locked in key order, so
+        transactions locking overlapping keys cannot deadlock. Must run inside
+        a transaction.
+        """
+        keys = set(keys)
+        if not keys:
+            return {}
+        cls.objects.bulk_create(
+            [
+                cls(requester_id=requester_id, commodity_id=commodity_id, month=month)
+                for requester_id, commodity_id, month in keys
+            ],
+            ignore_conflicts=True
+        )
+        entries = cls.objects.select_for_update().filter(
+            requester_id__in={key[0] for key in keys},
+            commodity_id__in={key[1] for key in keys},
+            month__in={key[2] for key in keys},
+        ).order_by('requester_id', 'commodity_id', 'month')
+        return {
+            key: entry for entry in entries
+            if (key := (entry.requester_id, entry.commodity_id, entry.month)) in keys
+        }
+
+    @classmethod
+    def apply_deltas(cls, deltas, entries=None):
+        """Apply many deltas keyed by (requester_id, commodity_id, month) in three queries.
+
+        The rows are locked (see lock(), or pass the entries it returned) and
+        rewritten with a single bulk update. Must run inside a transaction.
+        """
+        deltas = {key: delta for key, delta in deltas.items() if delta}
+        if not deltas:
+            return
+        if entries is None or not deltas.keys() <= entries.keys():
+            entries = cls.lock(deltas)
+        now = timezone.now()
+        changed = []
+        for key, delta in deltas.items():
+            entry = entries[key]
+            entry.quantity_used += delta
+            entry.updated_at = now
+            changed.append(entry)
+        cls.objects.bulk_update(changed, ['quantity_used', 'updated_at'])
+
+class CoalescedSupervisor(Coalesce):
+    """COALESCE(supervisor_id, 0), the key of rollup rows without a supervisor.
+
+    A class of its own rather than Coalesce(..., output_field=...): field
+    instances in an expression's keyword arguments never compare equal, so
+    makemigrations would see the constraint as changed on every run.
+    """
+    output_field = models.BigIntegerField()
+
+    def __init__(self):
+        super().__init__('supervisor', 0)
+
+
+class RequestDailyRollup(models.Model):
+    """Request counts and quantities per day, commodity, status, requester and supervisor.
+
+    Maintained in the same transaction as the request changes that affect it;
+    analytics read these rows instead of aggregating CommodityRequest.
+    ``backfill_rollups`` rebuilds it from the requests.
+    """
+    day = models.DateField(help_text="Day the requests were created")
+    commodity = models.ForeignKey(
+        'commodities.Commodity', 
+        on_delete=models.CASCADE,
+        related_name='daily_rollups'
+    )
+    status = models.CharField(max_length=10, choices=CommodityRequest.STATUS_CHOICES)
+    requester = models.ForeignKey(User, on_delete=models.CASCADE, related_name='request_rollups')
+    supervisor = models.ForeignKey(
+        User, 
+        on_delete=models.SET_NULL, 
+        null=True, 
+        blank=True,
+        related_name='supervised_request_rollups'
+    )
+    num_requests = models.IntegerField(default=0)
+    quantity_requested = models.IntegerField(default=0)
+    quantity_approved = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.day} {self.commodity} {self.status} {self.requester}: {self.num_requests}"
+
+    class Meta:
+        constraints = [
+            # On the coalesced supervisor: NULLs never conflict, so rows of
+            # requesters without a supervisor would be inserted over and over
+            models.UniqueConstraint(
+                'day', 'commodity', 'status', 'requester',
+                CoalescedSupervisor(),
+                name='unique_request_daily_rollup'
+            ),
+        ]
+        indexes = [
+            # CHW and CHA scoped analytics over a date range
+            models.Index(fields=['requester', 'day'], name='rollup_requester_day_idx'),
+            models.Index(fields=['supervisor', 'day'], name='rollup_supervisor_day_idx'),
+        ]
+
+    KEY_FIELDS = ('day', 'commodity_id', 'status', 'requester_id', 'supervisor_id')
+    VALUE_FIELDS = ('num_requests', 'quantity_requested', 'quantity_approved')
+
+    @classmethod
+    def scoped(cls, user):
+        """Rollup rows covering the requests a user's role can see"""
+        if user.role == 'CHW':
+            return cls.objects.filter(requester=user)
+        if user.role == 'CHA':
+            return cls.objects.filter(supervisor=user)
+        return cls.objects.all()
+
+    @classmethod
+    def from_requests(cls, requests):
+        """Unsaved rollup rows recomputed from a CommodityRequest queryset"""
+        rows = requests.values(
+            'commodity_id', 'status', 'requester_id', 'supervisor_id', day=TruncDate('created_at'),
+        ).annotate(
+            num_requests=Count('id'),
+            total_requested=Sum('quantity_requested'),
+            total_approved=Coalesce(Sum('quantity_approved'), 0),
+        ).order_by()
+        for row in rows.iterator():
+            yield cls(
+                day=row['day'],
+                commodity_id=row['commodity_id'],
+                status=row['status'],
+                requester_id=row['requester_id'],
+                supervisor_id=row['supervisor_id'],
+                num_requests=row['num_requests'],
+                quantity_requested=row['total_requested'],
+                quantity_approved=row['total_approved'],
+            )
+
+    @classmethod
+    def rebuild_requester(cls, requester_id):
+        """Recompute one requester's rows, e.g. after their requests changed supervisor"""
+        existing = cls.objects.filter(requester_id=requester_id)
+        existing._raw_delete(existing.db)
+        cls.objects.bulk_create(cls.from_requests(CommodityRequest.objects.filter(requester_id=requester_id)))
+
+    @staticmethod
+    def add(deltas, request, status=None, quantity_requested=None, quantity_approved=None, sign=1):
+        """Add a request's contribution to deltas, as it is or with the given earlier values"""
+        if status is None:
+            status = request.status
+            quantity_requested = request.quantity_requested
+            quantity_approved = request.quantity_approved
+        key = (
+            timezone.localtime(request.created_at).date(),
+            request.commodity_id,
+            status,
+            request.requester_id,
+            request.supervisor_id,
+        )
+        current = deltas.get(key, (0, 0, 0))
+        deltas[key] = (
+            current[0] + sign,
+            current[1] + sign * (quantity_requested or 0),
+            current[2] + sign * (quantity_approved or 0),
+        )
+
+    @classmethod
+    def apply_deltas(cls, deltas, create=True):
+        """Add (num_requests, quantity_requested, quantity_approved) deltas to their rows.
+
+        Uses a single INSERT ... ON CONFLICT DO UPDATE per batch, which both
+        PostgreSQL and SQLite support. With create=False only existing rows are
+        updated, e.g. while the requester itself is being deleted. Rows left
+        without requests are deleted.
+        """
+        deltas = [(key, values) for key, values in deltas.items() if any(values)]
+        if not create:
+            for key, values in deltas:
+                row = cls.objects.select_for_update().filter(**dict(zip(cls.KEY_FIELDS, key))).first()
+                if row is None:
+                    continue
+                for field, delta in zip(cls.VALUE_FIELDS, values):
+                    setattr(row, field, getattr(row, field) + delta)
+                if row.num_requests > 0:
+                    row.save(update_fields=cls.VALUE_FIELDS)
+                else:
+                    cls.objects.filter(pk=row.pk).delete()
+            return
+
+        connection = connections[router.db_for_write(cls)]
+        quote = connection.ops.quote_name
+        key_columns = [quote(cls._meta.get_field(field).column) for field in cls.KEY_FIELDS]
+        value_columns = [quote(field) for field in cls.VALUE_FIELDS]
+        # The conflict target is the expression of unique_request_daily_rollup
+        conflict_columns = key_columns[:-1] + [f'COALESCE({key_columns[-1]}, 0)']
+        table = quote(cls._meta.db_table)
+        sql = (
+            f"INSERT INTO {table} ({', '.join(key_columns + value_columns)}) "
+            "VALUES {rows} "
+            f"ON CONFLICT ({', '.join(conflict_columns)}) DO UPDATE SET "
+            + ', '.join(f"{column} = {table}.{column} + excluded.{column}" for column in value_columns)
+            + f" RETURNING {quote('id')}, {quote('num_requests')}"
+        )
+        placeholder = '(' + ', '.join(['%s'] * (len(key_columns) + len(value_columns))) + ')'
+        emptied = []
+        with connection.cursor() as cursor:
+            for start in range(0, len(deltas), 100):
+                batch = deltas[start:start + 100]
+                cursor.execute(
+                    sql.format(rows=', '.join([placeholder] * len(batch))),
+                    [param for key, values in batch for param in (*key, *values)]
+                )
+                emptied.extend(pk for pk, num_requests in cursor.fetchall() if num_requests <= 0)
+        if emptied:
+            cls.objects.filter(pk__in=emptied).delete()
+
+    @classmethod
+    def release_supervisor(cls, supervisor_id):
+        """Move a supervisor's rows to no supervisor, merged into the rows already there"""
+        rows = cls.objects.filter(supervisor_id=supervisor_id)
+        deltas = {}
+        for row in rows:
+            key = tuple(getattr(row, field) for field in cls.KEY_FIELDS[:-1]) + (None,)
+            deltas[key] = tuple(getattr(row, field) for field in cls.VALUE_FIELDS)
+        rows._raw_delete(rows.db)
+        cls.apply_deltas(deltas)
+
 class RequestLog(models.Model):
     """Audit log for all request-related actions"""
     ACTION_CHOICES = [
@@ -136,4 +657,149 @@ class RequestLog(models.Model):
         return f"{self.request} - {self.action} by {self.performed_by} at {self.timestamp}"
     
     class Meta:
-        ordering = ['-timestamp']
\ No newline at end of file
+        ordering = ['-timestamp']
+        indexes = [
+            models.Index(fields=['request', '-timestamp'], name='requestlog_request_ts_idx'),
+        ]
+
+class RequestLogArchive(models.Model):
+    """Compressed batch of archived RequestLog rows of one request and month.
+
+    Rows are only ever added: each archival run appends a batch per request
+    and month it moved logs for. ``request_id`` is not a foreign key so the
+    audit trail outlives the request.
+    """
+    request_id = models.BigIntegerField()
+    month = models.DateField(help_text="First day of the month the logs were written in")
+    entry_count = models.PositiveIntegerField()
+    data = models.BinaryField(help_text="zlib compressed JSON list of log entries")
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Request {self.request_id} {self.month:%Y-%m}: {self.entry_count} logs"
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['request_id', 'month'], name='logarchive_request_idx'),
+            models.Index(fields=['month'], name='logarchive_month_idx'),
+        ]
+
+    @staticmethod
+    def encode(logs):
+        """Compress RequestLog instances (with performed_by loaded) into archive data"""
+        entries = [
+            {
+                'id': log.id,
+                'action': log.action,
+                'performed_by': log.performed_by_id,
+                # Names as they were when archived, the user may be gone later
+                'performed_by_first_name': log.performed_by.first_name if log.performed_by else '',
+                'performed_by_last_name': log.performed_by.last_name if log.performed_by else '',
+                'details': log.details,
+                'timestamp': log.timestamp.isoformat(),
+            }
+            for log in logs
+        ]
+        return zlib.compress(json.dumps(entries, cls=DjangoJSONEncoder).encode())
+
+    def entries(self):
+        return json.loads(zlib.decompress(bytes(self.data)))
+
+    def logs(self):
+        """Unsaved RequestLog instances rebuilt from the archive"""
+        logs = []
+        for entry in self.entries():
+            performed_by = None
+            if entry['performed_by']:
+                performed_by = User(
+                    id=entry['performed_by'],
+                    first_name=entry['performed_by_first_name'],
+                    last_name=entry['performed_by_last_name'],
+                )
+            logs.append(RequestLog(
+                id=entry['id'],
+                request_id=self.request_id,
+                action=entry['action'],
+                performed_by=performed_by,
+                details=entry['details'],
+                timestamp=parse_datetime(entry['timestamp']),
+            ))
+        return logs
+
+    def rows(self):
+        """Archived logs as RequestLog.objects.values() rows, with the performer's names"""
+        return [
+            {
+                'id': entry['id'],
+                'action': entry['action'],
+                'performed_by': entry['performed_by'],
+                'performed_by__first_name': entry['performed_by_first_name'],
+                'performed_by__last_name': entry['performed_by_last_name'],
+                'details': entry['details'],
+                'timestamp': parse_datetime(entry['timestamp']),
+            }
+            for entry in self.entries()
+        ]
+
+    @classmethod
+    def logs_for(cls, request_id):
+        """Archived logs of a request, in no particular order"""
+        return [log for archive in cls.objects.filter(request_id=request_id) for log in archive.logs()]
+
+    @classmethod
+    def rows_for(cls, request_id):
+        """Archived log rows of a request, in no particular order"""
+        return [row for archive in cls.objects.filter(request_id=request_id) for row in archive.rows()]
+
+
+class RequestLogArchiveMonth(models.Model):
+    """Manifest of an archived month: how many logs were moved out of RequestLog"""
+    month = models.DateField(unique=True)
+    entry_count = models.PositiveIntegerField(default=0)
+    archived_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.month:%Y-%m}: {self.entry_count} logs archived"
+
+
+class SyncTombstone(models.Model):
+    """A row that left someone's changes feed: deleted, or moved out of their scope.
+
+    The scope is copied like CommodityRequest's: a CHW sees the tombstones of
+    their requests, a CHA those with their supervisor_id and an admin all
+    request tombstones with a requester (the others only left a CHA's scope).
+    Commodity tombstones have neither and are for everyone. Plain ids, so the
+    tombstones outlive the users.
+    """
+    MODELS = [
+        ('request', 'Commodity request'),
+        ('commodity', 'Commodity'),
+    ]
+
+    model = models.CharField(max_length=10, choices=MODELS)
+    object_id = models.BigIntegerField()
+    requester_id = models.BigIntegerField(null=True, blank=True)
+    supervisor_id = models.BigIntegerField(null=True, blank=True)
+    deleted_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"{self.get_model_display()} {self.object_id} deleted at {self.deleted_at}"
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['requester_id', 'deleted_at', 'id'], name='tombstone_requester_idx'),
+            models.Index(fields=['supervisor_id', 'deleted_at', 'id'], name='tombstone_supervisor_idx'),
+            models.Index(fields=['deleted_at', 'id'], name='tombstone_deleted_idx'),
+            models.Index(
+                fields=['deleted_at', 'id'], name='tombstone_commodity_idx', condition=models.Q(model='commodity')
+            ),
+        ]
+
+    @classmethod
+    def for_user(cls, user):
+        everyone = models.Q(model='commodity')
+        if user.role == 'CHW':
+            return cls.objects.filter(everyone | models.Q(requester_id=user.pk))
+        if user.role == 'CHA':
+            return cls.objects.filter(everyone | models.Q(supervisor_id=user.pk))
+        return cls.objects.filter(everyone | models.Q(requester_id__isnull=False))
@@ -0,0 +1,167 @@
+import base64
+import json
+from collections import OrderedDict
+
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework import pagination
+from rest_framework.exceptions import ParseError
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(pagination.BasePagination):
+    """
+    Cursor pagination over a (timestamp, id) key.
+
+    Pages are found with a range predicate on the key instead of OFFSET and no
+    COUNT(*) is run. Clients opt in with ``?paginate=cursor`` (or by sending a
+    ``cursor``); everyone else keeps getting PageNumberPagination pages.
+    The view's ``cursor_ordering`` names the key, e.g. ('-created_at', '-id').
+    A plain list of objects (or values() rows) can be paginated too; it is
+    ordered and filtered in Python.
+    """
+    cursor_query_param = 'cursor'
+    mode_query_param = 'paginate'
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = ('-created_at', '-id')
+    invalid_cursor_message = 'Invalid cursor'
+
+    def __init__(self):
+        self.fallback = None
+
+    def uses_cursor(self, request):
+        return (
+            request.query_params.get(self.mode_query_param) == 'cursor'
+            or self.cursor_query_param in request.query_params
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if not self.uses_cursor(request):
+            self.fallback = pagination.PageNumberPagination()
+            return self.fallback.paginate_queryset(queryset, request, view)
+
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.ordering = getattr(view, 'cursor_ordering', self.ordering)
+        self.cursor = self.decode_cursor(request)
+        reverse = bool(self.cursor and self.cursor['reverse'])
+
+        if isinstance(queryset, list):
+            rows = self.page_from_list(queryset, reverse)
+        else:
+            queryset = queryset.order_by(*self.ordering)
+            if reverse:
+                queryset = queryset.reverse()
+            if self.cursor:
+                queryset = self.filter_after(queryset, self.cursor['position'], reverse)
+            rows = list(queryset[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if reverse:
+            rows.reverse()
+
+        # Going forward there is a previous page whenever we started from a cursor,
+        # going backwards there is always a next page (the one we came from)
+        self.has_next = has_more if not reverse else True
+        self.has_previous = bool(self.cursor) if not reverse else has_more
+        self.page = rows
+        return rows
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return api_settings.PAGE_SIZE
+        return max(1, min(page_size, self.max_page_size))
+
+    def position(self, row):
+        values = []
+        for field in self.ordering:
+            field = field.lstrip('-')
+            value = row[field] if isinstance(row, dict) else getattr(row, field)
+            values.append(value.isoformat() if hasattr(value, 'isoformat') else value)
+        return values
+
+    def filter_after(self, queryset, position, reverse):
+        """Rows strictly after position in the (possibly reversed) ordering"""
+        (time_field, id_field), (time_value, id_value) = self.ordering, position
+        descending = time_field.startswith('-') != reverse
+        time_field, id_field = time_field.lstrip('-'), id_field.lstrip('-')
+        op = 'lt' if descending else 'gt'
+        time_value = parse_datetime(time_value)
+        # (t, id) < (T, ID)  <=>  t <= T and not (t = T and id >= ID), which keeps
+        # a plain range predicate on the indexed timestamp column
+        return queryset.filter(**{f'{time_field}__{op}e': time_value}).exclude(**{
+            time_field: time_value,
+            f'{id_field}__{"g" if descending else "l"}te': id_value,
+        })
+
+    def page_from_list(self, objects, reverse):
+        """Up to page_size + 1 objects after the cursor, like the queryset branch"""
+        (time_field, id_field) = self.ordering
+        descending = time_field.startswith('-') != reverse
+        time_field, id_field = time_field.lstrip('-'), id_field.lstrip('-')
+
+        def key(obj):
+            if isinstance(obj, dict):
+                return (obj[time_field], obj[id_field])
+            return (getattr(obj, time_field), getattr(obj, id_field))
+
+        objects = sorted(objects, key=key, reverse=descending)
+        if self.cursor:
+            time_value, id_value = self.cursor['position']
+            after = (parse_datetime(time_value), id_value)
+            objects = [obj for obj in objects if (key(obj) < after if descending else key(obj) > after)]
+        return objects[:self.page_size + 1]
+
+    def encode_cursor(self, position, reverse):
+        payload = json.dumps({'p': position, 'r': int(reverse)}, separators=(',', ':'))
+        cursor = base64.urlsafe_b64encode(payload.encode()).decode()
+        return replace_query_param(self.base_url, self.cursor_query_param, cursor)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(encoded.encode()).decode())
+            time_value, id_value = payload['p']
+            timestamp = parse_datetime(time_value)
+            # Naive timestamps and ids out of the column's range would fail in the query
+            if timestamp is None or timezone.is_naive(timestamp):
+                raise ValueError
+            if type(id_value) is not int or not 0 <= id_value < 2 ** 63:
+                raise ValueError
+            return {'position': [time_value, id_value], 'reverse': bool(payload.get('r'))}
+        except (TypeError, ValueError, KeyError, UnicodeDecodeError):
+            raise ParseError(self.invalid_cursor_message)
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.position(self.page[-1]), reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.position(self.page[0]), reverse=True)
+
+    def get_paginated_response(self, data):
+        if self.fallback is not None:
+            return self.fallback.get_paginated_response(data)
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        if self.fallback is not None:
+            return self.fallback.get_paginated_response_schema(schema)
+        return pagination.CursorPagination().get_paginated_response_schema(schema)
@@ -3,16 +3,20 @@ from rest_framework import permissions
 class IsOwnerOrApprover(permissions.BasePermission):
     """
     Permission to only allow owners of a request or their approvers to access it.
+
+    The approver is the requester's current supervisor, the same CHA that
+    CommodityRequest.objects.for_user() scopes on; obj.approver keeps whoever
+    decided the request, who may since have handed the CHW over.
     """
     
     def has_object_permission(self, request, view, obj):
         # Read permissions for owner and approver
-        if request.user == obj.requester or request.user == obj.approver:
+        if request.user.pk in (obj.requester_id, obj.supervisor_id):
             return True
         
         # Write permissions only for approver (CHA)
         if request.method in ['PUT', 'PATCH']:
-            return request.user == obj.approver and request.user.role == 'CHA'
+            return request.user.pk == obj.supervisor_id and request.user.role == 'CHA'
         
         # Admin can access everything
         return request.user.role == 'ADMIN'
@@ -0,0 +1,110 @@
+"""
+Server push of request changes, so CHA clients need not poll the pending list.
+
+``GET /api/requests/events/`` is a server-sent events stream (served under
+ASGI only; a WSGI worker would be held by every open stream). It sends:
+
+- ``ready`` once subscribed: the client refreshes what it shows, since
+  changes made while it was not connected are not replayed;
+- ``request_created`` to the supervising CHA when a CHW submits a request;
+- ``request_status_changed`` to the supervising CHA on any status change and
+  to the CHW on approval or rejection;
+- ``resync`` when the client fell PUSH_QUEUE_SIZE events behind and some were
+  dropped, again meaning refresh.
+
+Comment lines keep idle connections open every PUSH_HEARTBEAT_SECONDS. A
+stream ends after PUSH_STREAM_SECONDS, the client (EventSource does so on
+its own) reconnects after the ``retry`` delay.
+"""
+import asyncio
+import json
+import logging
+
+from django.conf import settings
+from django.db import transaction
+
+from chw_backend.broker import get_broker
+
+logger = logging.getLogger(__name__)
+
+# Statuses a CHW hears about
+REQUESTER_STATUSES = ('APPROVED', 'REJECTED')
+
+
+def user_channel(user_id):
+    return f'user:{user_id}'
+
+
+def subscribe(user_id):
+    """Subscribe the running event loop to the user's pushes"""
+    return get_broker().subscribe(user_channel(user_id))
+
+
+def request_events(request, created):
+    """(user id, event, data) pushes for a request just created or whose status changed"""
+    data = {
+        'id': request.pk,
+        'status': request.status,
+        'requester': request.requester_id,
+        'commodity': request.commodity_id,
+        'quantity_requested': request.quantity_requested,
+        'quantity_approved': request.quantity_approved,
+    }
+    event = 'request_created' if created else 'request_status_changed'
+    events = []
+    if request.supervisor_id:
+        events.append((request.supervisor_id, event, data))
+    if not created and request.status in REQUESTER_STATUSES:
+        events.append((request.requester_id, event, data))
+    return events
+
+
+def publish(events):
+    broker = get_broker()
+    for user_id, event, data in events:
+        try:
+            broker.publish(user_channel(user_id), {'event': event, 'data': data})
+        except Exception:
+            # Clients catch up on their next refresh; the change itself is committed
+            logger.exception("Could not push %s to user %s", event, user_id)
+
+
+def publish_on_commit(events):
+    """Push the events once the current transaction commits"""
+    events = list(events)
+    if events:
+        transaction.on_commit(lambda: publish(events))
+
+
+def format_event(event, data):
+    return f'event: {event}\ndata: {json.dumps(data, separators=(",", ":"))}\n\n'.encode()
+
+
+async def event_stream(user_id):
+    """The SSE body of a user's stream, subscribed while it is being sent"""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + settings.PUSH_STREAM_SECONDS
+    subscription = subscribe(user_id)
+    try:
+        yield f'retry: {settings.PUSH_RETRY_MS}\n'.encode() + format_event('ready', {})
+        while True:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return
+            try:
+                message = await asyncio.wait_for(
+                    subscription.get(), min(settings.PUSH_HEARTBEAT_SECONDS, remaining)
+                )
+            except asyncio.TimeoutError:
+                yield b': keepalive\n\n'
+                continue
+            if subscription.overflowed:
+                # Events were dropped: what is queued is incomplete too
+                while not subscription.queue.empty():
+                    subscription.queue.get_nowait()
+                subscription.overflowed = False
+                yield format_event('resync', {})
+                continue
+            yield format_event(message['event'], message['data'])
+    finally:
+        subscription.close()
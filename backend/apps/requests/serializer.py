@@ -1,7 +1,9 @@
+from django.db import IntegrityError
 from rest_framework import serializers
-from django.utils import timezone
-from django.db.models import Sum
-from .models import CommodityRequest, RequestLog
+from .models import (
+    DAILY_LIMIT_MESSAGE, DAILY_LIMIT_STATUSES, AllocationLedger, AllocationLimitExceeded, CommodityRequest,
+    RequestLog,
+)
 from apps.commodities.serializer import CommodityListSerializer
 from apps.authentication.serializer import UserSerializer
 
@@ -33,13 +35,9 @@ class CommodityRequestCreateSerializer(serializers.ModelSerializer):
         
     def get_monthly_remaining(self, obj):
         """Calculate remaining monthly allocation for this commodity"""
-        current_month = timezone.now().replace(day=1)
-        monthly_used = CommodityRequest.objects.filter(
-            requester=self.context['request'].user,
-            commodity=obj.commodity,
-            created_at__gte=current_month,
-            status__in=['APPROVED', 'DELIVERED']
-        ).aggregate(total=Sum('quantity_approved'))['total'] or 0
+        monthly_used = getattr(self, '_monthly_used', None)
+        if monthly_used is None:
+            monthly_used = AllocationLedger.used(self.context['request'].user, obj.commodity)
         
         return obj.commodity.max_monthly_allocation - monthly_used
     
@@ -58,28 +56,13 @@ class CommodityRequestCreateSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError("This commodity is not currently available.")
         
         # Check daily limit
-        from datetime import date
-        today = date.today()
-        existing_request = CommodityRequest.objects.filter(
-            requester=user,
-            commodity=commodity,
-            created_at__date=today,
-            status__in=['PENDING', 'APPROVED']
-        ).exists()
+        existing_request = CommodityRequest.requested_today(user, commodity).exists()
         
         if existing_request:
-            raise serializers.ValidationError(
-                f"You have already requested {commodity.name} today. Only one request per commodity per day is allowed."
-            )
+            raise serializers.ValidationError(DAILY_LIMIT_MESSAGE.format(commodity=commodity.name))
         
-        # Check monthly limit
-        current_month = timezone.now().replace(day=1)
-        monthly_used = CommodityRequest.objects.filter(
-            requester=user,
-            commodity=commodity,
-            created_at__gte=current_month,
-            status__in=['APPROVED', 'DELIVERED']
-        ).aggregate(total=Sum('quantity_approved'))['total'] or 0
+        # Check monthly limit (kept for get_monthly_remaining, a new request is still pending)
+        monthly_used = self._monthly_used = AllocationLedger.used(user, commodity)
         
         remaining = commodity.max_monthly_allocation - monthly_used
         if quantity > remaining:
@@ -97,7 +80,15 @@ class CommodityRequestCreateSerializer(serializers.ModelSerializer):
     
     def create(self, validated_data):
         validated_data['requester'] = self.context['request'].user
-        return super().create(validated_data)
+        try:
+            # CommodityRequest.save() runs in its own savepoint, so this can be recovered from
+            return super().create(validated_data)
+        except IntegrityError:
+            # A concurrent submission got past the daily limit check first
+            commodity = validated_data['commodity']
+            if not CommodityRequest.requested_today(validated_data['requester'], commodity).exists():
+                raise
+            raise serializers.ValidationError(DAILY_LIMIT_MESSAGE.format(commodity=commodity.name))
 
 class CommodityRequestUpdateSerializer(serializers.ModelSerializer):
     class Meta:
@@ -121,6 +112,40 @@ class CommodityRequestUpdateSerializer(serializers.ModelSerializer):
         
         return attrs
 
+    def update(self, instance, validated_data):
+        # A rejected or delivered request taken back may not join another active one of its day
+        reactivated = (
+            instance.status not in DAILY_LIMIT_STATUSES
+            and validated_data.get('status', instance.status) in DAILY_LIMIT_STATUSES
+        )
+        daily_limit = DAILY_LIMIT_MESSAGE.format(commodity=instance.commodity.name)
+        if reactivated and CommodityRequest.daily_slots_taken([instance]):
+            raise serializers.ValidationError(daily_limit)
+        try:
+            # CommodityRequest.save() runs in its own savepoint, so this can be recovered from
+            return super().update(instance, validated_data)
+        except AllocationLimitExceeded as exc:
+            raise serializers.ValidationError(exc.messages)
+        except IntegrityError:
+            # A concurrent change took the slot after the check
+            if not reactivated:
+                raise
+            raise serializers.ValidationError(daily_limit)
+
+class BulkRequestActionSerializer(CommodityRequestUpdateSerializer):
+    """One item of a bulk approve/reject call, validated like a single update"""
+    id = serializers.IntegerField()
+
+    class Meta(CommodityRequestUpdateSerializer.Meta):
+        fields = ['id'] + CommodityRequestUpdateSerializer.Meta.fields
+        extra_kwargs = {'status': {'required': True}}
+
+class BasketLineSerializer(serializers.Serializer):
+    """One line of a basket; commodities are looked up together by the view"""
+    commodity = serializers.IntegerField()
+    quantity_requested = serializers.IntegerField(min_value=1, max_value=99)
+    reason_for_request = serializers.CharField(required=False, allow_blank=True, default='')
+
 class RequestLogSerializer(serializers.ModelSerializer):
     performed_by_name = serializers.CharField(source='performed_by.get_full_name', read_only=True)
     action_display = serializers.CharField(source='get_action_display', read_only=True)
@@ -0,0 +1,61 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from apps.authentication.models import User
+from apps.authentication.signals import supervisor_changed
+from apps.commodities.models import Commodity
+from .cache import invalidate_dashboards
+from .models import AllocationLedger, CommodityRequest, RequestDailyRollup, SyncTombstone, month_start
+from .push import publish_on_commit, request_events
+
+
+def request_audience(request):
+    """Ids of the users whose role-scoped views include this request"""
+    return [request.requester_id, request.approver_id, request.supervisor_id]
+
+
+@receiver(post_save, sender=CommodityRequest)
+def commodity_request_saved(sender, instance, created, **kwargs):
+    if created or instance.status_changed:
+        user_ids = request_audience(instance)
+        transaction.on_commit(lambda: invalidate_dashboards(user_ids))
+        publish_on_commit(request_events(instance, created))
+
+
+@receiver(post_delete, sender=CommodityRequest)
+def commodity_request_deleted(sender, instance, **kwargs):
+    # The ledger and rollup rows may already be gone when the requester itself is deleted
+    allocated = instance.allocated_quantity(instance.status, instance.quantity_approved)
+    if allocated:
+        AllocationLedger.apply_delta(
+            instance.requester_id, instance.commodity_id, month_start(instance.created_at),
+            -allocated, create=False
+        )
+    deltas = {}
+    RequestDailyRollup.add(deltas, instance, sign=-1)
+    RequestDailyRollup.apply_deltas(deltas, create=False)
+    SyncTombstone.objects.create(
+        model='request', object_id=instance.pk,
+        requester_id=instance.requester_id, supervisor_id=instance.supervisor_id,
+    )
+    user_ids = request_audience(instance)
+    transaction.on_commit(lambda: invalidate_dashboards(user_ids))
+
+
+@receiver(post_delete, sender=Commodity)
+def commodity_deleted(sender, instance, **kwargs):
+    SyncTombstone.objects.create(model='commodity', object_id=instance.pk)
+
+
+@receiver(pre_delete, sender=User)
+def user_deleting(sender, instance, **kwargs):
+    # Before the rollups' supervisor is SET_NULL, which could duplicate rows already without one
+    RequestDailyRollup.release_supervisor(instance.pk)
+
+
+@receiver(supervisor_changed, sender=User)
+def requester_reassigned(sender, user, previous_supervisor_id, **kwargs):
+    CommodityRequest.reassign_supervisor(user.pk, user.supervisor_id)
+    user_ids = [user.pk, previous_supervisor_id, user.supervisor_id]
+    transaction.on_commit(lambda: invalidate_dashboards(user_ids))
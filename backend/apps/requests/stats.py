@@ -0,0 +1,194 @@
+"""
+Dashboard and analytics aggregates.
+
+Each payload is split into independent queries so the sync views can run
+them one after another and the async views concurrently, on a pool of
+worker threads that each have their own database connection.
+"""
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections, connections
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import ExtractMonth, ExtractYear
+from django.utils import timezone
+
+from chw_backend.query_budget import counted
+from .models import CommodityRequest, RequestDailyRollup, month_bounds, month_start
+from .projections import REQUEST_PROJECTION
+
+# Related rows read by CommodityRequestSerializer
+REQUEST_RELATED = ('commodity', 'requester', 'approver')
+
+
+def dashboard_queries(user):
+    """Independent queries behind the dashboard, by payload key"""
+    base_queryset = CommodityRequest.objects.for_user(user)
+    rollups = RequestDailyRollup.scoped(user)
+
+    def counters():
+        # All counters in a single conditional aggregation
+        # From midnight on the 1st, local time, not the current time of day
+        current_month = month_bounds(month_start())[0]
+        return base_queryset.aggregate(
+            total_requests=Count('id'),
+            pending_requests=Count('id', filter=Q(status='PENDING')),
+            approved_requests=Count('id', filter=Q(status='APPROVED')),
+            rejected_requests=Count('id', filter=Q(status='REJECTED')),
+            monthly_requests=Count('id', filter=Q(created_at__gte=current_month)),
+        )
+
+    def top_commodities():
+        # Top commodities (last 30 days, today included)
+        last_30_days = timezone.localdate() - timedelta(days=30)
+        return list(rollups.filter(
+            day__gt=last_30_days
+        ).values(
+            'commodity__name'
+        ).annotate(
+            request_count=Sum('num_requests'),
+            total_quantity=Sum('quantity_requested')
+        ).order_by('-request_count')[:5])
+
+    def recent_requests():
+        # Recent requests (last 10)
+        recent = REQUEST_PROJECTION.values(base_queryset).order_by('-created_at')[:10]
+        return REQUEST_PROJECTION.render(recent)
+
+    return {
+        'counters': counters,
+        'top_commodities': top_commodities,
+        'recent_requests': recent_requests,
+    }
+
+
+def assemble_dashboard(results):
+    stats = dict(results['counters'])
+    stats['top_commodities'] = results['top_commodities']
+    stats['recent_requests'] = results['recent_requests']
+    return stats
+
+
+def analytics_queries(user):
+    """Independent queries behind the analytics charts, by payload key"""
+    # Read from the daily rollups rather than aggregating every request
+    base_queryset = RequestDailyRollup.scoped(user)
+
+    def status_distribution():
+        # Requests by status
+        return list(base_queryset.values('status').annotate(count=Sum('num_requests')).order_by('status'))
+
+    def monthly_trends():
+        # Requests by month (last 6 months)
+        six_months_ago = timezone.localdate() - timedelta(days=180)
+        return list(base_queryset.filter(
+            day__gt=six_months_ago
+        ).values(
+            year=ExtractYear('day'), month=ExtractMonth('day')
+        ).annotate(count=Sum('num_requests')).order_by('year', 'month'))
+
+    def top_commodities():
+        return list(base_queryset.values(
+            'commodity__name'
+        ).annotate(
+            count=Sum('num_requests'),
+            total_quantity=Sum('quantity_requested')
+        ).order_by('-count')[:10])
+
+    return {
+        'status_distribution': status_distribution,
+        'monthly_trends': monthly_trends,
+        'top_commodities': top_commodities,
+    }
+
+
+def run_queries(queries):
+    """Run the queries one after another"""
+    return {key: query() for key, query in queries.items()}
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.ASYNC_QUERY_WORKERS, thread_name_prefix='async-query'
+            )
+        return _executor
+
+
+def _run_in_worker(query):
+    try:
+        return counted(query)
+    finally:
+        # Honour CONN_MAX_AGE as request_finished does for request threads
+        close_old_connections()
+
+
+async def run_in_worker(query):
+    """Run a sync database call on the async query worker pool"""
+    return await sync_to_async(_run_in_worker, thread_sensitive=False, executor=_get_executor())(query)
+
+
+def close_worker_connections():
+    """Close the database connections held by the worker threads and stop them.
+
+    Needed before dropping a database the workers are connected to, e.g. at
+    the end of a test run or benchmark.
+    """
+    global _executor
+    with _executor_lock:
+        executor, _executor = _executor, None
+    if executor is None:
+        return
+    # One task per worker: the barrier keeps each task on its own thread
+    barrier = threading.Barrier(executor._max_workers)
+
+    def close():
+        try:
+            barrier.wait(timeout=5)
+        except threading.BrokenBarrierError:
+            pass
+        connections.close_all()
+
+    for _ in range(executor._max_workers):
+        executor.submit(close)
+    executor.shutdown(wait=True)
+
+
+async def run_queries_concurrently(queries, limit=None):
+    """Run the queries in worker threads, at most limit (ASYNC_QUERY_CONCURRENCY) at a time"""
+    semaphore = asyncio.Semaphore(limit or settings.ASYNC_QUERY_CONCURRENCY)
+
+    async def run(query):
+        async with semaphore:
+            return await run_in_worker(query)
+
+    results = await asyncio.gather(*(run(query) for query in queries.values()))
+    return dict(zip(queries, results))
+
+
+def build_dashboard_stats(user):
+    """Compute the dashboard payload for a user"""
+    return assemble_dashboard(run_queries(dashboard_queries(user)))
+
+
+async def abuild_dashboard_stats(user):
+    return assemble_dashboard(await run_queries_concurrently(dashboard_queries(user)))
+
+
+def build_analytics(user):
+    """Compute the analytics payload for a user"""
+    return run_queries(analytics_queries(user))
+
+
+async def abuild_analytics(user):
+    return await run_queries_concurrently(analytics_queries(user))
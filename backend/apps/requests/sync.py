@@ -0,0 +1,163 @@
+"""
+Changes feed for offline-first clients.
+
+``GET /api/requests/sync/?token=...`` returns the requests (scoped like the
+request list), their new log entries and the commodities that changed since
+the token, the ids of those deleted, deactivated or moved out of the user's
+scope, and the token to send next time. Without a token it starts a full sync.
+
+The token holds, per stream, the (updated_at, id) of the last row sent, so
+the next call is a range scan on the sync indexes. Rows changed in the last
+SYNC_SETTLE_SECONDS are held back: updated_at is set before the commit, and a
+transaction committing late would otherwise land behind a token already given.
+
+A sync may take several pages (``more``). Every page covers the same time
+window in all streams, so a deletion never overtakes the change it follows.
+Log entries ride with the requests that changed, those written since the last
+complete sync: a first sync sends none (the history is at
+``/requests/<id>/logs/``), nor does a request moved into a CHA's scope bring
+its older entries.
+"""
+import base64
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework import serializers, status
+from rest_framework.exceptions import APIException
+
+from apps.commodities.models import Commodity
+from apps.commodities.serializer import CommoditySerializer
+from .models import CommodityRequest, RequestLog, SyncTombstone
+from .projections import LOG_PROJECTION, REQUEST_PROJECTION, Projection, column
+
+SYNC_LOG_PROJECTION = Projection(**LOG_PROJECTION.fields, request=column('request'))
+
+# Feed key of each SyncTombstone.model
+DELETED_KEYS = {'request': 'requests', 'commodity': 'commodities'}
+
+
+class SyncTokenExpired(APIException):
+    status_code = status.HTTP_410_GONE
+    default_detail = "Sync token expired, sync again without a token."
+    default_code = 'sync_token_expired'
+
+
+def encode_token(state):
+    payload = json.dumps(state, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+
+def decode_token(encoded):
+    if not encoded:
+        return {}
+    try:
+        state = json.loads(base64.urlsafe_b64decode(encoded.encode()).decode())
+        for key in ('since', 'until'):
+            if state.get(key) is not None and parse_datetime(state[key]) is None:
+                raise ValueError
+        for key in ('requests', 'commodities', 'deleted'):
+            position = state.get(key)
+            if position is not None and (
+                len(position) != 2 or parse_datetime(position[0]) is None or not isinstance(position[1], int)
+            ):
+                raise ValueError
+        return state
+    except (TypeError, ValueError, KeyError, AttributeError, UnicodeDecodeError):
+        raise serializers.ValidationError({'token': ["Invalid sync token."]})
+
+
+def changed(queryset, field, position, since, until):
+    """Rows after position (or since) up to until, in (field, id) order"""
+    queryset = queryset.filter(**{f'{field}__lte': until})
+    if position:
+        moment, pk = parse_datetime(position[0]), position[1]
+        # Same range predicate as KeysetPagination.filter_after
+        queryset = queryset.filter(**{f'{field}__gte': moment}).exclude(**{field: moment, 'id__lte': pk})
+    elif since:
+        queryset = queryset.filter(**{f'{field}__gt': since})
+    return queryset.order_by(field, 'id')
+
+
+def changed_at(row):
+    if isinstance(row, Commodity):
+        return row.updated_at, row.pk
+    return row.get('updated_at', row.get('deleted_at')), row['id']
+
+
+def build_changes(user, token, limit):
+    state = decode_token(token)
+    now = timezone.now()
+    since = parse_datetime(state['since']) if state.get('since') else None
+    if state.get('until'):
+        until = parse_datetime(state['until'])
+    else:
+        until = now - timedelta(seconds=settings.SYNC_SETTLE_SECONDS)
+    # Older tombstones are purged
+    if token and (since or until) < now - timedelta(days=settings.SYNC_TOMBSTONE_RETENTION_DAYS):
+        raise SyncTokenExpired()
+
+    commodities = Commodity.objects.all() if since else Commodity.objects.filter(is_active=True)
+    streams = {
+        'requests': REQUEST_PROJECTION.values(changed(
+            CommodityRequest.objects.for_user(user), 'updated_at', state.get('requests'), since, until
+        )),
+        'commodities': changed(commodities, 'updated_at', state.get('commodities'), since, until),
+    }
+    # A first sync has nothing to delete
+    if since:
+        streams['deleted'] = changed(
+            SyncTombstone.for_user(user), 'deleted_at', state.get('deleted'), since, until
+        ).values('id', 'model', 'object_id', 'deleted_at')
+    pages = {name: list(rows[:limit + 1]) for name, rows in streams.items()}
+
+    # Every stream stops where the first full one did
+    cut = min((changed_at(rows[limit - 1])[0] for rows in pages.values() if len(rows) > limit), default=None)
+    for name, rows in pages.items():
+        rows = pages[name] = rows[:limit]
+        if cut is not None:
+            rows = pages[name] = [row for row in rows if changed_at(row)[0] <= cut]
+        if rows:
+            moment, pk = changed_at(rows[-1])
+            state[name] = [moment.isoformat(), pk]
+
+    # Latest change per (feed key, id) in the page: a row, or None once deleted
+    latest = {}
+    for row in pages['requests']:
+        latest[('requests', row['id'])] = (row['updated_at'], row)
+    for commodity in pages['commodities']:
+        latest[('commodities', commodity.pk)] = (commodity.updated_at, commodity if commodity.is_active else None)
+    for tombstone in pages.get('deleted', ()):
+        key = (DELETED_KEYS[tombstone['model']], tombstone['object_id'])
+        if key not in latest or latest[key][0] <= tombstone['deleted_at']:
+            latest[key] = (tombstone['deleted_at'], None)
+
+    requests = [row for row in pages['requests'] if latest[('requests', row['id'])][1] is row]
+    logs = []
+    if since and requests:
+        logs = SYNC_LOG_PROJECTION.values(
+            RequestLog.objects.filter(request_id__in=[row['id'] for row in requests], timestamp__gt=since)
+        ).order_by('timestamp', 'id')
+
+    more = cut is not None
+    if not more:
+        # Complete: the next sync starts where this one's window ended
+        state['since'], state['until'] = until.isoformat(), None
+    else:
+        state['until'] = until.isoformat()
+    return {
+        'token': encode_token(state),
+        'more': more,
+        'requests': REQUEST_PROJECTION.render(requests),
+        'request_logs': SYNC_LOG_PROJECTION.render(logs),
+        'commodities': CommoditySerializer(
+            [commodity for commodity in pages['commodities'] if latest[('commodities', commodity.pk)][1]],
+            many=True,
+        ).data,
+        'deleted': {
+            name: sorted(pk for (key, pk), (_, row) in latest.items() if key == name and row is None)
+            for name in ('requests', 'commodities')
+        },
+    }
@@ -1,3 +1,1243 @@
-from django.test import TestCase
+import asyncio
+import base64
+import functools
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import threading
+from unittest import mock, skipUnless
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection, connections, transaction
+from django.db.models import F, Sum
+from django.http import StreamingHttpResponse
+from django.test import AsyncClient, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from apps.authentication.models import User
+from chw_backend import metrics
+from chw_backend.compression import brotli
+from chw_backend.renderers import FastJSONRenderer, msgpack
+from apps.authentication import urls as authentication_urls
+from apps.commodities import urls as commodity_urls
+from apps.commodities.models import Commodity
+from chw_backend.broker import get_broker
+from chw_backend.replicas import monitor
+from . import audit, push, urls as request_urls
+from .cache import ADMIN_GENERATION_KEY, dashboard_cache_key, invalidate_dashboards
+from .management.commands.bench_endpoints import Command as BenchEndpoints, read_body
+from .management.commands.seed_load import USERNAME_PREFIX, Command as SeedLoad
+from .models import (
+    ALLOCATED_STATUSES, DAILY_LIMIT_MESSAGE, AllocationLedger, CommodityRequest, RequestDailyRollup, RequestLog,
+    RequestLogArchive, RequestLogArchiveMonth, month_bounds, month_start,
+)
+from .projections import LOG_PROJECTION, REQUEST_PROJECTION
+from .serializer import CommodityRequestSerializer, RequestLogSerializer
+from .stats import close_worker_connections
+
+
+class QueryPlanTests(TestCase):
+    """Hot queries must be answered from an index, never a full table scan"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.cha = User.objects.create(username='cha', role='CHA')
+        cls.chws = User.objects.bulk_create(
+            User(username=f'chw{i}', role='CHW', supervisor=cls.cha) for i in range(20)
+        )
+        cls.commodities = Commodity.objects.bulk_create(
+            Commodity(name=f'Commodity {i}') for i in range(10)
+        )
+        statuses = ['PENDING', 'APPROVED', 'REJECTED', 'DELIVERED']
+        requests = CommodityRequest.objects.bulk_create(
+            CommodityRequest(
+                requester=cls.chws[i % 20],
+                supervisor=cls.cha,
+                approver=cls.cha,
+                commodity=cls.commodities[i % 10],
+                quantity_requested=10,
+                status=statuses[i % 4],
+                request_date=timezone.localdate() - timedelta(days=i // 20),
+            )
+            for i in range(2000)
+        )
+        RequestLog.objects.bulk_create(
+            RequestLog(request=request, action='CREATED') for request in requests
+        )
+        cls.request = requests[0]
+
+    def setUp(self):
+        if connection.vendor == 'postgresql':
+            # Small tables would otherwise be scanned because it is cheaper,
+            # this only leaves a sequential scan when no index applies
+            with connection.cursor() as cursor:
+                cursor.execute('SET enable_seqscan = off')
+
+    def tearDown(self):
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('RESET enable_seqscan')
+
+    def assertUsesIndex(self, queryset):
+        table = queryset.model._meta.db_table
+        plan = queryset.explain()
+        if connection.vendor == 'postgresql':
+            self.assertNotIn(f'Seq Scan on {table}', plan, plan)
+        elif connection.vendor == 'sqlite':
+            # "SEARCH" is an index lookup, "SCAN" reads the whole table or index
+            self.assertNotRegex(plan, rf'\bSCAN {table}\b', plan)
+
+    def test_daily_limit_check(self):
+        self.assertUsesIndex(CommodityRequest.requested_today(self.chws[0], self.commodities[0]))
+
+    def test_monthly_limit_check(self):
+        self.assertUsesIndex(AllocationLedger.objects.filter(
+            requester=self.chws[0], commodity=self.commodities[0], month=month_start()
+        ))
+        self.assertUsesIndex(CommodityRequest.objects.filter(
+            requester=self.chws[0],
+            commodity=self.commodities[0],
+            created_at__gte=timezone.now() - timedelta(days=30),
+        ))
+
+    def test_pending_queue(self):
+        self.assertUsesIndex(CommodityRequest.objects.for_user(self.cha).filter(
+            status='PENDING'
+        ).order_by('created_at'))
+
+    def test_chw_request_list(self):
+        self.assertUsesIndex(CommodityRequest.objects.for_user(self.chws[0]))
+
+    def test_cha_request_list(self):
+        self.assertUsesIndex(CommodityRequest.objects.for_user(self.cha).order_by('-created_at'))
+
+    def test_request_log_history(self):
+        self.assertUsesIndex(RequestLog.objects.filter(request=self.request))
+
+
+class RequestTestCase(TestCase):
+    """A CHA with three CHWs, their requests and logs, and calls to the API as one of them"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.cha = User.objects.create(username='cha', role='CHA', first_name='Amina')
+        cls.chws = [
+            User.objects.create(username=f'chw{i}', role='CHW', supervisor=cls.cha, first_name=f'CHW {i}')
+            for i in range(3)
+        ]
+        cls.admin = User.objects.create(username='admin', role='ADMIN')
+        cls.commodities = [Commodity.objects.create(name=f'Commodity {i}') for i in range(5)]
+        for i in range(12):
+            request = CommodityRequest.objects.create(
+                requester=cls.chws[i % 3],
+                commodity=cls.commodities[i % 4],
+                quantity_requested=5,
+            )
+            RequestLog.objects.create(request=request, action='CREATED', performed_by=request.requester)
+            if i % 2:
+                request.status = 'APPROVED'
+                request.quantity_approved = 5
+                request.save()
+                RequestLog.objects.create(request=request, action='APPROVED', performed_by=cls.cha)
+        cls.request = CommodityRequest.objects.filter(requester=cls.chws[0], status='PENDING').first()
+
+    def call(self, user, method, name, data=None, **kwargs):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}')
+        response = getattr(client, method)(reverse(name, kwargs=kwargs), data, format='json')
+        self.assertLess(response.status_code, 500)
+        return response
+
+
+@override_settings(QUERY_BUDGET_MODE='raise')
+class QueryBudgetTests(RequestTestCase):
+    """Every endpoint stays within its declared query budget, whatever the page size"""
+
+    def test_read_endpoints(self):
+        for user in (self.chws[0], self.cha, self.admin):
+            for name in ('request_list', 'pending_requests', 'dashboard_stats', 'allocation_status',
+                         'request_analytics', 'commodity_list', 'commodity_categories', 'profile'):
+                with self.subTest(name=name, role=user.role):
+                    self.call(user, 'get', name)
+            self.call(user, 'get', 'request_detail', pk=self.request.pk)
+            self.call(user, 'get', 'request_logs', request_id=self.request.pk)
+            self.call(user, 'get', 'commodity_detail', pk=self.commodities[0].pk)
+
+    def test_write_endpoints(self):
+        response = self.call(self.chws[0], 'post', 'request_create', {
+            'commodity': self.commodities[4].pk, 'quantity_requested': 3
+        })
+        self.assertEqual(response.status_code, 201)
+        response = self.call(self.cha, 'patch', 'request_detail', {
+            'status': 'APPROVED', 'quantity_approved': 3
+        }, pk=self.request.pk)
+        self.assertEqual(response.status_code, 200)
+
+    def test_basket(self):
+        lines = [
+            {'commodity': self.commodities[4].pk, 'quantity_requested': 3},
+            # Already requested today by chws[1]
+            {'commodity': self.commodities[0].pk, 'quantity_requested': 3},
+        ]
+        before = CommodityRequest.objects.count()
+        response = self.call(self.chws[1], 'post', 'request_basket', {'lines': lines})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(CommodityRequest.objects.count(), before)
+
+        response = self.call(self.chws[1], 'post', 'request_basket', {'lines': lines, 'atomic': False})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual([line['success'] for line in response.data['results']], [True, False])
+        created = CommodityRequest.objects.get(pk=response.data['results'][0]['id'])
+        self.assertEqual((created.approver, created.logs.count()), (self.cha, 1))
+
+    def test_bulk_update(self):
+        pending = CommodityRequest.objects.filter(status='PENDING').exclude(pk=self.request.pk)
+        actions = [
+            {'id': pk, 'status': 'APPROVED', 'quantity_approved': 4} if i % 2 else
+            {'id': pk, 'status': 'REJECTED', 'rejection_reason': 'Out of stock'}
+            for i, pk in enumerate(pending.values_list('pk', flat=True))
+        ]
+        actions.append({'id': self.request.pk, 'status': 'APPROVED'})
+        response = self.call(self.cha, 'post', 'request_bulk_update', {'actions': actions})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['updated'], len(actions) - 1)
+        self.assertFalse(response.data['results'][-1]['success'])
+        self.assertFalse(pending.exists())
+        self.assertEqual(
+            RequestLog.objects.filter(action__in=['APPROVED', 'REJECTED'], performed_by=self.cha).count(),
+            6 + len(actions) - 1
+        )
+        approved = sum(4 for action in actions[:-1] if action['status'] == 'APPROVED')
+        self.assertEqual(
+            AllocationLedger.objects.filter(month=month_start()).aggregate(total=Sum('quantity_used'))['total'],
+            6 * 5 + approved
+        )
+
+    def test_exports(self):
+        def export(user, name, output_format, **params):
+            client = APIClient()
+            client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}')
+            response = client.get(reverse(name, kwargs={'output_format': output_format}), params)
+            self.assertEqual(response.status_code, 200)
+            return b''.join(response.streaming_content).decode()
+
+        lines = export(self.chws[0], 'request_export', 'ndjson').splitlines()
+        rows = [json.loads(line) for line in lines]
+        self.assertEqual(len(rows), CommodityRequest.objects.filter(requester=self.chws[0]).count())
+        self.assertEqual({row['requester_name'] for row in rows}, {'CHW 0'})
+
+        csv_lines = export(self.admin, 'request_export', 'csv', status='APPROVED').splitlines()
+        self.assertTrue(csv_lines[0].startswith('id,created_at,status,'))
+        self.assertEqual(len(csv_lines) - 1, CommodityRequest.objects.filter(status='APPROVED').count())
+
+        logs = export(self.cha, 'request_log_export', 'csv', commodity=self.commodities[0].pk).splitlines()
+        self.assertEqual(len(logs) - 1, RequestLog.objects.filter(request__commodity=self.commodities[0]).count())
+
+        out = StringIO()
+        call_command('export_requests', 'requests', '--format', 'csv', '--status', 'APPROVED', stdout=out)
+        self.assertEqual(out.getvalue().splitlines(), csv_lines)
+
+    def test_every_route_declares_a_budget(self):
+        for module in (request_urls, commodity_urls, authentication_urls):
+            for pattern in module.urlpatterns:
+                view = pattern.callback
+                budget = getattr(view, 'query_budget', getattr(getattr(view, 'cls', None), 'query_budget', None))
+                self.assertIsNotNone(budget, f'{pattern.name} has no @query_budget')
+
+
+@override_settings(QUERY_BUDGET_MODE='raise')
+class AsgiExportTests(RequestTestCase):
+    """Exports are streamed chunk by chunk under ASGI as well"""
+
+    async def test_export_streams_asynchronously(self):
+        token = await sync_to_async(AccessToken.for_user)(self.admin)
+        response = await AsyncClient().get(
+            reverse('request_export', kwargs={'output_format': 'ndjson'}), {'status': 'APPROVED'},
+            headers={'Authorization': f'Bearer {token}'},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.is_async)
+        lines = b''.join([chunk async for chunk in response.streaming_content]).splitlines()
+        self.assertTrue(lines)
+        self.assertEqual(len(lines), await CommodityRequest.objects.filter(status='APPROVED').acount())
+
+
+class LogArchiveTests(RequestTestCase):
+    """Logs past the retention period move to monthly archives, and read back the same"""
+
+    def test_log_archive(self):
+        # Mid-month, so both logs land in one archive row
+        old = month_bounds(month_start(timezone.now() - timedelta(days=400)))[0] + timedelta(days=10)
+        for days, action in enumerate(('CREATED', 'UPDATED')):
+            log = RequestLog.objects.create(request=self.request, action=action, performed_by=self.cha)
+            RequestLog.objects.filter(pk=log.pk).update(timestamp=old + timedelta(days=days))
+        before = self.call(self.cha, 'get', 'request_logs', request_id=self.request.pk).data['results']
+        total = RequestLog.objects.count()
+
+        call_command('archive_request_logs', '--retention-days', '365', stdout=StringIO())
+        self.assertEqual(RequestLog.objects.count(), total - 2)
+        self.assertEqual(RequestLogArchiveMonth.objects.get().entry_count, 2)
+        self.assertEqual(RequestLogArchive.objects.get().request_id, self.request.pk)
+        call_command('verify_log_archive', '--deep', stdout=StringIO())
+
+        # The history reads through to the archive, in the same order and shape
+        after = self.call(self.cha, 'get', 'request_logs', request_id=self.request.pk).data['results']
+        self.assertEqual(after, before)
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.cha)}')
+        url = reverse('request_logs', kwargs={'request_id': self.request.pk})
+        response = client.get(url, {'paginate': 'cursor', 'page_size': 1})
+        ids = [row['id'] for row in response.data['results']]
+        while response.data['next']:
+            response = client.get(response.data['next'])
+            ids += [row['id'] for row in response.data['results']]
+        self.assertEqual(ids, [row['id'] for row in before])
+
+
+@override_settings(QUERY_BUDGET_MODE='raise')
+class BufferedAuditLogTests(RequestTestCase):
+    """Buffered request logs are spooled to disk, written on flush and replayed after a crash"""
+
+    def test_buffered_audit_log(self):
+        spool_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, spool_dir)
+        self.addCleanup(audit.close_buffer)
+        with override_settings(AUDIT_LOG_MODE='buffered', AUDIT_LOG_FLUSH_INTERVAL=0, AUDIT_LOG_SPOOL_DIR=spool_dir):
+            before = RequestLog.objects.count()
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.call(self.chws[0], 'post', 'request_create', {
+                    'commodity': self.commodities[4].pk, 'quantity_requested': 3
+                })
+            self.assertEqual(response.status_code, 201)
+            # Queued and spooled, not written yet
+            self.assertEqual(RequestLog.objects.count(), before)
+            self.assertEqual(len(os.listdir(spool_dir)), 1)
+            self.assertEqual(audit.flush(), 1)
+            self.assertEqual(os.listdir(spool_dir), [])
+            log = RequestLog.objects.latest('id')
+            self.assertEqual((log.action, log.performed_by), ('CREATED', self.chws[0]))
+
+            # Entries of a process that died before flushing are replayed
+            buffer = audit.get_buffer()
+            buffer.add([audit.to_entry(
+                RequestLog(request=self.request, action='UPDATED', performed_by=self.cha, details={}),
+                timezone.now(),
+            )])
+            buffer._spool.close()
+            audit._buffer = None
+            call_command('replay_audit_spool', '--all', '--spool-dir', spool_dir, stdout=StringIO())
+            replayed = RequestLog.objects.get(request=self.request, action='UPDATED')
+
+            # A file whose entries are already stored is not written twice
+            with open(os.path.join(spool_dir, 'audit-1-1.jsonl'), 'w') as spool:
+                spool.write(json.dumps(audit.to_entry(replayed, replayed.timestamp)) + '\n')
+            call_command('replay_audit_spool', '--all', '--spool-dir', spool_dir, stdout=StringIO())
+            self.assertEqual(RequestLog.objects.filter(request=self.request, action='UPDATED').count(), 1)
+            self.assertEqual(os.listdir(spool_dir), [])
+
+
+@override_settings(QUERY_BUDGET_MODE='raise')
+class RequestLimitTests(RequestTestCase):
+    """The daily and monthly limits hold in the database, not only in the checks before a write"""
+
+    def test_limits_hold_past_the_checks(self):
+        commodity = self.commodities[4]
+        commodity.max_monthly_allocation = 10
+        commodity.save()
+        requests = [
+            CommodityRequest.objects.create(
+                requester=self.chws[0], commodity=commodity, quantity_requested=6,
+                request_date=timezone.localdate() - timedelta(days=i),
+            )
+            for i in range(3)
+        ]
+
+        # A second active request for the same day is refused by the database
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            CommodityRequest.objects.create(requester=self.chws[0], commodity=commodity, quantity_requested=1)
+
+        # Approvals may not take the month over the allocation
+        results = self.call(self.cha, 'post', 'request_bulk_update', {'actions': [
+            {'id': request.pk, 'status': 'APPROVED', 'quantity_approved': 6} for request in requests
+        ]}).data['results']
+        self.assertEqual([result['success'] for result in results], [True, False, False])
+        self.assertEqual(self.call(self.cha, 'patch', 'request_detail', {
+            'status': 'APPROVED', 'quantity_approved': 5
+        }, pk=requests[1].pk).status_code, 400)
+        self.assertEqual(self.call(self.cha, 'patch', 'request_detail', {
+            'status': 'APPROVED', 'quantity_approved': 4
+        }, pk=requests[1].pk).status_code, 200)
+        self.assertEqual(AllocationLedger.used(self.chws[0], commodity), 10)
+        self.assertEqual(CommodityRequest.objects.get(pk=requests[2].pk).status, 'PENDING')
+
+    def test_taking_back_a_request_keeps_the_daily_limit(self):
+        commodity = self.commodities[4]
+        rejected = CommodityRequest.objects.create(requester=self.chws[0], commodity=commodity, quantity_requested=2)
+        rejected.status, rejected.rejection_reason = 'REJECTED', 'Out of stock'
+        rejected.save()
+        active = CommodityRequest.objects.create(requester=self.chws[0], commodity=commodity, quantity_requested=3)
+        message = DAILY_LIMIT_MESSAGE.format(commodity=commodity.name)
+
+        response = self.call(self.cha, 'patch', 'request_detail', {
+            'status': 'APPROVED', 'quantity_approved': 2
+        }, pk=rejected.pk)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data, [message])
+
+        response = self.call(self.cha, 'post', 'request_bulk_update', {'actions': [
+            {'id': rejected.pk, 'status': 'PENDING'},
+        ]})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'][0]['errors'], {'non_field_errors': [message]})
+        self.assertEqual(CommodityRequest.objects.get(pk=rejected.pk).status, 'REJECTED')
+
+        # Freed by the active request leaving it, the slot can be taken by the next call
+        response = self.call(self.cha, 'post', 'request_bulk_update', {'actions': [
+            {'id': active.pk, 'status': 'REJECTED', 'rejection_reason': 'Duplicate'},
+            {'id': rejected.pk, 'status': 'APPROVED', 'quantity_approved': 2},
+        ]})
+        self.assertEqual([result['success'] for result in response.data['results']], [True, False])
+        response = self.call(self.cha, 'post', 'request_bulk_update', {'actions': [
+            {'id': rejected.pk, 'status': 'APPROVED', 'quantity_approved': 2},
+        ]})
+        self.assertEqual(response.data['updated'], 1)
+        self.assertEqual(CommodityRequest.objects.get(pk=rejected.pk).status, 'APPROVED')
+
+
+@override_settings(QUERY_BUDGET_MODE='raise')
+class ProjectionTests(RequestTestCase):
+    """The read-only projections render the same JSON as the serializers they replace"""
+
+    def test_projections_match_serializers(self):
+        CommodityRequest.objects.filter(pk=self.request.pk).update(
+            approver=None, notes='Café "quoted"', delivered_at=timezone.now()
+        )
+        RequestLog.objects.create(request=self.request, action='UPDATED', performed_by=None, details={'a': [1]})
+        requests = CommodityRequest.objects.order_by('pk')
+        logs = RequestLog.objects.order_by('pk')
+        archive = RequestLogArchive(data=RequestLogArchive.encode(logs.select_related('performed_by')))
+        renderer = JSONRenderer()
+        for zone in ('UTC', 'Africa/Nairobi'):
+            with self.subTest(zone=zone), timezone.override(zone):
+                self.assertEqual(
+                    renderer.render(REQUEST_PROJECTION.render(REQUEST_PROJECTION.values(requests))),
+                    renderer.render(CommodityRequestSerializer(
+                        requests.select_related('commodity', 'requester', 'approver'), many=True
+                    ).data),
+                )
+                self.assertEqual(
+                    renderer.render(LOG_PROJECTION.render(LOG_PROJECTION.values(logs))),
+                    renderer.render(RequestLogSerializer(logs.select_related('performed_by'), many=True).data),
+                )
+                self.assertEqual(
+                    renderer.render(LOG_PROJECTION.render(archive.rows())),
+                    renderer.render(RequestLogSerializer(archive.logs(), many=True).data),
+                )
+
+
+@override_settings(QUERY_BUDGET_MODE='raise')
+class SyncFeedTests(RequestTestCase):
+    """Offline clients get every change of their scope, deletions included, in token-chained pages"""
+
+    @override_settings(SYNC_SETTLE_SECONDS=0)
+    def test_sync_feed(self):
+        def sync(user, token=None, limit=5):
+            """Every page of one sync, merged"""
+            merged = {'requests': [], 'request_logs': [], 'commodities': [], 'requests_deleted': []}
+            while True:
+                page = self.call(user, 'get', 'request_sync', {'token': token or '', 'limit': limit}).data
+                for key in ('requests', 'request_logs', 'commodities'):
+                    merged[key] += [row['id'] for row in page[key]]
+                merged['requests_deleted'] += page['deleted']['requests']
+                merged['commodities_deleted'] = page['deleted']['commodities']
+                token = page['token']
+                if not page['more']:
+                    return merged, token
+
+        chw = self.chws[0]
+        first, token = sync(chw)
+        self.assertEqual(
+            sorted(first['requests']), sorted(CommodityRequest.objects.for_user(chw).values_list('id', flat=True))
+        )
+        self.assertEqual((first['request_logs'], len(first['commodities'])), ([], 5))
+        self.assertEqual(sync(chw, token)[0]['requests'], [])
+
+        deleted = CommodityRequest.objects.filter(requester=chw).exclude(pk=self.request.pk).first().pk
+        CommodityRequest.objects.get(pk=deleted).delete()
+        self.request.status, self.request.quantity_approved = 'APPROVED', 5
+        self.request.save()
+        log = RequestLog.objects.create(request=self.request, action='APPROVED', performed_by=self.cha)
+        Commodity.objects.filter(pk=self.commodities[1].pk).update(is_active=False, updated_at=timezone.now())
+        changes, token = sync(chw, token)
+        self.assertEqual(changes['requests'], [self.request.pk])
+        self.assertEqual(changes['request_logs'], [log.pk])
+        self.assertEqual(changes['requests_deleted'], [deleted])
+        self.assertEqual(changes['commodities_deleted'], [self.commodities[1].pk])
+
+        # A reassigned CHW's requests leave the old CHA's feed and join the new one's
+        _, cha_token = sync(self.cha)
+        other = User.objects.create(username='cha2', role='CHA')
+        moved = User.objects.get(pk=self.chws[1].pk)
+        moved.supervisor = other
+        moved.save()
+        moved_ids = sorted(CommodityRequest.objects.filter(requester=moved).values_list('id', flat=True))
+        self.assertEqual(sorted(sync(self.cha, cha_token)[0]['requests_deleted']), moved_ids)
+        self.assertEqual(sorted(sync(other)[0]['requests']), moved_ids)
+
+        self.assertEqual(self.call(chw, 'get', 'request_sync', {'token': 'nope'}).status_code, 400)
+        with override_settings(SYNC_TOMBSTONE_RETENTION_DAYS=0):
+            self.assertEqual(self.call(chw, 'get', 'request_sync', {'token': token}).status_code, 410)
+
+
+@override_settings(QUERY_BUDGET_MODE='raise')
+class SupervisorReassignmentTests(RequestTestCase):
+    def test_requests_follow_the_chw(self):
+        other = User.objects.create(username='cha2', role='CHA')
+        chw = User.objects.get(pk=self.chws[0].pk)
+        rollups = RequestDailyRollup.objects.filter(num_requests__gt=0).order_by(*RequestDailyRollup.KEY_FIELDS)
+        with self.captureOnCommitCallbacks(execute=True):
+            chw.supervisor = other
+            chw.save()
+
+        moved = CommodityRequest.objects.filter(requester=chw)
+        self.assertEqual(set(moved.values_list('supervisor', flat=True)), {other.pk})
+        self.assertFalse(moved.filter(status='PENDING').exclude(approver=other).exists())
+        self.assertTrue(moved.exclude(status='PENDING').filter(approver=self.cha).exists())
+        self.assertEqual(set(CommodityRequest.objects.for_user(other)), set(moved))
+        self.assertFalse(CommodityRequest.objects.for_user(self.cha).filter(requester=chw).exists())
+
+        incremental = list(rollups.values_list(*RequestDailyRollup.KEY_FIELDS, *RequestDailyRollup.VALUE_FIELDS))
+        call_command('backfill_rollups', stdout=StringIO())
+        self.assertEqual(
+            incremental,
+            list(rollups.values_list(*RequestDailyRollup.KEY_FIELDS, *RequestDailyRollup.VALUE_FIELDS)),
+        )
+
+    def test_new_supervisor_takes_over_the_queue(self):
+        other = User.objects.create(username='cha2', role='CHA')
+        chw = User.objects.get(pk=self.chws[0].pk)
+        chw.supervisor = other
+        chw.save()
+
+        pending = set(CommodityRequest.objects.filter(requester=chw, status='PENDING').values_list('pk', flat=True))
+        self.assertTrue(pending)
+        queue = self.call(other, 'get', 'pending_requests').data['results']
+        self.assertEqual({row['id'] for row in queue}, pending)
+        queue = self.call(self.cha, 'get', 'pending_requests').data['results']
+        self.assertFalse(pending & {row['id'] for row in queue})
+
+        actions = [{'id': pk, 'status': 'REJECTED', 'rejection_reason': 'Out of stock'} for pk in pending]
+        response = self.call(self.cha, 'post', 'request_bulk_update', {'actions': actions})
+        self.assertEqual(response.data['updated'], 0)
+        response = self.call(other, 'post', 'request_bulk_update', {'actions': actions})
+        self.assertEqual(response.data['updated'], len(pending))
+
+    def test_new_supervisor_can_open_and_change_decided_requests(self):
+        other = User.objects.create(username='cha2', role='CHA')
+        chw = User.objects.get(pk=self.chws[0].pk)
+        chw.supervisor = other
+        chw.save()
+
+        decided = CommodityRequest.objects.filter(requester=chw, approver=self.cha).exclude(status='PENDING').first()
+        self.assertIsNotNone(decided)
+        self.assertEqual(self.call(other, 'get', 'request_detail', pk=decided.pk).status_code, 200)
+        response = self.call(other, 'patch', 'request_detail', {'notes': 'Checked by the new CHA'}, pk=decided.pk)
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(CommodityRequest.objects.get(pk=decided.pk).notes, 'Checked by the new CHA')
+        # The previous CHA no longer sees it
+        self.assertEqual(self.call(self.cha, 'get', 'request_detail', pk=decided.pk).status_code, 404)
+
+    def test_other_changes_need_no_transaction(self):
+        chw = User.objects.get(pk=self.chws[0].pk)
+        # The UPDATE alone, no savepoint around it
+        with self.assertNumQueries(1):
+            chw.phone_number = '0700000000'
+            chw.save()
+
+
+class SeedLoadTests(TestCase):
+    ARGS = ('--chas', '2', '--chws-per-cha', '3', '--commodities', '5', '--requests', '70',
+            '--months', '1', '--end-date', '2026-03-15', '--batch-size', '25')
+
+    def seed(self, *extra):
+        out = StringIO()
+        call_command('seed_load', *self.ARGS, *extra, stdout=out)
+        return out.getvalue()
+
+    def dataset(self):
+        return list(CommodityRequest.objects.order_by('requester__username', 'created_at').values_list(
+            'requester__username', 'commodity__name', 'status', 'quantity_requested', 'quantity_approved', 'created_at'
+        ))
+
+    def assertSeeded(self, output):
+        generated = User.objects.filter(username__startswith=USERNAME_PREFIX)
+        self.assertEqual(generated.filter(role='CHA').count(), 2)
+        self.assertEqual(generated.filter(role='CHW', supervisor__isnull=False).count(), 6)
+        self.assertEqual(Commodity.objects.count(), 5)
+        self.assertEqual(CommodityRequest.objects.count(), 70)
+        self.assertEqual(RequestLog.objects.filter(action='CREATED').count(), 70)
+        self.assertIn(f'Created 70 requests and {RequestLog.objects.count()} request logs', output)
+        self.assertEqual(CommodityRequest.objects.filter(supervisor=F('requester__supervisor')).count(), 70)
+        self.assertEqual(RequestDailyRollup.objects.aggregate(total=Sum('num_requests'))['total'], 70)
+        out = StringIO()
+        call_command('reconcile_ledger', stdout=out)
+        self.assertIn('Ledger matches requests', out.getvalue())
+
+    def test_seed(self):
+        # COPY on PostgreSQL, bulk inserts elsewhere
+        self.assertSeeded(self.seed())
+        dataset = self.dataset()
+        with self.assertRaises(CommandError):
+            self.seed()
+        self.assertSeeded(self.seed('--clear'))
+        self.assertEqual(self.dataset(), dataset)
+
+    def test_insert_path_on_any_backend(self):
+        with mock.patch.object(SeedLoad, 'copy_batch', SeedLoad.insert_batch):
+            self.assertSeeded(self.seed())
+
+
+class KeysetPaginationTests(RequestTestCase):
+    """?paginate=cursor pages of the request list, newest first"""
+
+    def pages(self, page_size):
+        """Result ids of each page, following the next links, and the last response"""
+        response = self.call(self.admin, 'get', 'request_list', {'paginate': 'cursor', 'page_size': page_size})
+        pages = [[row['id'] for row in response.data['results']]]
+        while response.data['next']:
+            response = self.get(response.data['next'])
+            pages.append([row['id'] for row in response.data['results']])
+        return pages, response
+
+    def get(self, url):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.admin)}')
+        response = client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def expected(self):
+        return list(CommodityRequest.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+
+    def test_forward_and_backward(self):
+        pages, last = self.pages(5)
+        self.assertEqual([len(page) for page in pages], [5, 5, 2])
+        self.assertEqual([pk for page in pages for pk in page], self.expected())
+
+        backward, url = [], last.data['previous']
+        while url:
+            response = self.get(url)
+            backward.insert(0, [row['id'] for row in response.data['results']])
+            url = response.data['previous']
+        self.assertEqual(backward, pages[:-1])
+        # Back on the first page, whose next link leads forward again
+        self.assertEqual([row['id'] for row in self.get(response.data['next']).data['results']], pages[1])
+
+    def test_ties_on_the_timestamp(self):
+        CommodityRequest.objects.update(created_at=timezone.now())
+        pages, _ = self.pages(5)
+        self.assertEqual([pk for page in pages for pk in page], self.expected())
+
+    def test_invalid_cursors(self):
+        def cursor(payload):
+            return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+
+        now = timezone.now().isoformat()
+        for value in (
+            'not-a-cursor',
+            base64.urlsafe_b64encode(b'\xff\xfe').decode(),
+            cursor([now, 1]),
+            cursor({'p': [now]}),
+            cursor({'p': 'ab'}),
+            cursor({'p': ['yesterday', 1]}),
+            cursor({'p': ['2024-01-01T00:00:00', 1]}),
+            cursor({'p': [now, '1']}),
+            cursor({'p': [now, 2 ** 64]}),
+        ):
+            with self.subTest(cursor=value):
+                response = self.call(self.admin, 'get', 'request_list', {'cursor': value})
+                self.assertEqual(response.status_code, 400)
+
+
+class DashboardCacheTests(RequestTestCase):
+    """Snapshots are dropped for exactly the users a request change concerns"""
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+    def test_request_change_invalidates(self):
+        users = (self.chws[0], self.chws[1], self.cha, self.admin)
+        before = {user: self.call(user, 'get', 'dashboard_stats').data for user in users}
+        keys = {user: dashboard_cache_key(user) for user in users}
+        self.assertTrue(all(cache.get(key) is not None for key in keys.values()))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.request.status, self.request.quantity_approved = 'APPROVED', 5
+            self.request.save()
+
+        self.assertIsNone(cache.get(keys[self.chws[0]]))
+        self.assertIsNone(cache.get(keys[self.cha]))
+        self.assertIsNotNone(cache.get(keys[self.chws[1]]))
+        self.assertNotEqual(dashboard_cache_key(self.admin), keys[self.admin])
+        for user in (self.chws[0], self.cha, self.admin):
+            stats = self.call(user, 'get', 'dashboard_stats').data
+            self.assertEqual(stats['pending_requests'], before[user]['pending_requests'] - 1)
+
+    def test_admin_generation_survives_eviction(self):
+        key = dashboard_cache_key(self.admin)
+        cache.delete(ADMIN_GENERATION_KEY)
+        invalidate_dashboards([])
+        evicted_then_invalidated = dashboard_cache_key(self.admin)
+        cache.delete(ADMIN_GENERATION_KEY)
+        evicted_then_read = dashboard_cache_key(self.admin)
+        generation = lambda key: int(key.rsplit(':', 1)[1])
+        self.assertGreater(generation(evicted_then_invalidated), generation(key))
+        self.assertGreater(generation(evicted_then_read), generation(evicted_then_invalidated))
+
+
+class AllocationLedgerTests(RequestTestCase):
+    """The ledger holds the quantity approved per CHW, commodity and month"""
+
+    def ledger(self):
+        rows = AllocationLedger.objects.filter(quantity_used__gt=0)
+        return {
+            (requester, commodity, month): used
+            for requester, commodity, month, used in rows.values_list('requester', 'commodity', 'month', 'quantity_used')
+        }
+
+    def assertMatchesRequests(self):
+        expected = {}
+        for request in CommodityRequest.objects.filter(status__in=ALLOCATED_STATUSES):
+            key = (request.requester_id, request.commodity_id, month_start(request.created_at))
+            expected[key] = expected.get(key, 0) + request.quantity_approved
+        self.assertEqual(self.ledger(), {key: total for key, total in expected.items() if total})
+
+    def test_follows_requests(self):
+        self.assertMatchesRequests()
+        created = CommodityRequest.objects.create(
+            requester=self.chws[0], commodity=self.commodities[4], quantity_requested=7
+        )
+        self.assertMatchesRequests()
+
+        created.status, created.quantity_approved = 'APPROVED', 6
+        created.save()
+        self.assertEqual(AllocationLedger.used(self.chws[0], self.commodities[4]), 6)
+        self.assertMatchesRequests()
+
+        approved = CommodityRequest.objects.filter(status='APPROVED').exclude(pk=created.pk)
+        rejected = approved.first()
+        rejected.status = 'REJECTED'
+        rejected.save()
+        self.assertEqual(AllocationLedger.used(rejected.requester, rejected.commodity), 0)
+        self.assertMatchesRequests()
+
+        approved.first().delete()
+        created.delete()
+        self.assertMatchesRequests()
+
+    def test_refreshed_request_saves_from_its_new_state(self):
+        stale = CommodityRequest.objects.get(pk=self.request.pk)
+        approved = CommodityRequest.objects.get(pk=self.request.pk)
+        approved.status, approved.quantity_approved = 'APPROVED', 3
+        approved.save()
+
+        stale.refresh_from_db()
+        stale.status = 'DELIVERED'
+        stale.save()
+        self.assertEqual(AllocationLedger.used(self.request.requester, self.request.commodity), 3)
+        self.assertMatchesRequests()
+
+    def test_partially_loaded_request_saves(self):
+        rollups = RequestDailyRollup.objects.order_by(*RequestDailyRollup.KEY_FIELDS)
+        approved = CommodityRequest.objects.filter(status='APPROVED').only('id').first()
+        approved.status = 'REJECTED'
+        approved.save()
+        self.assertMatchesRequests()
+
+        incremental = list(rollups.values_list(*RequestDailyRollup.KEY_FIELDS, *RequestDailyRollup.VALUE_FIELDS))
+        call_command('backfill_rollups', stdout=StringIO())
+        self.assertEqual(
+            incremental,
+            list(rollups.values_list(*RequestDailyRollup.KEY_FIELDS, *RequestDailyRollup.VALUE_FIELDS)),
+        )
+
+    def test_reconcile_repairs_drift(self):
+        entries = AllocationLedger.objects.filter(quantity_used__gt=0).order_by('pk')
+        expected = self.ledger()
+        AllocationLedger.objects.filter(pk=entries[0].pk).update(quantity_used=F('quantity_used') + 3)
+        entries[1].delete()
+        AllocationLedger.objects.create(
+            requester=self.chws[2], commodity=self.commodities[4], month=month_start(), quantity_used=4
+        )
+
+        out = StringIO()
+        call_command('reconcile_ledger', stdout=out)
+        self.assertIn('1 mismatched, 1 stale and 1 missing', out.getvalue())
+        self.assertNotEqual(self.ledger(), expected)
+
+        call_command('reconcile_ledger', '--fix', stdout=StringIO())
+        self.assertEqual(self.ledger(), expected)
+        self.assertMatchesRequests()
+
+        AllocationLedger.objects.update(quantity_used=0)
+        call_command('reconcile_ledger', '--rebuild', stdout=StringIO())
+        self.assertMatchesRequests()
+
+
+@override_settings(QUERY_BUDGET_MODE='raise')
+class RollupTests(RequestTestCase):
+    def rollups(self, **filters):
+        return sorted(
+            RequestDailyRollup.objects.filter(**filters).values_list(
+                *RequestDailyRollup.KEY_FIELDS, *RequestDailyRollup.VALUE_FIELDS
+            )
+        )
+
+    def assertMatchesBackfill(self):
+        incremental = self.rollups()
+        call_command('backfill_rollups', stdout=StringIO())
+        self.assertEqual(incremental, self.rollups())
+
+    def test_rollups_follow_requests(self):
+        self.call(self.chws[1], 'post', 'request_basket', {'lines': [
+            {'commodity': self.commodities[4].pk, 'quantity_requested': 3}
+        ]})
+        self.call(self.cha, 'post', 'request_bulk_update', {'actions': [
+            {'id': self.request.pk, 'status': 'APPROVED', 'quantity_approved': 2}
+        ]})
+        request = CommodityRequest.objects.filter(status='PENDING').first()
+        request.status, request.rejection_reason = 'REJECTED', 'Duplicate'
+        request.save()
+        CommodityRequest.objects.filter(status='APPROVED').first().delete()
+
+        self.assertMatchesBackfill()
+
+        analytics = self.call(self.cha, 'get', 'request_analytics').data
+        self.assertEqual(
+            sum(row['count'] for row in analytics['status_distribution']), CommodityRequest.objects.count()
+        )
+
+    def test_requester_without_supervisor(self):
+        chw = User.objects.create(username='unsupervised', role='CHW')
+        requests = []
+        for _ in range(2):
+            request = CommodityRequest.objects.create(
+                requester=chw, commodity=self.commodities[0], quantity_requested=2
+            )
+            request.status, request.rejection_reason = 'REJECTED', 'Out of stock'
+            request.save()
+            requests.append(request)
+        self.assertEqual(len(self.rollups(requester=chw)), 1)
+
+        requests[0].delete()
+        self.assertEqual(
+            [row[-3:] for row in self.rollups(requester=chw)], [(1, 2, 0)]
+        )
+        requests[1].delete()
+        self.assertEqual(self.rollups(requester=chw), [])
+        self.assertMatchesBackfill()
+
+    def test_supervisor_deleted(self):
+        # Rows of the CHW with and without a supervisor end up under the same key
+        requests = [
+            CommodityRequest.objects.create(
+                requester=self.chws[0], commodity=self.commodities[4], quantity_requested=2,
+                status='REJECTED', rejection_reason='Out of stock',
+            )
+            for _ in range(2)
+        ]
+        CommodityRequest.objects.filter(pk=requests[0].pk).update(supervisor=None)
+        call_command('backfill_rollups', stdout=StringIO())
+        self.cha.delete()
+        self.assertFalse(RequestDailyRollup.objects.filter(supervisor__isnull=False).exists())
+        self.assertMatchesBackfill()
+
+    def test_no_empty_rows(self):
+        self.call(self.cha, 'post', 'request_bulk_update', {'actions': [
+            {'id': self.request.pk, 'status': 'REJECTED', 'rejection_reason': 'Out of stock'}
+        ]})
+        self.assertFalse(RequestDailyRollup.objects.filter(num_requests__lte=0).exists())
+        analytics = self.call(self.cha, 'get', 'request_analytics').data
+        self.assertNotIn(0, [row['count'] for row in analytics['status_distribution']])
+
+
+@override_settings(QUERY_BUDGET_MODE='raise', METRICS_ENABLED=True)
+class MetricsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cha = User.objects.create(username='cha', role='CHA')
+        cls.chw = User.objects.create(username='chw', role='CHW', supervisor=cha)
+        CommodityRequest.objects.create(
+            requester=cls.chw, commodity=Commodity.objects.create(name='Commodity'), quantity_requested=5
+        )
+
+    def setUp(self):
+        metrics.reset()
+        self.addCleanup(metrics.reset)
+        self.api = APIClient()
+        self.api.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.chw)}')
+
+    def scrape(self, **headers):
+        response = APIClient().get(reverse('metrics'), **headers)
+        self.assertEqual(response.status_code, 200)
+        return {
+            line.rsplit(' ', 1)[0]: float(line.rsplit(' ', 1)[1])
+            for line in response.content.decode().splitlines() if not line.startswith('#')
+        }
+
+    def test_routes_are_measured(self):
+        for _ in range(2):
+            self.api.get(reverse('request_list'))
+        self.api.get(reverse('allocation_status'))
+
+        samples = self.scrape()
+        labels = '{route="request_list",method="GET"}'
+        self.assertEqual(samples[f'chw_http_responses_total{labels[:-1]},status="200"}}'], 2)
+        self.assertEqual(samples[f'chw_http_request_duration_seconds_count{labels}'], 2)
+        self.assertEqual(
+            samples['chw_http_request_duration_seconds_bucket{route="request_list",method="GET",le="+Inf"}'], 2
+        )
+        self.assertGreater(samples[f'chw_http_request_sql_queries_sum{labels}'], 0)
+        self.assertGreater(samples[f'chw_http_request_sql_duration_seconds_sum{labels}'], 0)
+        self.assertGreater(samples[f'chw_http_request_serializer_duration_seconds_sum{labels}'], 0)
+        self.assertGreater(samples[f'chw_http_response_size_bytes_sum{labels}'], 0)
+        self.assertEqual(samples['chw_http_request_duration_seconds_count{route="allocation_status",method="GET"}'], 1)
+
+    @override_settings(METRICS_SLOW_REQUEST_MS=0.001)
+    def test_slow_requests_are_logged(self):
+        with self.assertLogs('chw_backend.metrics', 'WARNING') as logs:
+            self.api.get(reverse('request_list'))
+        self.assertIn('requests_commodityrequest', logs.output[0])
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_scrape_token(self):
+        self.assertEqual(APIClient().get(reverse('metrics')).status_code, 403)
+        self.scrape(HTTP_AUTHORIZATION='Bearer secret')
+
+
+class ResponseEncodingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.cha = User.objects.create(username='cha', role='CHA')
+        cls.chw = User.objects.create(username='chw', role='CHW', supervisor=cls.cha, first_name='Zoë')
+        CommodityRequest.objects.bulk_create(
+            CommodityRequest(
+                requester=cls.chw, supervisor=cls.cha, commodity=Commodity.objects.create(name=f'Commodity {i}'),
+                quantity_requested=5, notes='line\u2028separator',
+            )
+            for i in range(10)
+        )
+
+    def setUp(self):
+        self.api = APIClient()
+        self.api.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.chw)}')
+
+    def test_json_matches_drf(self):
+        for name in ('request_list', 'request_analytics', 'dashboard_stats'):
+            with self.subTest(name=name):
+                response = self.api.get(reverse(name))
+                self.assertEqual(response['Content-Type'], 'application/json')
+                self.assertEqual(response.content, JSONRenderer().render(response.data))
+        data = {'when': timezone.now(), 'amount': Decimal('1.50'), 1: 'int key', 'big': 2 ** 70}
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+
+    @skipUnless(msgpack, "msgpack is not installed")
+    def test_msgpack(self):
+        response = self.api.get(reverse('request_list'), HTTP_ACCEPT='application/msgpack')
+        self.assertEqual(response['Content-Type'], 'application/msgpack')
+        self.assertEqual(msgpack.unpackb(response.content), self.api.get(reverse('request_list')).json())
+
+    def test_compression(self):
+        url = reverse('request_list')
+        plain = self.api.get(url).content
+        self.assertGreater(len(plain), settings.RESPONSE_COMPRESSION_MIN_BYTES)
+        response = self.api.get(url, HTTP_ACCEPT_ENCODING='gzip;q=1.0, identity; q=0.5')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(gzip.decompress(response.content), plain)
+        if brotli:
+            response = self.api.get(url, HTTP_ACCEPT_ENCODING='gzip, br')
+            self.assertEqual(response['Content-Encoding'], 'br')
+            self.assertEqual(brotli.decompress(response.content), plain)
+
+        # Not below the threshold, nor when turned off for the view
+        self.assertFalse(self.api.get(url, {'page_size': 1, 'paginate': 'cursor'}, HTTP_ACCEPT_ENCODING='gzip')
+                         .has_header('Content-Encoding'))
+        with override_settings(RESPONSE_COMPRESSION_MIN_BYTES=0):
+            response = APIClient().post(reverse('token_refresh'), {'refresh': 'x'}, HTTP_ACCEPT_ENCODING='gzip')
+            self.assertFalse(response.has_header('Content-Encoding'))
+
+        # Streamed exports are compressed as they go
+        response = self.api.get(
+            reverse('request_export', kwargs={'output_format': 'ndjson'}), HTTP_ACCEPT_ENCODING='gzip'
+        )
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(len(gzip.decompress(b''.join(response.streaming_content)).splitlines()), 10)
+
+
+@skipUnless(connection.vendor == 'postgresql', "needs concurrent transactions")
+class LimitConcurrencyTests(TransactionTestCase):
+    """Limits hold when many submissions and approvals race each other"""
+
+    threads = 8
+
+    def setUp(self):
+        self.cha = User.objects.create(username='cha', role='CHA')
+        self.chw = User.objects.create(username='chw', role='CHW', supervisor=self.cha)
+        self.commodity = Commodity.objects.create(name='Commodity', max_monthly_allocation=20)
+
+    def race(self, calls):
+        """Run the calls in threads released at the same time; returns their results"""
+        barrier = threading.Barrier(len(calls))
+        results = [None] * len(calls)
+
+        def run(index, call):
+            try:
+                barrier.wait()
+                results[index] = call()
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=run, args=item) for item in enumerate(calls)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def api_client(self, user):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}')
+        return client
+
+    def test_concurrent_submissions(self):
+        data = {'commodity': self.commodity.pk, 'quantity_requested': 5}
+        statuses = self.race([
+            lambda: self.api_client(self.chw).post(reverse('request_create'), data, format='json').status_code,
+            lambda: self.api_client(self.chw).post(reverse('request_basket'), {'lines': [data]}, format='json').status_code,
+        ] * (self.threads // 2))
+        self.assertEqual(sorted(statuses), [201] + [400] * (self.threads - 1))
+        self.assertEqual(CommodityRequest.objects.count(), 1)
+
+    def test_concurrent_approvals(self):
+        requests = [
+            CommodityRequest.objects.create(
+                requester=self.chw, commodity=self.commodity, quantity_requested=6,
+                request_date=timezone.localdate() - timedelta(days=i),
+            )
+            for i in range(self.threads)
+        ]
+
+        def approve(request):
+            if request.pk % 2:
+                return self.api_client(self.cha).post(reverse('request_bulk_update'), {'actions': [
+                    {'id': request.pk, 'status': 'APPROVED', 'quantity_approved': 6}
+                ]}, format='json').data['updated'] == 1
+            return self.api_client(self.cha).patch(reverse('request_detail', kwargs={'pk': request.pk}), {
+                'status': 'APPROVED', 'quantity_approved': 6
+            }, format='json').status_code == 200
+
+        approved = self.race([functools.partial(approve, request) for request in requests])
+        self.assertEqual(sum(approved), 3)
+        self.assertEqual(AllocationLedger.used(self.chw, self.commodity), 18)
+        self.assertEqual(
+            CommodityRequest.objects.filter(status='APPROVED').aggregate(total=Sum('quantity_approved'))['total'], 18
+        )
+
+
+class AsyncStatsTests(TransactionTestCase):
+    """The async views run their queries on other connections, so the data is committed"""
+
+    def setUp(self):
+        cache.clear()
+        cha = User.objects.create(username='cha', role='CHA')
+        chw = User.objects.create(username='chw', role='CHW', supervisor=cha)
+        self.users = [chw, cha, User.objects.create(username='admin', role='ADMIN')]
+        for i in range(3):
+            commodity = Commodity.objects.create(name=f'Commodity {i}')
+            CommodityRequest.objects.create(requester=chw, commodity=commodity, quantity_requested=i + 1)
+
+    def tearDown(self):
+        # The test database cannot be dropped while the workers are connected
+        close_worker_connections()
+
+    def test_matches_sync_views(self):
+        for user in self.users:
+            client = APIClient()
+            client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}')
+            for name in ('dashboard_stats', 'request_analytics'):
+                with self.subTest(name=name, role=user.role):
+                    expected = client.get(reverse(name)).json()
+                    cache.clear()
+                    response = client.get(reverse(f'{name}_async'))
+                    self.assertEqual(response.status_code, 200)
+                    self.assertEqual(response.json(), expected)
+
+    def test_requires_authentication(self):
+        self.assertEqual(APIClient().get(reverse('dashboard_stats_async')).status_code, 401)
+
+
+@override_settings(PUSH_BROKER='local', PUSH_HEARTBEAT_SECONDS=0.5)
+class PushTests(TransactionTestCase):
+    """Request changes reach the open event streams of the CHA and CHW"""
+
+    def setUp(self):
+        self.cha = User.objects.create(username='cha', role='CHA')
+        self.other_cha = User.objects.create(username='other', role='CHA')
+        self.chw = User.objects.create(username='chw', role='CHW', supervisor=self.cha)
+        self.commodity = Commodity.objects.create(name='ORS')
+
+    def tearDown(self):
+        close_worker_connections()
+
+    async def open_stream(self, **kwargs):
+        response = await AsyncClient().get(reverse('request_events'), **kwargs)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        stream = aiter(response.streaming_content)
+        self.assertIn(b'event: ready\n', await self.next_chunk(stream))
+        return stream
+
+    async def next_chunk(self, stream):
+        return await asyncio.wait_for(anext(stream), 5)
+
+    async def next_event(self, stream):
+        while True:
+            chunk = await self.next_chunk(stream)
+            if not chunk.startswith(b':'):
+                event, data = chunk.decode().split('\n')[:2]
+                return event.removeprefix('event: '), json.loads(data.removeprefix('data: '))
+
+    async def test_request_changes_are_pushed(self):
+        def bearer(user):
+            return {'Authorization': f'Bearer {AccessToken.for_user(user)}'}
+        cha = await self.open_stream(headers=bearer(self.cha))
+        # EventSource cannot set headers
+        chw = await self.open_stream(data={'token': str(AccessToken.for_user(self.chw))})
+        other = await self.open_stream(headers=bearer(self.other_cha))
+
+        request = await sync_to_async(CommodityRequest.objects.create)(
+            requester=self.chw, commodity=self.commodity, quantity_requested=4
+        )
+        self.assertEqual(await self.next_event(cha), ('request_created', {
+            'id': request.pk, 'status': 'PENDING', 'requester': self.chw.pk, 'commodity': self.commodity.pk,
+            'quantity_requested': 4, 'quantity_approved': None,
+        }))
+
+        client = APIClient()
+        client.force_authenticate(self.cha)
+        response = await sync_to_async(client.post)(reverse('request_bulk_update'), {
+            'actions': [{'id': request.pk, 'status': 'APPROVED', 'quantity_approved': 3}],
+        }, format='json')
+        self.assertEqual(response.data['updated'], 1, response.data)
+        for stream in (cha, chw):
+            event, data = await self.next_event(stream)
+            self.assertEqual((event, data['status'], data['quantity_approved']),
+                             ('request_status_changed', 'APPROVED', 3))
+        # Nothing for users the request does not concern
+        self.assertEqual(await self.next_chunk(other), b': keepalive\n\n')
+
+    async def test_overflow_asks_for_resync(self):
+        with self.settings(PUSH_QUEUE_SIZE=2):
+            stream = push.event_stream(self.cha.pk)
+            await anext(stream)
+            for _ in range(3):
+                push.publish(push.request_events(
+                    CommodityRequest(requester=self.chw, commodity=self.commodity, supervisor=self.cha),
+                    created=True,
+                ))
+            await asyncio.sleep(0)
+            self.assertEqual(await anext(stream), b'event: resync\ndata: {}\n\n')
+            await stream.aclose()
+        self.assertEqual(get_broker().subscriber_count(), 0)
+
+    async def test_requires_authentication(self):
+        response = await AsyncClient().get(reverse('request_events'), {'token': 'invalid'})
+        self.assertEqual(response.status_code, 401)
+
+    def test_not_benchmarked(self):
+        # The benchmark would wait out the whole stream
+        routes = dict(BenchEndpoints().discover_routes())
+        self.assertNotIn('request_events', routes)
+        self.assertEqual(routes['request_export'], ['GET'])
+
+    def test_benchmark_reads_bounded_streams(self):
+        body = StreamingHttpResponse(b'x' * 10 for _ in range(100))
+        self.assertEqual(read_body(body, 35), 40)
+        self.assertEqual(read_body(StreamingHttpResponse(b'x' * 10 for _ in range(3)), 35), 30)
+
+
+@skipUnless(getattr(settings, 'TEST_DATABASE_REPLICAS', None), "needs a second database as replica (REPLICA_DB_HOSTS)")
+class ReplicaRoutingTests(TransactionTestCase):
+    """The test replica is a separate, empty database: what is read from it comes back empty"""
+    databases = '__all__'
+
+    def setUp(self):
+        cache.clear()
+        self.replica = settings.TEST_DATABASE_REPLICAS[0]
+        replicas = self.settings(DATABASE_REPLICAS=[self.replica])
+        replicas.enable()
+        self.addCleanup(replicas.disable)
+        self.admin = User.objects.create(username='admin', role='ADMIN')
+        self.cha = User.objects.create(username='cha', role='CHA')
+        chw = User.objects.create(username='chw', role='CHW', supervisor=self.cha)
+        self.requests = [
+            CommodityRequest.objects.create(
+                requester=chw, commodity=Commodity.objects.create(name=f'Commodity {i}'), quantity_requested=2
+            )
+            for i in range(2)
+        ]
+
+    def tearDown(self):
+        # The test databases cannot be dropped while a check is connected
+        monitor.stop()
+        close_worker_connections()
+
+    def requests_seen(self, user):
+        """Requests counted by the user's analytics, and whether they were read from the replica"""
+        client = APIClient()
+        client.force_authenticate(user)
+        with CaptureQueriesContext(connections[self.replica]) as replica_queries:
+            data = client.get(reverse('request_analytics')).json()
+        return sum(row['count'] for row in data['status_distribution']), bool(replica_queries)
+
+    def test_read_only_views_use_the_replica(self):
+        self.assertEqual(self.requests_seen(self.admin), (0, True))
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        self.assertEqual(client.get(reverse('dashboard_stats')).json()['total_requests'], 0)
+        response = client.get(reverse('request_export', kwargs={'output_format': 'ndjson'}))
+        self.assertEqual(b''.join(response.streaming_content), b'')
+        # Other views read from the primary
+        self.assertEqual(client.get(reverse('request_list')).json()['count'], 2)
+
+    def test_users_read_their_writes(self):
+        client = APIClient()
+        client.force_authenticate(self.cha)
+        response = client.post(reverse('request_bulk_update'), {
+            'actions': [{'id': self.requests[0].pk, 'status': 'APPROVED', 'quantity_approved': 2}],
+        }, format='json')
+        self.assertEqual(response.data['updated'], 1, response.data)
+        self.assertEqual(self.requests_seen(self.cha), (2, False))
+        self.assertEqual(self.requests_seen(self.admin), (0, True))
+
+    def test_lagging_or_unreachable_replica_is_skipped(self):
+        with self.settings(REPLICA_MAX_LAG_SECONDS=-1):
+            self.assertEqual(self.requests_seen(self.admin), (2, False))
+        self.assertEqual(monitor.lag[self.replica], 0)
+        monitor.lag[self.replica] = None
+        self.assertEqual(self.requests_seen(self.admin), (2, False))
@@ -5,9 +5,18 @@ urlpatterns = [
     path('', views.CommodityRequestListView.as_view(), name='request_list'),
     path('create/', views.CommodityRequestCreateView.as_view(), name='request_create'),
     path('<int:pk>/', views.CommodityRequestDetailView.as_view(), name='request_detail'),
+    path('basket/', views.submit_basket, name='request_basket'),
+    path('bulk/', views.bulk_update_requests, name='request_bulk_update'),
     path('pending/', views.PendingRequestsView.as_view(), name='pending_requests'),
+    path('sync/', views.sync_changes, name='request_sync'),
+    path('events/', views.request_events, name='request_events'),
     path('<int:request_id>/logs/', views.RequestLogListView.as_view(), name='request_logs'),
     path('dashboard/stats/', views.dashboard_stats, name='dashboard_stats'),
+    path('dashboard/stats/async/', views.dashboard_stats_async, name='dashboard_stats_async'),
     path('allocation-status/', views.monthly_allocation_status, name='allocation_status'),
     path('analytics/', views.request_analytics, name='request_analytics'),
+    path('export/<str:output_format>/', views.ExportView.as_view(), name='request_export'),
+    path('logs/export/<str:output_format>/', views.ExportView.as_view(export_name='request_logs'),
+         name='request_log_export'),
+    path('analytics/async/', views.request_analytics_async, name='request_analytics_async'),
 ]
\ No newline at end of file
@@ -1,35 +1,110 @@
-from rest_framework import generics, permissions, status
+import functools
+
+from rest_framework import generics, permissions, status, views
 from rest_framework.decorators import api_view, permission_classes
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.request import Request
 from rest_framework.response import Response
-from django.db.models import Q, Sum, Count
+from rest_framework.utils.encoders import JSONEncoder
+from django.core.handlers.asgi import ASGIRequest
+from django.db import IntegrityError, transaction
+from django.http import HttpResponseNotAllowed, JsonResponse, StreamingHttpResponse
 from django.utils import timezone
-from datetime import datetime, timedelta
-from .models import CommodityRequest, RequestLog
+from apps.authentication.authentication import ClaimsJWTAuthentication
+from .models import (
+    ALLOCATED_STATUSES, DAILY_LIMIT_MESSAGE, DAILY_LIMIT_STATUSES, AllocationLedger, AllocationLimitExceeded, CommodityRequest,
+    RequestDailyRollup, RequestLog, RequestLogArchive, month_start
+)
 from .serializer import (
     CommodityRequestSerializer, 
     CommodityRequestCreateSerializer,
     CommodityRequestUpdateSerializer,
+    BulkRequestActionSerializer,
+    BasketLineSerializer,
     RequestLogSerializer,
     DashboardStatsSerializer
 )
+from . import audit, push
 from .permissions import IsOwnerOrApprover
+from .cache import aget_dashboard_snapshot, get_dashboard_snapshot, invalidate_dashboards
+from .signals import request_audience
+from .pagination import KeysetPagination
+from .projections import LOG_PROJECTION, REQUEST_PROJECTION, ProjectedListMixin
+from .export import EXPORT_FORMATS, EXPORTS, arender, export_rows, parse_day, parse_ids, render
+from .stats import (
+    REQUEST_RELATED,
+    abuild_analytics,
+    abuild_dashboard_stats,
+    build_analytics,
+    build_dashboard_stats,
+    run_in_worker,
+)
+from .sync import build_changes
+from chw_backend.query_budget import query_budget
+from chw_backend.replicas import read_database, replica_reads
+# Most items accepted by one bulk approve/reject call
+MAX_BULK_ACTIONS = 200
+# Most lines accepted in one basket
+MAX_BASKET_LINES = 50
+# Rows per stream in one page of the changes feed, by default and at most
+SYNC_PAGE_SIZE = 200
+MAX_SYNC_PAGE_SIZE = 1000
+
+
+async def authenticate_async(request, query_token=False):
+    """Authenticate a plain Django request the way the API views do, None when it fails.
+
+    With query_token, an access token in the ``token`` query parameter is
+    accepted too, for clients that cannot set headers (EventSource).
+    """
+    def authenticate():
+        authentication = ClaimsJWTAuthentication()
+        try:
+            if query_token and 'token' in request.GET and 'HTTP_AUTHORIZATION' not in request.META:
+                return authentication.get_user(authentication.get_validated_token(request.GET['token']))
+            result = authentication.authenticate(Request(request))
+        except AuthenticationFailed:
+            return None
+        return result[0] if result else None
+    return await run_in_worker(authenticate)
+
+
+def not_authenticated():
+    return JsonResponse(
+        {'detail': 'Authentication credentials were not provided.'},
+        status=status.HTTP_401_UNAUTHORIZED,
+        headers={'WWW-Authenticate': 'Bearer realm="api"'}
+    )
+
+
+def async_api_view(view):
+    """Serve an async GET view returning a JSON payload, authenticated like the DRF views.
+
+    DRF views are sync only, the view is called as view(request, user).
+    """
+    @functools.wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if request.method != 'GET':
+            return HttpResponseNotAllowed(['GET'])
+        user = await authenticate_async(request)
+        if user is None:
+            return not_authenticated()
+        return JsonResponse(await view(request, user, *args, **kwargs), encoder=JSONEncoder)
+    return wrapper
 
 # Create your views here.
-class CommodityRequestListView(generics.ListAPIView):
+@query_budget(3)
+class CommodityRequestListView(ProjectedListMixin, generics.ListAPIView):
     serializer_class = CommodityRequestSerializer
+    projection = REQUEST_PROJECTION
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = KeysetPagination
+    cursor_ordering = ('-created_at', '-id')
     
     def get_queryset(self):
-        user = self.request.user
-        if user.role == 'CHW':
-            return CommodityRequest.objects.filter(requester=user)
-        elif user.role == 'CHA':
-            return CommodityRequest.objects.filter(
-                Q(approver=user) | Q(requester__supervisor=user)
-            )
-        else:  # Admin
-            return CommodityRequest.objects.all()
+        return CommodityRequest.objects.for_user(self.request.user)
 
+@query_budget(9)
 class CommodityRequestCreateView(generics.CreateAPIView):
     serializer_class = CommodityRequestCreateSerializer
     permission_classes = [permissions.IsAuthenticated]
@@ -37,27 +112,143 @@ class CommodityRequestCreateView(generics.CreateAPIView):
     def perform_create(self, serializer):
         request = serializer.save()
         # Create log entry
-        RequestLog.objects.create(
+        audit.write([RequestLog(
             request=request,
             action='CREATED',
             performed_by=self.request.user,
             details={'quantity_requested': request.quantity_requested}
+        )])
+
+@query_budget(9)
+@api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated])
+def submit_basket(request):
+    """Request several commodities in one call.
+
+    Expects ``{"lines": [{"commodity": 1, "quantity_requested": 5, "reason_for_request": ""}, ...],
+    "atomic": true}``. Daily and monthly limits are checked for every line with
+    one query each. With ``atomic`` (the default) nothing is created unless
+    every line passes; otherwise the valid lines are created and the others
+    reported.
+    """
+    from apps.commodities.models import Commodity
+
+    user = request.user
+    if user.role != 'CHW':
+        return Response({'error': 'Only CHWs can create commodity requests'},
+                       status=status.HTTP_403_FORBIDDEN)
+
+    lines = request.data.get('lines') if isinstance(request.data, dict) else None
+    if not isinstance(lines, list) or not lines:
+        return Response({'error': 'lines must be a non-empty list'},
+                       status=status.HTTP_400_BAD_REQUEST)
+    if len(lines) > MAX_BASKET_LINES:
+        return Response({'error': f'At most {MAX_BASKET_LINES} lines are allowed per basket'},
+                       status=status.HTTP_400_BAD_REQUEST)
+    atomic = request.data.get('atomic', True) not in (False, 'false', '0', 0)
+
+    results = []
+    valid = []
+    for index, line in enumerate(lines):
+        serializer = BasketLineSerializer(data=line)
+        if serializer.is_valid():
+            valid.append((index, serializer.validated_data))
+            results.append({'index': index, 'success': True})
+        else:
+            results.append({'index': index, 'success': False, 'errors': serializer.errors})
+
+    commodity_ids = {attrs['commodity'] for _, attrs in valid}
+    commodities = Commodity.objects.in_bulk(commodity_ids)
+    requested_today = CommodityRequest.commodities_requested_today(user, commodity_ids)
+    usage = AllocationLedger.usage_by_commodity(user)
+
+    new_requests = []
+    for index, attrs in valid:
+        commodity = commodities.get(attrs['commodity'])
+        quantity = attrs['quantity_requested']
+        error = None
+        if commodity is None:
+            error = "Commodity not found."
+        elif not commodity.is_active:
+            error = "This commodity is not currently available."
+        elif commodity.id in requested_today:
+            error = DAILY_LIMIT_MESSAGE.format(commodity=commodity.name)
+        else:
+            remaining = commodity.max_monthly_allocation - usage.get(commodity.id, 0)
+            if quantity > remaining:
+                error = (f"Monthly limit exceeded. You can only request {remaining} more "
+                         f"{commodity.name} this month.")
+            elif quantity > commodity.max_quantity_per_request:
+                error = f"Maximum {commodity.max_quantity_per_request} {commodity.name} allowed per request."
+        if error:
+            results[index].update(success=False, errors={'non_field_errors': [error]})
+            continue
+
+        # A later line for the same commodity hits the daily limit
+        requested_today.add(commodity.id)
+        results[index].update(commodity=commodity.id, monthly_remaining=remaining)
+        new_requests.append((index, CommodityRequest(
+            requester=user,
+            supervisor_id=user.supervisor_id,
+            approver_id=user.supervisor_id,
+            commodity=commodity,
+            quantity_requested=quantity,
+            reason_for_request=attrs['reason_for_request'],
+        )))
+
+    while True:
+        failed = len(results) - len(new_requests)
+        if not new_requests or (atomic and failed):
+            return Response({'created': 0, 'failed': failed, 'results': results},
+                           status=status.HTTP_400_BAD_REQUEST)
+        try:
+            create_basket(user, [obj for _, obj in new_requests])
+            break
+        except IntegrityError:
+            # A concurrent submission took some of the lines' daily slots after the check above
+            taken = CommodityRequest.commodities_requested_today(user, {obj.commodity_id for _, obj in new_requests})
+            if not taken:
+                raise
+            for index, obj in new_requests:
+                if obj.commodity_id in taken:
+                    results[index] = {'index': index, 'success': False, 'errors': {'non_field_errors': [
+                        DAILY_LIMIT_MESSAGE.format(commodity=obj.commodity.name)
+                    ]}}
+            new_requests = [(index, obj) for index, obj in new_requests if obj.commodity_id not in taken]
+
+    for index, obj in new_requests:
+        results[index]['id'] = obj.id
+    return Response({'created': len(new_requests), 'failed': failed, 'results': results},
+                   status=status.HTTP_201_CREATED)
+
+def create_basket(user, requests):
+    """Insert a basket's requests with their rollups and logs, all or none"""
+    with transaction.atomic():
+        created = CommodityRequest.objects.bulk_create(requests)
+        rollups = {}
+        for obj in created:
+            RequestDailyRollup.add(rollups, obj)
+        RequestDailyRollup.apply_deltas(rollups)
+        audit.write(
+            RequestLog(
+                request=obj,
+                action='CREATED',
+                performed_by=user,
+                details={'quantity_requested': obj.quantity_requested}
+            )
+            for obj in created
         )
+        transaction.on_commit(lambda: invalidate_dashboards([user.id, user.supervisor_id]))
+        # bulk_create sends no post_save
+        push.publish_on_commit(event for obj in created for event in push.request_events(obj, created=True))
 
+@query_budget(12)
 class CommodityRequestDetailView(generics.RetrieveUpdateAPIView):
     serializer_class = CommodityRequestSerializer
     permission_classes = [permissions.IsAuthenticated, IsOwnerOrApprover]
     
     def get_queryset(self):
-        user = self.request.user
-        if user.role == 'CHW':
-            return CommodityRequest.objects.filter(requester=user)
-        elif user.role == 'CHA':
-            return CommodityRequest.objects.filter(
-                Q(approver=user) | Q(requester__supervisor=user)
-            )
-        else:  # Admin
-            return CommodityRequest.objects.all()
+        return CommodityRequest.objects.for_user(self.request.user).select_related(*REQUEST_RELATED)
     
     def get_serializer_class(self):
         if self.request.method == 'PUT' or self.request.method == 'PATCH':
@@ -65,12 +256,12 @@ class CommodityRequestDetailView(generics.RetrieveUpdateAPIView):
         return CommodityRequestSerializer
     
     def perform_update(self, serializer):
-        old_status = self.get_object().status
+        old_status = serializer.instance.status
         request = serializer.save()
         
         # Create log entry if status changed
         if old_status != request.status:
-            RequestLog.objects.create(
+            audit.write([RequestLog(
                 request=request,
                 action=request.status,
                 performed_by=self.request.user,
@@ -79,80 +270,218 @@ class CommodityRequestDetailView(generics.RetrieveUpdateAPIView):
                     'new_status': request.status,
                     'quantity_approved': request.quantity_approved
                 }
+            )])
+
+@query_budget(11)
+@api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated])
+def bulk_update_requests(request):
+    """Approve or reject many requests in one call.
+
+    Expects ``{"actions": [{"id": 1, "status": "APPROVED", "quantity_approved": 5}, ...]}``.
+    Every item is validated like a single PATCH; the valid ones are applied in
+    one transaction and a result is returned for each item, in order.
+    """
+    if request.user.role != 'CHA':
+        return Response({'error': 'Only CHAs can update request status'},
+                       status=status.HTTP_403_FORBIDDEN)
+
+    actions = request.data.get('actions') if isinstance(request.data, dict) else None
+    if not isinstance(actions, list) or not actions:
+        return Response({'error': 'actions must be a non-empty list'},
+                       status=status.HTTP_400_BAD_REQUEST)
+    if len(actions) > MAX_BULK_ACTIONS:
+        return Response({'error': f'At most {MAX_BULK_ACTIONS} actions are allowed per call'},
+                       status=status.HTTP_400_BAD_REQUEST)
+
+    results = []
+    valid = {}
+    for item in actions:
+        serializer = BulkRequestActionSerializer(data=item, context={'request': request})
+        if not serializer.is_valid():
+            results.append({'id': item.get('id') if isinstance(item, dict) else None,
+                            'success': False, 'errors': serializer.errors})
+            continue
+        attrs = serializer.validated_data
+        if attrs['id'] in valid:
+            results.append({'id': attrs['id'], 'success': False,
+                            'errors': {'id': ['Duplicate request id.']}})
+            continue
+        valid[attrs['id']] = attrs
+        results.append({'id': attrs['id'], 'success': True})
+
+    with transaction.atomic():
+        # Same scope as the request list: the requests of the CHWs this CHA supervises
+        requests = CommodityRequest.objects.for_user(request.user).select_for_update(of=('self',)).filter(
+            pk__in=valid
+        ).select_related('requester', 'commodity')
+        requests = {obj.pk: obj for obj in requests}
+        # Monthly limits are checked against locked ledger rows, so concurrent approvals cannot overshoot
+        ledger = AllocationLedger.lock(
+            (obj.requester_id, obj.commodity_id, month_start(obj.created_at))
+            for obj in requests.values()
+            if obj.status in ALLOCATED_STATUSES or valid[obj.pk]['status'] in ALLOCATED_STATUSES
+        )
+        # Rejected or delivered requests taken back need their day's slot to be free
+        slots = CommodityRequest.daily_slots_taken(
+            obj for obj in requests.values()
+            if obj.status not in DAILY_LIMIT_STATUSES and valid[obj.pk]['status'] in DAILY_LIMIT_STATUSES
+        )
+
+        now = timezone.now()
+        updated, logs, deltas, rollups, audience, events = [], [], {}, {}, set(), []
+        for result in results:
+            obj = requests.get(result['id']) if result['success'] else None
+            if obj is None:
+                if result['success']:
+                    result.update(success=False, errors={'id': ['Not found.']})
+                continue
+
+            old_status, old_quantity = obj.status, obj.quantity_approved
+            attrs = valid[obj.pk]
+            slot = slots.setdefault((obj.requester_id, obj.commodity_id, obj.request_date), set())
+            if old_status not in DAILY_LIMIT_STATUSES and attrs['status'] in DAILY_LIMIT_STATUSES and slot:
+                result.update(success=False, errors={
+                    'non_field_errors': [DAILY_LIMIT_MESSAGE.format(commodity=obj.commodity.name)]
+                })
+                continue
+            key = (obj.requester_id, obj.commodity_id, month_start(obj.created_at))
+            delta = (
+                obj.allocated_quantity(attrs['status'], attrs.get('quantity_approved', old_quantity))
+                - obj.allocated_quantity(old_status, old_quantity)
             )
+            if delta > 0:
+                remaining = obj.commodity.max_monthly_allocation - ledger[key].quantity_used - deltas.get(key, 0)
+                if delta > remaining:
+                    result.update(success=False, errors={
+                        'non_field_errors': AllocationLimitExceeded(remaining).messages
+                    })
+                    continue
+            deltas[key] = deltas.get(key, 0) + delta
+            # The rows are written in one UPDATE, checked row by row: a slot freed
+            # by this call is only free for the next one
+            if attrs['status'] in DAILY_LIMIT_STATUSES:
+                slot.add(obj.pk)
+
+            RequestDailyRollup.add(rollups, obj, old_status, obj.quantity_requested, old_quantity, sign=-1)
+            for field, value in attrs.items():
+                setattr(obj, field, value)
+            if obj.status == 'APPROVED' and not obj.approved_at:
+                obj.approved_at = now
+            if obj.status == 'DELIVERED' and not obj.delivered_at:
+                obj.delivered_at = now
+            obj.updated_at = now
+            updated.append(obj)
+            RequestDailyRollup.add(rollups, obj)
+
+            if old_status != obj.status:
+                logs.append(RequestLog(
+                    request=obj,
+                    action=obj.status,
+                    performed_by=request.user,
+                    details={
+                        'old_status': old_status,
+                        'new_status': obj.status,
+                        'quantity_approved': obj.quantity_approved
+                    }
+                ))
+                audience.update(request_audience(obj))
+                events.extend(push.request_events(obj, created=False))
+            result['status'] = obj.status
 
-class PendingRequestsView(generics.ListAPIView):
+        CommodityRequest.objects.bulk_update(updated, [
+            'status', 'quantity_approved', 'rejection_reason', 'notes',
+            'approved_at', 'delivered_at', 'updated_at'
+        ])
+        AllocationLedger.apply_deltas(deltas, ledger)
+        RequestDailyRollup.apply_deltas(rollups)
+        audit.write(logs)
+        if audience:
+            transaction.on_commit(lambda: invalidate_dashboards(audience))
+        push.publish_on_commit(events)
+
+    return Response({
+        'updated': len(updated),
+        'failed': len(results) - len(updated),
+        'results': results,
+    })
+
+@query_budget(3)
+class PendingRequestsView(ProjectedListMixin, generics.ListAPIView):
     serializer_class = CommodityRequestSerializer
+    projection = REQUEST_PROJECTION
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = KeysetPagination
+    cursor_ordering = ('created_at', 'id')
     
     def get_queryset(self):
         user = self.request.user
         if user.role == 'CHA':
-            return CommodityRequest.objects.filter(
-                approver=user,
-                status='PENDING'
-            ).order_by('created_at')
+            return CommodityRequest.objects.for_user(user).filter(status='PENDING').order_by('created_at')
         return CommodityRequest.objects.none()
 
-class RequestLogListView(generics.ListAPIView):
+@query_budget(4)
+class RequestLogListView(ProjectedListMixin, generics.ListAPIView):
     serializer_class = RequestLogSerializer
+    projection = LOG_PROJECTION
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = KeysetPagination
+    cursor_ordering = ('-timestamp', '-id')
     
     def get_queryset(self):
-        request_id = self.kwargs.get('request_id')
-        return RequestLog.objects.filter(request_id=request_id)
+        return RequestLog.objects.filter(request_id=self.kwargs.get('request_id'))
+
+    def get_rows(self):
+        logs = super().get_rows()
+        archived = RequestLogArchive.rows_for(self.kwargs.get('request_id'))
+        if not archived:
+            return logs
+        # Read through to the archive: a request's log is short, so the live
+        # and archived entries are merged and paginated in memory
+        return sorted(archived + list(logs), key=lambda log: (log['timestamp'], log['id']), reverse=True)
 
+@query_budget(4)
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
 def dashboard_stats(request):
     user = request.user
-    
-    # Base queryset based on user role
-    if user.role == 'CHW':
-        base_queryset = CommodityRequest.objects.filter(requester=user)
-    elif user.role == 'CHA':
-        base_queryset = CommodityRequest.objects.filter(
-            Q(approver=user) | Q(requester__supervisor=user)
-        )
-    else:  # Admin
-        base_queryset = CommodityRequest.objects.all()
-    
-    # Calculate stats
-    total_requests = base_queryset.count()
-    pending_requests = base_queryset.filter(status='PENDING').count()
-    approved_requests = base_queryset.filter(status='APPROVED').count()
-    rejected_requests = base_queryset.filter(status='REJECTED').count()
-    
-    # Monthly requests (current month)
-    current_month = timezone.now().replace(day=1)
-    monthly_requests = base_queryset.filter(created_at__gte=current_month).count()
-    
-    # Top commodities (last 30 days)
-    last_30_days = timezone.now() - timedelta(days=30)
-    top_commodities = base_queryset.filter(
-        created_at__gte=last_30_days
-    ).values(
-        'commodity__name'
-    ).annotate(
-        request_count=Count('id'),
-        total_quantity=Sum('quantity_requested')
-    ).order_by('-request_count')[:5]
-    
-    # Recent requests (last 10)
-    recent_requests = base_queryset.order_by('-created_at')[:10]
-    
-    stats = {
-        'total_requests': total_requests,
-        'pending_requests': pending_requests,
-        'approved_requests': approved_requests,
-        'rejected_requests': rejected_requests,
-        'monthly_requests': monthly_requests,
-        'top_commodities': list(top_commodities),
-        'recent_requests': CommodityRequestSerializer(recent_requests, many=True).data
-    }
-    
+    with replica_reads(user.pk):
+        stats = get_dashboard_snapshot(user, lambda: build_dashboard_stats(user))
     return Response(stats)
 
+@query_budget(4)
+@async_api_view
+async def dashboard_stats_async(request, user):
+    """dashboard_stats with its aggregates run concurrently, for ASGI deployments"""
+    with replica_reads(user.pk):
+        return await aget_dashboard_snapshot(user, lambda: abuild_dashboard_stats(user))
+
+@query_budget(5)
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def sync_changes(request):
+    """What changed since the client's sync token (see sync.py)"""
+    try:
+        limit = max(1, min(int(request.query_params['limit']), MAX_SYNC_PAGE_SIZE))
+    except (KeyError, ValueError):
+        limit = SYNC_PAGE_SIZE
+    return Response(build_changes(request.user, request.query_params.get('token'), limit))
+
+@query_budget(1)
+async def request_events(request):
+    """Server-sent events of the user's request changes (see push.py), ASGI only"""
+    if request.method != 'GET':
+        return HttpResponseNotAllowed(['GET'])
+    user = await authenticate_async(request, query_token=True)
+    if user is None:
+        return not_authenticated()
+    response = StreamingHttpResponse(push.event_stream(user.pk), content_type='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    # Keeps nginx from buffering the stream
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@query_budget(3)
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
 def monthly_allocation_status(request):
@@ -161,20 +490,14 @@ def monthly_allocation_status(request):
         return Response({'error': 'Only CHWs can check allocation status'}, 
                        status=status.HTTP_403_FORBIDDEN)
     
-    current_month = timezone.now().replace(day=1)
-    
     # Get all commodities and their usage this month
     from apps.commodities.models import Commodity
     commodities = Commodity.objects.filter(is_active=True)
+    usage = AllocationLedger.usage_by_commodity(request.user)
     
     allocation_status = []
     for commodity in commodities:
-        used = CommodityRequest.objects.filter(
-            requester=request.user,
-            commodity=commodity,
-            created_at__gte=current_month,
-            status__in=['APPROVED', 'DELIVERED']
-        ).aggregate(total=Sum('quantity_approved'))['total'] or 0
+        used = usage.get(commodity.id, 0)
         
         remaining = commodity.max_monthly_allocation - used
         
@@ -189,44 +512,57 @@ def monthly_allocation_status(request):
     
     return Response(allocation_status)
 
+@query_budget(4)
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
 def request_analytics(request):
     """Get analytics data for charts"""
-    user = request.user
-    
-    # Base queryset
-    if user.role == 'CHW':
-        base_queryset = CommodityRequest.objects.filter(requester=user)
-    elif user.role == 'CHA':
-        base_queryset = CommodityRequest.objects.filter(
-            Q(approver=user) | Q(requester__supervisor=user)
+    with replica_reads(request.user.pk):
+        return Response(build_analytics(request.user))
+
+@query_budget(4)
+@async_api_view
+async def request_analytics_async(request, user):
+    """request_analytics with its aggregates run concurrently, for ASGI deployments"""
+    with replica_reads(user.pk):
+        return await abuild_analytics(user)
+
+@query_budget(2)
+class ExportView(views.APIView):
+    """Stream every request (or request log) the user can see as CSV or NDJSON.
+
+    Filters: date_from and date_to (YYYY-MM-DD, inclusive), status and
+    commodity (comma separated). Rows are read in chunks through a
+    server-side cursor while the response is sent, under WSGI or ASGI.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    export_name = 'requests'
+
+    def get(self, request, output_format):
+        if output_format not in EXPORT_FORMATS:
+            return Response({'error': f"Format must be one of {', '.join(EXPORT_FORMATS)}"},
+                           status=status.HTTP_404_NOT_FOUND)
+        params = request.query_params
+        try:
+            filters = {
+                'date_from': parse_day(params['date_from'], 'date_from') if params.get('date_from') else None,
+                'date_to': parse_day(params['date_to'], 'date_to') if params.get('date_to') else None,
+                'statuses': [s for s in params.get('status', '').split(',') if s],
+                'commodities': parse_ids(params.get('commodity', ''), 'commodity'),
+            }
+        except ValueError as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+
+        export = EXPORTS[self.export_name]
+        with replica_reads(request.user.pk):
+            # The rows are read while the response streams, after the block
+            rows = export_rows(export, request.user, using=read_database(), **filters)
+        # Under ASGI the chunks must come from an async iterator to be streamed
+        renderer = arender if isinstance(request._request, ASGIRequest) else render
+        response = StreamingHttpResponse(
+            renderer(export, output_format, rows), content_type=EXPORT_FORMATS[output_format]
         )
-    else:  # Admin
-        base_queryset = CommodityRequest.objects.all()
-    
-    # Requests by status
-    status_data = base_queryset.values('status').annotate(count=Count('id'))
-    
-    # Requests by month (last 6 months)
-    six_months_ago = timezone.now() - timedelta(days=180)
-    monthly_data = base_queryset.filter(
-        created_at__gte=six_months_ago
-    ).extra(
-        select={'month': 'EXTRACT(month FROM created_at)', 'year': 'EXTRACT(year FROM created_at)'}
-    ).values('month', 'year').annotate(count=Count('id')).order_by('year', 'month')
-    
-    # Top commodities
-    commodity_data = base_queryset.values(
-        'commodity__name'
-    ).annotate(
-        count=Count('id'),
-        total_quantity=Sum('quantity_requested')
-    ).order_by('-count')[:10]
-    
-    return Response({
-        'status_distribution': list(status_data),
-        'monthly_trends': list(monthly_data),
-        'top_commodities': list(commodity_data)
-    })
+        filename = f"{export.name}-{timezone.localdate():%Y%m%d}.{output_format}"
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
 
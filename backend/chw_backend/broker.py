@@ -0,0 +1,151 @@
+"""
+Publish/subscribe of small JSON messages to the connections of a process.
+
+Subscribers are coroutines (one per open event stream) on the ASGI event
+loop; each gets a bounded queue, so holding thousands of idle ones costs no
+threads. ``settings.PUSH_BROKER`` picks how messages reach them:
+
+- 'local': published messages go to the subscribers of this process only.
+  Enough for a single worker and for the tests.
+- 'postgres': messages go through PostgreSQL NOTIFY on the PUSH_CHANNEL
+  channel; every process LISTENs on one connection of its own, from a
+  background thread started with its first subscriber.
+"""
+import asyncio
+import json
+import logging
+import select
+import threading
+import time
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+PUSH_CHANNEL = 'chw_push'
+
+
+class Subscription:
+    """Messages for a set of channels, read from the event loop that subscribed"""
+
+    def __init__(self, broker, channels, maxsize):
+        self.broker = broker
+        self.channels = channels
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize)
+        # Set when messages were dropped because the reader fell behind
+        self.overflowed = False
+
+    def put(self, message):
+        if self.queue.full():
+            self.overflowed = True
+        else:
+            self.queue.put_nowait(message)
+
+    async def get(self):
+        return await self.queue.get()
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class LocalBroker:
+    def __init__(self):
+        self._subscribers = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, *channels):
+        """Subscribe the running event loop to the channels"""
+        subscription = Subscription(self, channels, settings.PUSH_QUEUE_SIZE)
+        with self._lock:
+            for channel in channels:
+                self._subscribers.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            for channel in subscription.channels:
+                subscribers = self._subscribers.get(channel)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._subscribers[channel]
+
+    def subscriber_count(self):
+        with self._lock:
+            return len({subscription for subscribers in self._subscribers.values() for subscription in subscribers})
+
+    def publish(self, channel, message):
+        self.deliver(channel, message)
+
+    def deliver(self, channel, message):
+        """Hand a message to this process' subscribers of the channel, from any thread"""
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        for subscription in subscribers:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.put, message)
+            except RuntimeError:
+                # Its event loop is gone
+                self.unsubscribe(subscription)
+
+
+class PostgresBroker(LocalBroker):
+    reconnect_delay = 1
+
+    def __init__(self, alias='default'):
+        super().__init__()
+        self.alias = alias
+        self._listener = None
+
+    def subscribe(self, *channels):
+        with self._lock:
+            if self._listener is None:
+                self._listener = threading.Thread(target=self._listen, name='push-listener', daemon=True)
+                self._listener.start()
+        return super().subscribe(*channels)
+
+    def publish(self, channel, message):
+        payload = json.dumps({'channel': channel, 'message': message}, separators=(',', ':'))
+        with connections[self.alias].cursor() as cursor:
+            # Delivered when the publishing transaction commits
+            cursor.execute('SELECT pg_notify(%s, %s)', [PUSH_CHANNEL, payload])
+
+    def _listen(self):
+        while True:
+            connection = connections.create_connection(self.alias)
+            try:
+                connection.ensure_connection()
+                raw = connection.connection
+                with raw.cursor() as cursor:
+                    cursor.execute(f'LISTEN {PUSH_CHANNEL}')
+                while True:
+                    if select.select([raw], [], [], 60) == ([], [], []):
+                        continue
+                    raw.poll()
+                    while raw.notifies:
+                        notification = json.loads(raw.notifies.pop(0).payload)
+                        self.deliver(notification['channel'], notification['message'])
+            except Exception:
+                logger.exception("Push listener lost its connection, reconnecting")
+                time.sleep(self.reconnect_delay)
+            finally:
+                connection.close()
+
+
+BROKERS = {
+    'local': LocalBroker,
+    'postgres': PostgresBroker,
+}
+
+_brokers = {}
+_brokers_lock = threading.Lock()
+
+
+def get_broker():
+    """The process' broker of the settings.PUSH_BROKER kind"""
+    with _brokers_lock:
+        if settings.PUSH_BROKER not in _brokers:
+            _brokers[settings.PUSH_BROKER] = BROKERS[settings.PUSH_BROKER]()
+        return _brokers[settings.PUSH_BROKER]
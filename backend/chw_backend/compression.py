@@ -0,0 +1,141 @@
+"""
+Response compression.
+
+CompressionMiddleware compresses responses of at least
+``settings.RESPONSE_COMPRESSION_MIN_BYTES`` (and streamed ones, such as the
+exports) with brotli when the client accepts it and the brotli package is
+installed, else with gzip. Event streams are left alone.
+
+Views adjust it with the ``@compression`` decorator, e.g. to turn it off for
+responses that carry secrets next to reflected input (BREACH); gzip output
+gets Django's random filename padding against that, brotli output does not.
+"""
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+from django.utils.text import compress_sequence, compress_string
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Server preference between encodings the client accepts with the same q
+ENCODINGS = ('br', 'gzip') if brotli else ('gzip',)
+# Random bytes added to gzip output, as GZipMiddleware does
+GZIP_RANDOM_BYTES = 100
+
+
+def compression(enabled=True, min_bytes=None):
+    """Per-view compression: off, or with its own size threshold"""
+    def decorator(view):
+        view.compression = {'enabled': enabled, 'min_bytes': min_bytes}
+        return view
+    return decorator
+
+
+def choose_encoding(accept_encoding):
+    """The preferred encoding among those the Accept-Encoding header allows, or None"""
+    weights = {}
+    for part in accept_encoding.split(','):
+        coding, *params = [item.strip() for item in part.split(';')]
+        weight = 1.0
+        for param in params:
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+        if coding:
+            weights[coding.lower()] = weight
+    default = weights.get('*', 0.0)
+    ranked = sorted(
+        ((weights.get(coding, default), -rank, coding) for rank, coding in enumerate(ENCODINGS)), reverse=True
+    )
+    weight, _, coding = ranked[0]
+    return coding if weight > 0 else None
+
+
+def compress(content, encoding):
+    if encoding == 'br':
+        return brotli.compress(content, quality=settings.RESPONSE_COMPRESSION_BROTLI_QUALITY)
+    return compress_string(content, max_random_bytes=GZIP_RANDOM_BYTES)
+
+
+def compress_chunks(chunks, encoding):
+    if encoding == 'gzip':
+        yield from compress_sequence(chunks, max_random_bytes=GZIP_RANDOM_BYTES)
+        return
+    compressor = brotli.Compressor(quality=settings.RESPONSE_COMPRESSION_BROTLI_QUALITY)
+    for chunk in chunks:
+        # Flushed per chunk, so a slow stream is not held back
+        data = compressor.process(chunk) + compressor.flush()
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+async def acompress_chunks(chunks, encoding):
+    if encoding == 'gzip':
+        # One gzip member per chunk, as GZipMiddleware does
+        async for chunk in chunks:
+            yield compress_string(chunk, max_random_bytes=GZIP_RANDOM_BYTES)
+        return
+    compressor = brotli.Compressor(quality=settings.RESPONSE_COMPRESSION_BROTLI_QUALITY)
+    async for chunk in chunks:
+        data = compressor.process(chunk) + compressor.flush()
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+class CompressionMiddleware(MiddlewareMixin):
+    """Put it right after MetricsMiddleware, above anything reading the response body"""
+
+    def __init__(self, get_response):
+        if not settings.RESPONSE_COMPRESSION:
+            raise MiddlewareNotUsed
+        super().__init__(get_response)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view_class = getattr(view_func, 'cls', None) or getattr(view_func, 'view_class', None)
+        request.compression = getattr(view_func, 'compression', None) or getattr(view_class, 'compression', None)
+
+    def process_response(self, request, response):
+        options = getattr(request, 'compression', None) or {}
+        if not options.get('enabled', True) or response.has_header('Content-Encoding'):
+            return response
+        if response.get('Content-Type', '').startswith('text/event-stream'):
+            return response
+        min_bytes = options.get('min_bytes')
+        if min_bytes is None:
+            min_bytes = settings.RESPONSE_COMPRESSION_MIN_BYTES
+        if not response.streaming and len(response.content) < min_bytes:
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        encoding = choose_encoding(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if encoding is None:
+            return response
+
+        if response.streaming:
+            if response.is_async:
+                response.streaming_content = acompress_chunks(response.streaming_content, encoding)
+            else:
+                response.streaming_content = compress_chunks(response.streaming_content, encoding)
+            del response.headers['Content-Length']
+        else:
+            content = compress(response.content, encoding)
+            if len(content) >= len(response.content):
+                return response
+            response.content = content
+            response.headers['Content-Length'] = str(len(content))
+
+        # A strong ETag names one representation; weak ones still match If-None-Match
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        response.headers['Content-Encoding'] = encoding
+        return response
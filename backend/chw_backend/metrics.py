@@ -0,0 +1,283 @@
+"""
+Per-route request metrics in the Prometheus text format.
+
+With ``settings.METRICS_ENABLED``, MetricsMiddleware records for every
+request to a named route its wall time, SQL query count and time, time spent
+in serializers (DRF validation and ``.data``, and functions decorated with
+``timed_serialization`` such as the list projections) and response size, as
+histograms labelled with the route name and method. ``GET /metrics`` serves
+them (behind ``METRICS_TOKEN`` when set).
+
+SQL is recorded by an execute wrapper installed on every connection, which
+only does work while a request is being measured; queries run on other
+threads for the request (sync_to_async, the async query workers) are
+counted too, since the sample travels in a context variable.
+
+Requests slower than ``METRICS_SLOW_REQUEST_MS`` are logged with their most
+expensive SQL statements. Metrics are kept per process.
+"""
+import functools
+import logging
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import Http404, HttpResponse, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+from rest_framework import serializers
+
+logger = logging.getLogger(__name__)
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+# name: (help, buckets) of the histograms kept per route and method
+HISTOGRAMS = {
+    'http_request_duration_seconds': ("Wall time of the request", DURATION_BUCKETS),
+    'http_request_sql_queries': ("SQL queries run for the request", QUERY_BUCKETS),
+    'http_request_sql_duration_seconds': ("Time spent running SQL for the request", DURATION_BUCKETS),
+    'http_request_serializer_duration_seconds': ("Time spent in serializers", DURATION_BUCKETS),
+    'http_response_size_bytes': ("Response body size, streaming responses excluded", SIZE_BUCKETS),
+}
+PREFIX = 'chw_'
+
+
+class Histogram:
+    __slots__ = ('buckets', 'counts', 'sum')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        # The last slot counts the values above every bucket
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def cumulative(self):
+        total = 0
+        for bound, count in zip((*self.buckets, '+Inf'), self.counts):
+            total += count
+            yield bound, total
+
+
+class RouteMetrics:
+    def __init__(self):
+        self.histograms = {name: Histogram(buckets) for name, (_, buckets) in HISTOGRAMS.items()}
+        self.responses = {}
+
+
+class Sample:
+    """What one request spent its time on; SQL statements are kept for slow request logs"""
+
+    __slots__ = ('queries', 'sql_time', 'serializer_time', 'in_serializer', 'statements')
+
+    def __init__(self, keep_statements):
+        self.queries = 0
+        self.sql_time = 0.0
+        self.serializer_time = 0.0
+        self.in_serializer = False
+        self.statements = [] if keep_statements else None
+
+
+current_sample = ContextVar('metrics_sample', default=None)
+
+_routes = {}
+_lock = threading.Lock()
+
+
+def record_sql(execute, sql, params, many, context):
+    sample = current_sample.get()
+    if sample is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = time.perf_counter() - started
+        sample.queries += 1
+        sample.sql_time += elapsed
+        if sample.statements is not None:
+            sample.statements.append((elapsed, sql))
+
+
+def _install_sql_recorder(connection, **kwargs):
+    # At the front: connection.execute_wrapper() pops the last wrapper on exit,
+    # and a connection may be opened inside one
+    if record_sql not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, record_sql)
+
+
+def timed_serialization(method):
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        sample = current_sample.get()
+        # Nested serializers are part of the outermost one's time
+        if sample is None or sample.in_serializer:
+            return method(self, *args, **kwargs)
+        sample.in_serializer = True
+        started = time.perf_counter()
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            sample.serializer_time += time.perf_counter() - started
+            sample.in_serializer = False
+    return wrapper
+
+
+_installed = False
+
+
+def install():
+    """Hook SQL and serializer timing in, once per process"""
+    global _installed
+    with _lock:
+        if _installed:
+            return
+        connection_created.connect(_install_sql_recorder, dispatch_uid='chw_backend.metrics')
+        for connection in connections.all(initialized_only=True):
+            _install_sql_recorder(connection)
+        serializers.BaseSerializer.is_valid = timed_serialization(serializers.BaseSerializer.is_valid)
+        serializers.BaseSerializer.data = property(timed_serialization(serializers.BaseSerializer.data.fget))
+        _installed = True
+
+
+def observe(route, method, status_code, duration, sample, size):
+    with _lock:
+        metrics = _routes.get((route, method))
+        if metrics is None:
+            metrics = _routes[(route, method)] = RouteMetrics()
+        histograms = metrics.histograms
+        histograms['http_request_duration_seconds'].observe(duration)
+        histograms['http_request_sql_queries'].observe(sample.queries)
+        histograms['http_request_sql_duration_seconds'].observe(sample.sql_time)
+        histograms['http_request_serializer_duration_seconds'].observe(sample.serializer_time)
+        if size is not None:
+            histograms['http_response_size_bytes'].observe(size)
+        metrics.responses[status_code] = metrics.responses.get(status_code, 0) + 1
+
+
+def reset():
+    with _lock:
+        _routes.clear()
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def render():
+    """All the metrics in the Prometheus text exposition format"""
+    with _lock:
+        routes = sorted(_routes.items())
+        snapshot = [
+            (route, method, {name: (list(h.cumulative()), h.sum) for name, h in metrics.histograms.items()},
+             dict(metrics.responses))
+            for (route, method), metrics in routes
+        ]
+    lines = [
+        f'# HELP {PREFIX}http_responses_total Responses by route, method and status code',
+        f'# TYPE {PREFIX}http_responses_total counter',
+    ]
+    for route, method, _, responses in snapshot:
+        for status_code, count in sorted(responses.items()):
+            lines.append(
+                f'{PREFIX}http_responses_total{{route="{_label(route)}",method="{_label(method)}",'
+                f'status="{status_code}"}} {count}'
+            )
+    for name, (help_text, _) in HISTOGRAMS.items():
+        lines.append(f'# HELP {PREFIX}{name} {help_text}')
+        lines.append(f'# TYPE {PREFIX}{name} histogram')
+        for route, method, histograms, _ in snapshot:
+            buckets, total = histograms[name]
+            labels = f'route="{_label(route)}",method="{_label(method)}"'
+            for bound, count in buckets:
+                lines.append(f'{PREFIX}{name}_bucket{{{labels},le="{bound}"}} {count}')
+            lines.append(f'{PREFIX}{name}_sum{{{labels}}} {total}')
+            lines.append(f'{PREFIX}{name}_count{{{labels}}} {buckets[-1][1]}')
+    return '\n'.join(lines) + '\n'
+
+
+def log_slow_request(request, route, duration, sample):
+    top = {}
+    for elapsed, sql in sample.statements:
+        count, total = top.get(sql, (0, 0.0))
+        top[sql] = (count + 1, total + elapsed)
+    worst = sorted(top.items(), key=lambda item: item[1][1], reverse=True)[:settings.METRICS_SLOW_SQL_COUNT]
+    logger.warning(
+        "Slow request %s %s (%s): %.0f ms, %d queries in %.0f ms, serializers %.0f ms%s",
+        request.method, request.path, route, duration * 1000, sample.queries, sample.sql_time * 1000,
+        sample.serializer_time * 1000,
+        ''.join(f"\n  {total * 1000:.1f} ms x{count}: {sql}" for sql, (count, total) in worst),
+    )
+
+
+class MetricsMiddleware:
+    """Record per-route metrics; put it first in MIDDLEWARE so it times the others too"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        install()
+        self.get_response = get_response
+        self.slow = settings.METRICS_SLOW_REQUEST_MS / 1000
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        sample = Sample(self.slow > 0)
+        token = current_sample.set(sample)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            current_sample.reset(token)
+        self.finish(request, response, time.perf_counter() - started, sample)
+        return response
+
+    async def __acall__(self, request):
+        sample = Sample(self.slow > 0)
+        token = current_sample.set(sample)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_sample.reset(token)
+        self.finish(request, response, time.perf_counter() - started, sample)
+        return response
+
+    def finish(self, request, response, duration, sample):
+        match = request.resolver_match
+        if match is None or not match.url_name or match.url_name == 'metrics':
+            return
+        route = match.view_name
+        size = None
+        if not response.streaming:
+            size = int(response['Content-Length']) if response.has_header('Content-Length') else len(response.content)
+        observe(route, request.method, response.status_code, duration, sample, size)
+        if self.slow and duration >= self.slow:
+            log_slow_request(request, route, duration, sample)
+
+
+def metrics_view(request):
+    """Prometheus scrape endpoint"""
+    if not settings.METRICS_ENABLED:
+        raise Http404
+    token = settings.METRICS_TOKEN
+    if token and not constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return HttpResponseForbidden()
+    return HttpResponse(render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,137 @@
+"""
+Per-endpoint SQL query budgets.
+
+Views declare the most queries a single call may run with ``@query_budget(n)``.
+Depending on ``settings.QUERY_BUDGET_MODE`` a call that goes over budget is
+logged ('warn'), fails with QueryBudgetExceeded ('raise', used by the tests)
+or is not counted at all ('off').
+
+Savepoints are not counted: a view's atomic blocks only emit them when run
+inside another transaction, as in the tests, so counting them would make
+the same call cost more there than in production.
+
+Async views run their queries in worker threads, each with its own
+connection; those threads wrap their work in ``counted()`` so the queries
+are charged to the view that started them.
+"""
+import asyncio
+import functools
+import logging
+from contextlib import ExitStack
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+SAVEPOINT_STATEMENTS = ('SAVEPOINT ', 'RELEASE SAVEPOINT ', 'ROLLBACK TO SAVEPOINT ')
+
+
+class QueryCounter:
+    """Database execute wrapper that records the statements it sees, savepoints aside"""
+
+    def __init__(self):
+        self.statements = []
+
+    def __call__(self, execute, sql, params, many, context):
+        if not sql.startswith(SAVEPOINT_STATEMENTS):
+            self.statements.append(sql)
+        return execute(sql, params, many, context)
+
+    def __len__(self):
+        return len(self.statements)
+
+
+# Counter of the async view being run, visible to the threads it hands work to
+active_counter = ContextVar('active_counter', default=None)
+
+
+def counted(func, *args, **kwargs):
+    """Call func, charging its queries to the active async view's budget, if any"""
+    counter = active_counter.get()
+    if counter is None:
+        return func(*args, **kwargs)
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(counter))
+        return func(*args, **kwargs)
+
+
+def count_queries(func, *args, **kwargs):
+    """Call func, returning (result, QueryCounter) for every database alias"""
+    counter = QueryCounter()
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(counter))
+        result = func(*args, **kwargs)
+    return result, counter
+
+
+def _check(name, budget, counter):
+    if len(counter) <= budget:
+        return
+    message = f"{name} ran {len(counter)} SQL queries, its budget is {budget}"
+    if settings.QUERY_BUDGET_MODE == 'raise':
+        raise QueryBudgetExceeded(message + ":\n" + "\n".join(counter.statements))
+    logger.warning(message)
+
+
+def query_budget(max_queries):
+    """Declare the maximum number of SQL queries one call of a view may run.
+
+    Works on function views, async function views and on view classes (their
+    dispatch is wrapped).
+    """
+    def decorator(view):
+        if isinstance(view, type):
+            dispatch = view.dispatch
+
+            @functools.wraps(dispatch)
+            def budgeted_dispatch(self, request, *args, **kwargs):
+                if settings.QUERY_BUDGET_MODE == 'off':
+                    return dispatch(self, request, *args, **kwargs)
+                response, counter = count_queries(dispatch, self, request, *args, **kwargs)
+                _check(view.__name__, max_queries, counter)
+                return response
+
+            view.dispatch = budgeted_dispatch
+            view.query_budget = max_queries
+            return view
+
+        # DRF's @api_view names its generated class after the function
+        name = getattr(getattr(view, 'cls', None), '__name__', view.__name__)
+
+        if asyncio.iscoroutinefunction(view):
+            @functools.wraps(view)
+            async def budgeted_async_view(request, *args, **kwargs):
+                if settings.QUERY_BUDGET_MODE == 'off':
+                    return await view(request, *args, **kwargs)
+                counter = QueryCounter()
+                token = active_counter.set(counter)
+                try:
+                    response = await view(request, *args, **kwargs)
+                finally:
+                    active_counter.reset(token)
+                _check(name, max_queries, counter)
+                return response
+
+            budgeted_async_view.query_budget = max_queries
+            return budgeted_async_view
+
+        @functools.wraps(view)
+        def budgeted_view(request, *args, **kwargs):
+            if settings.QUERY_BUDGET_MODE == 'off':
+                return view(request, *args, **kwargs)
+            response, counter = count_queries(view, request, *args, **kwargs)
+            _check(name, max_queries, counter)
+            return response
+
+        budgeted_view.query_budget = max_queries
+        return budgeted_view
+    return decorator
@@ -0,0 +1,62 @@
+"""
+Response renderers and content negotiation.
+
+FastJSONRenderer renders what DRF's JSONRenderer does, with orjson when it is
+installed. MessagePackRenderer serves ``application/msgpack`` when msgpack is
+installed; clients ask for it with ``Accept``. Both are in the default
+renderer classes, and views narrow ``renderer_classes`` as usual.
+"""
+from rest_framework.negotiation import DefaultContentNegotiation
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils import encoders
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# Datetimes go through DRF's encoder, which trims them to milliseconds
+ORJSON_OPTIONS = (orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS) if orjson else 0
+
+
+class FastJSONRenderer(JSONRenderer):
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (
+            orjson is None or data is None or not self.compact or self.ensure_ascii or not self.strict
+            or self.get_indent(accepted_media_type, renderer_context or {}) is not None
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(data, default=self.encoder_class().default, option=ORJSON_OPTIONS)
+        except orjson.JSONEncodeError:
+            # e.g. integers past 64 bits
+            return super().render(data, accepted_media_type, renderer_context)
+        # Escaped like JSONRenderer does, to stay a JavaScript subset
+        return ret.replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
+
+
+class MessagePackRenderer(BaseRenderer):
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+    available = msgpack is not None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        # Values JSON has no type for are encoded as in JSON responses
+        return msgpack.packb(data, default=encoders.JSONEncoder().default)
+
+
+class ContentNegotiation(DefaultContentNegotiation):
+    """DefaultContentNegotiation, leaving out renderers whose library is not installed"""
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        renderers = [renderer for renderer in renderers if getattr(renderer, 'available', True)]
+        return super().select_renderer(request, renderers, format_suffix)
@@ -0,0 +1,187 @@
+"""
+Read replica routing.
+
+The aliases in ``settings.DATABASE_REPLICAS`` hold copies of 'default'. Reads
+go to one of them only inside ``replica_reads(user_id)``, which the read-only
+dashboard, analytics and export views run their queries in; every other read,
+and every write, uses 'default'. Within the block the router stays on the
+primary when:
+
+- the user wrote in the last REPLICA_PIN_SECONDS, so they read their own
+  writes: ReplicaPinMiddleware pins users after each successful unsafe
+  request (through the cache, so use a shared one with several workers);
+- no replica is reachable and at most REPLICA_MAX_LAG_SECONDS behind, as
+  measured by a background thread every REPLICA_CHECK_SECONDS.
+
+One replica is picked per block, at its first read.
+"""
+import logging
+import random
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+from django.utils.deprecation import MiddlewareMixin
+
+logger = logging.getLogger(__name__)
+
+PIN_KEY = 'replica_pin:{user_id}'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS', 'TRACE')
+
+# Seconds the server is behind its primary: 0 when it is not replaying WAL
+# (a primary, or a stand-in) or has replayed all it received
+LAG_SQL = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+"""
+
+
+class ReplicaMonitor:
+    """Replication lag of every replica, refreshed by a background thread"""
+
+    def __init__(self):
+        # Seconds behind the primary by alias, None when it could not be reached
+        self.lag = {}
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def measure(self, alias):
+        # A connection of its own, closed right away, so none is left open between checks
+        connection = connections.create_connection(alias)
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(LAG_SQL if connection.vendor == 'postgresql' else 'SELECT 0')
+                return float(cursor.fetchone()[0])
+        except DatabaseError as exc:
+            if self.lag.get(alias) is not None:
+                logger.warning("Replica %s is unreachable, reading from the primary: %s", alias, exc)
+            return None
+        finally:
+            connection.close()
+
+    def check(self):
+        for alias in settings.DATABASE_REPLICAS:
+            self.lag[alias] = self.measure(alias)
+
+    def healthy(self):
+        """Replicas that can serve reads now"""
+        self.start()
+        return [
+            alias for alias in settings.DATABASE_REPLICAS
+            if self.lag.get(alias) is not None and self.lag[alias] <= settings.REPLICA_MAX_LAG_SECONDS
+        ]
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                # The first check is made right away, so a new process can use the replicas
+                self.check()
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name='replica-monitor', daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        """Stop the checks, e.g. before dropping a replica's test database"""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._stop.set()
+            thread.join()
+
+    def _run(self):
+        while not self._stop.wait(settings.REPLICA_CHECK_SECONDS):
+            self.check()
+
+
+monitor = ReplicaMonitor()
+
+
+def pin(user_id):
+    """Send the user's reads to the primary for REPLICA_PIN_SECONDS"""
+    cache.set(PIN_KEY.format(user_id=user_id), True, settings.REPLICA_PIN_SECONDS)
+
+
+def is_pinned(user_id):
+    return user_id is not None and cache.get(PIN_KEY.format(user_id=user_id)) is not None
+
+
+class ReplicaReads:
+    """The database a replica_reads block reads from, picked at its first read"""
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.alias = None
+        # Async views read from several worker threads at once
+        self._lock = threading.Lock()
+
+    def database(self):
+        with self._lock:
+            if self.alias is None:
+                healthy = [] if is_pinned(self.user_id) else monitor.healthy()
+                self.alias = random.choice(healthy) if healthy else DEFAULT_DB_ALIAS
+            return self.alias
+
+
+# Set inside replica_reads; worker threads of async views see it too
+active_reads = ContextVar('active_reads', default=None)
+
+
+@contextmanager
+def replica_reads(user_id=None):
+    """Let the reads in the block go to a replica, unless user_id is pinned to the primary"""
+    if not settings.DATABASE_REPLICAS:
+        yield
+        return
+    token = active_reads.set(ReplicaReads(user_id))
+    try:
+        yield
+    finally:
+        active_reads.reset(token)
+
+
+def read_database():
+    """The alias reads go to here, for querysets evaluated after the block ends"""
+    reads = active_reads.get()
+    return reads.database() if reads is not None else DEFAULT_DB_ALIAS
+
+
+def reading_replica():
+    """Whether the current block has read from a replica"""
+    reads = active_reads.get()
+    return reads is not None and reads.alias not in (None, DEFAULT_DB_ALIAS)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        reads = active_reads.get()
+        return reads.database() if reads is not None else None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the primary's rows
+        databases = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+
+class ReplicaPinMiddleware(MiddlewareMixin):
+    """Pin users to the primary after a successful unsafe request, so they read their writes"""
+
+    def __init__(self, get_response):
+        if not settings.DATABASE_REPLICAS:
+            raise MiddlewareNotUsed
+        super().__init__(get_response)
+
+    def process_response(self, request, response):
+        # DRF sets request.user once the view has authenticated it
+        user = getattr(request, 'user', None)
+        if request.method not in SAFE_METHODS and response.status_code < 400 and user and user.is_authenticated:
+            pin(user.pk)
+        return response
@@ -12,7 +12,7 @@ https://docs.djangoproject.com/en/4.2/ref/settings/
 
 from pathlib import Path
 import os
-from decouple import config
+from decouple import Csv, config
 from datetime import timedelta
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -57,6 +57,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'chw_backend.metrics.MetricsMiddleware',  # first, so it times the others; off unless METRICS_ENABLED
+    'chw_backend.compression.CompressionMiddleware',  # above anything reading the response body
+    'chw_backend.replicas.ReplicaPinMiddleware',  # off unless DATABASE_REPLICAS
     'corsheaders.middleware.CorsMiddleware',  # must be high in the list
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -99,22 +102,130 @@ DATABASES = {
         'PASSWORD': config('MAIN_DB_USER_PASSWORD'),
         'USER': config('MAIN_DB_USER'),
         'HOST': config('MAIN_DB_HOST',  default='5432'),
+        # Seconds to keep a connection open between requests (0 closes it after
+        # each one); under ASGI this lets the async query workers reuse theirs
+        'CONN_MAX_AGE': config('MAIN_DB_CONN_MAX_AGE', default=0, cast=int),
     }
 }
 
+# Read replicas, as comma separated hosts (host:port for another port) reached
+# with the primary's user and REPLICA_DB_NAME. Dashboards, analytics and
+# exports read from them (see chw_backend.replicas); users who just wrote, and
+# everyone when no replica is reachable and at most REPLICA_MAX_LAG_SECONDS
+# behind, read from the primary. Replica reads are cached by the dashboards for
+# at most REPLICA_PIN_SECONDS, as they may miss the latest writes
+for number, replica_host in enumerate(config('REPLICA_DB_HOSTS', default='', cast=Csv()), 1):
+    replica_host, _, replica_port = replica_host.partition(':')
+    DATABASES[f'replica{number}'] = {
+        **DATABASES['default'],
+        'NAME': config('REPLICA_DB_NAME', default=DATABASES['default']['NAME']),
+        'HOST': replica_host,
+        'PORT': replica_port or DATABASES['default']['PORT'],
+        # Fail over to the primary quickly when a replica goes away
+        'OPTIONS': {'connect_timeout': config('REPLICA_DB_CONNECT_TIMEOUT', default=2, cast=int)},
+    }
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+DATABASE_ROUTERS = ['chw_backend.replicas.ReplicaRouter']
+# Keeps replica reads off in tests, but for those of the routing
+TEST_RUNNER = 'chw_backend.test_runner.TestRunner'
+REPLICA_PIN_SECONDS = config('REPLICA_PIN_SECONDS', default=10, cast=int)
+REPLICA_MAX_LAG_SECONDS = config('REPLICA_MAX_LAG_SECONDS', default=5, cast=float)
+REPLICA_CHECK_SECONDS = config('REPLICA_CHECK_SECONDS', default=5, cast=float)
+
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+# Use a shared backend (e.g. django.core.cache.backends.redis.RedisCache) when
+# running several workers so cache invalidation reaches all of them.
+
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default='chw-cache'),
+    }
+}
+
+# Seconds a per-user dashboard snapshot is kept; it is also dropped whenever a
+# request visible to the user is created or changes status
+DASHBOARD_CACHE_TIMEOUT = config('DASHBOARD_CACHE_TIMEOUT', default=300, cast=int)
+
+# Seconds a commodity catalog response is kept; saving or deleting a Commodity,
+# or a Commodity.objects update or bulk write, bumps the catalog version, which
+# invalidates all of them at once
+CATALOG_CACHE_TIMEOUT = config('CATALOG_CACHE_TIMEOUT', default=86400, cast=int)
+# Catalog responses each process also keeps in memory, least recently used dropped first
+CATALOG_LOCAL_ENTRIES = config('CATALOG_LOCAL_ENTRIES', default=256, cast=int)
+
 
 # REST Framework settings
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'apps.authentication.authentication.ClaimsJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
-    'PAGE_SIZE': 10
+    'PAGE_SIZE': 10,
+    # JSON through orjson and MessagePack on request, when those are installed
+    'DEFAULT_RENDERER_CLASSES': [
+        'chw_backend.renderers.FastJSONRenderer',
+        'chw_backend.renderers.MessagePackRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_CONTENT_NEGOTIATION_CLASS': 'chw_backend.renderers.ContentNegotiation',
 }
 
+# Responses of at least RESPONSE_COMPRESSION_MIN_BYTES, and streamed ones, are
+# brotli (when installed) or gzip compressed for clients accepting it; views
+# change that with @compression (see chw_backend.compression)
+RESPONSE_COMPRESSION = config('RESPONSE_COMPRESSION', default=True, cast=bool)
+RESPONSE_COMPRESSION_MIN_BYTES = config('RESPONSE_COMPRESSION_MIN_BYTES', default=1024, cast=int)
+RESPONSE_COMPRESSION_BROTLI_QUALITY = config('RESPONSE_COMPRESSION_BROTLI_QUALITY', default=5, cast=int)
+
+
+# Request logs older than this many days are moved, a whole month at a time,
+# into the compressed archive by the archive_request_logs command
+REQUEST_LOG_RETENTION_DAYS = config('REQUEST_LOG_RETENTION_DAYS', default=365, cast=int)
+
+# 'sync' writes request logs inside the view's transaction; 'buffered' queues
+# them at commit (spooled to AUDIT_LOG_SPOOL_DIR) and bulk inserts them from a
+# background thread every AUDIT_LOG_FLUSH_INTERVAL seconds or BUFFER_SIZE entries
+AUDIT_LOG_MODE = config('AUDIT_LOG_MODE', default='sync')
+AUDIT_LOG_BUFFER_SIZE = config('AUDIT_LOG_BUFFER_SIZE', default=500, cast=int)
+AUDIT_LOG_FLUSH_INTERVAL = config('AUDIT_LOG_FLUSH_INTERVAL', default=2.0, cast=float)
+AUDIT_LOG_SPOOL_DIR = config('AUDIT_LOG_SPOOL_DIR', default=os.path.join(BASE_DIR, 'audit_spool'))
+
+# The changes feed (/api/requests/sync/) holds back rows changed in the last
+# SYNC_SETTLE_SECONDS, so transactions still committing are not skipped; keep it
+# above AUDIT_LOG_FLUSH_INTERVAL with buffered logs. Tombstones are kept (and
+# tokens accepted) for SYNC_TOMBSTONE_RETENTION_DAYS, see purge_sync_tombstones
+SYNC_SETTLE_SECONDS = config('SYNC_SETTLE_SECONDS', default=5, cast=int)
+SYNC_TOMBSTONE_RETENTION_DAYS = config('SYNC_TOMBSTONE_RETENTION_DAYS', default=90, cast=int)
+
+# Push of request changes at /api/requests/events/ (see apps.requests.push):
+# 'local' reaches the streams of this process only, 'postgres' every worker's
+# through LISTEN/NOTIFY. A client PUSH_QUEUE_SIZE events behind is told to resync
+PUSH_BROKER = config('PUSH_BROKER', default='local')
+PUSH_QUEUE_SIZE = config('PUSH_QUEUE_SIZE', default=100, cast=int)
+PUSH_HEARTBEAT_SECONDS = config('PUSH_HEARTBEAT_SECONDS', default=25, cast=float)
+PUSH_STREAM_SECONDS = config('PUSH_STREAM_SECONDS', default=600, cast=float)
+PUSH_RETRY_MS = config('PUSH_RETRY_MS', default=5000, cast=int)
+
+# What happens when a view runs more SQL queries than its @query_budget:
+# 'warn' logs it, 'raise' fails the call (used by the tests), 'off' skips counting
+QUERY_BUDGET_MODE = config('QUERY_BUDGET_MODE', default='warn')
+
+# Async views run their queries on a shared pool of worker threads, each with
+# its own database connection; CONCURRENCY caps how many one request uses at a time
+ASYNC_QUERY_WORKERS = config('ASYNC_QUERY_WORKERS', default=8, cast=int)
+ASYNC_QUERY_CONCURRENCY = config('ASYNC_QUERY_CONCURRENCY', default=3, cast=int)
+
+# Per-route request metrics served at /metrics (see chw_backend.metrics). Requests
+# slower than METRICS_SLOW_REQUEST_MS (0: never) are logged with their top SQL
+METRICS_ENABLED = config('METRICS_ENABLED', default=False, cast=bool)
+METRICS_TOKEN = config('METRICS_TOKEN', default='')
+METRICS_SLOW_REQUEST_MS = config('METRICS_SLOW_REQUEST_MS', default=0, cast=int)
+METRICS_SLOW_SQL_COUNT = config('METRICS_SLOW_SQL_COUNT', default=5, cast=int)
 
 
 # Password validation
@@ -174,8 +285,23 @@ SIMPLE_JWT = {
     'REFRESH_TOKEN_LIFETIME': timedelta(days=1),
     'ROTATE_REFRESH_TOKENS': True,
     'BLACKLIST_AFTER_ROTATION': True,
+    'TOKEN_REFRESH_SERIALIZER': 'apps.authentication.serializer.ClaimsTokenRefreshSerializer',
 }
 
+# Per-process cache of the token version each user's tokens must carry (see
+# apps.authentication.tokens); a change made in another process is noticed
+# within TTL seconds
+AUTH_TOKEN_VERSION_CACHE_SIZE = config('AUTH_TOKEN_VERSION_CACHE_SIZE', default=10000, cast=int)
+AUTH_TOKEN_VERSION_CACHE_TTL = config('AUTH_TOKEN_VERSION_CACHE_TTL', default=30, cast=int)
+
+# Rotated refresh tokens are blacklisted in the shared cache at once and in the
+# token_blacklist tables in batches (see apps.authentication.blacklist); with a
+# process-local cache they are written, and looked up, in the tables right away
+TOKEN_BLACKLIST_FLUSH_INTERVAL = config('TOKEN_BLACKLIST_FLUSH_INTERVAL', default=2.0, cast=float)
+TOKEN_BLACKLIST_BATCH_SIZE = config('TOKEN_BLACKLIST_BATCH_SIZE', default=500, cast=int)
+TOKEN_BLACKLIST_BLOOM_REFRESH = config('TOKEN_BLACKLIST_BLOOM_REFRESH', default=300, cast=int)
+TOKEN_BLACKLIST_BLOOM_ERROR_RATE = config('TOKEN_BLACKLIST_BLOOM_ERROR_RATE', default=0.01, cast=float)
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
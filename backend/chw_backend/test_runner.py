@@ -0,0 +1,15 @@
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+
+
+class TestRunner(DiscoverRunner):
+    """DiscoverRunner with replica reads off.
+
+    The replicas' test databases are created empty, not kept in step with the
+    primary, so only the tests of the routing itself turn them on, with
+    override_settings(DATABASE_REPLICAS=settings.TEST_DATABASE_REPLICAS).
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        settings.TEST_DATABASE_REPLICAS, settings.DATABASE_REPLICAS = settings.DATABASE_REPLICAS, []
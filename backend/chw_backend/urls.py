@@ -17,8 +17,11 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path,include
 
+from chw_backend.metrics import metrics_view
+
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('metrics', metrics_view, name='metrics'),
     path('api/auth/', include('apps.authentication.urls')),
     path('api/commodities/', include('apps.commodities.urls')),
     path('api/requests/', include('apps.requests.urls')),